@@ -0,0 +1,149 @@
+"""Benchmark subtitle reading/writing on large transcripts.
+
+    python bench_subtitle_io.py                 # 200k cues
+    python bench_subtitle_io.py --cues 1000000
+
+Times writing and reading SRT, WebVTT and ASS with services.subtitle_io
+(plus an SRT with CRLF line endings, stray blank lines and missing cue
+numbers) against the per-cue pydantic approach TranscriptionService used
+before (string ``+=`` to write, split on blank lines to read), and the
+memory held by a CueList against a list of SubtitleSegment.
+"""
+import gc
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from models.subtitle_models import SubtitleSegment
+from services import subtitle_io
+from services.subtitle_io import CueList
+
+WORDS = ["สวัสดี", "ครับ", "วันนี้", "เรา", "จะ", "มา", "พูดถึง", "วิดีโอ", "subtitle", "hello", "world"]
+
+
+def make_cues(count: int) -> CueList:
+    rng = random.Random(0)
+    cues = CueList()
+    position = 0.0
+    for _ in range(count):
+        start = position + rng.uniform(0.0, 0.5)
+        end = start + rng.uniform(0.8, 4.0)
+        lines = [" ".join(rng.choices(WORDS, k=rng.randint(2, 8))) for _ in range(rng.randint(1, 2))]
+        cues.append(start, end, "\n".join(lines))
+        position = end
+    return cues
+
+
+def old_seconds_to_srt_time(seconds: float) -> str:
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millisecs = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
+
+
+def old_generate(segments) -> str:
+    srt_content = ""
+    for i, segment in enumerate(segments, 1):
+        srt_content += f"{i}\n"
+        srt_content += f"{old_seconds_to_srt_time(segment.start)} --> {old_seconds_to_srt_time(segment.end)}\n"
+        srt_content += f"{segment.text}\n\n"
+    return srt_content
+
+
+def old_srt_time_to_seconds(time_str: str) -> float:
+    time_part, ms_part = time_str.split(',')
+    h, m, s = map(int, time_part.split(':'))
+    return h * 3600 + m * 60 + s + int(ms_part) / 1000
+
+
+def old_parse(path: Path):
+    content = path.read_text(encoding="utf-8")
+    segments = []
+    for block in content.strip().split('\n\n'):
+        lines = block.strip().split('\n')
+        if len(lines) >= 3:
+            start_str, end_str = lines[1].split(' --> ')
+            segments.append(SubtitleSegment(
+                start=old_srt_time_to_seconds(start_str),
+                end=old_srt_time_to_seconds(end_str),
+                text='\n'.join(lines[2:])
+            ))
+    return segments
+
+
+def timed(label: str, count: int, func):
+    gc.collect()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<38} {elapsed:8.3f}s  {count / elapsed / 1000:9.1f}k cues/s")
+    return result
+
+
+def peak_memory(func) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark subtitle I/O")
+    parser.add_argument("--cues", type=int, default=200_000)
+    args = parser.parse_args()
+
+    count = args.cues
+    cues = make_cues(count)
+    print(f"{count} cues, {cues.end_time / 3600:.1f} hours")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+
+        print("subtitle_io")
+        for subtitle_format in subtitle_io.FORMATS:
+            path = work_dir / f"bench.{subtitle_format}"
+            timed(f"write {subtitle_format}", count, lambda: subtitle_io.write(path, cues))
+            parsed = timed(f"read {subtitle_format}", count, lambda: subtitle_io.read(path))
+            assert len(parsed) == count, (subtitle_format, len(parsed))
+
+        # CRLF, blank lines holding spaces, doubled blank lines, every
+        # tenth cue without its number
+        messy = work_dir / "messy.srt"
+        blocks = [block for block in subtitle_io.dumps(cues).split("\n\n") if block]
+        blocks = [block.split("\n", 1)[1] if index % 10 == 0 else block for index, block in enumerate(blocks)]
+        separators = ["\n \n", "\n\n\n", "\n\n"]
+        messy.write_bytes("".join(
+            block + separators[index % 3] for index, block in enumerate(blocks)
+        ).replace("\n", "\r\n").encode("utf-8"))
+        parsed = timed("read messy srt", count, lambda: subtitle_io.read(messy))
+        assert len(parsed) == count
+        timed("to pydantic segments", count, parsed.to_segments)
+
+        print("previous implementation")
+        segments = timed("build pydantic segments", count, cues.to_segments)
+        old_path = work_dir / "old.srt"
+        content = timed("generate srt (+=)", count, lambda: old_generate(segments))
+        old_path.write_text(content, encoding="utf-8")
+        timed("parse srt (split + pydantic)", count, lambda: old_parse(old_path))
+        try:
+            old_messy = old_parse(messy)
+            print(f"  messy srt gave {len(old_messy)} of {count} cues")
+        except ValueError as e:
+            print(f"  messy srt failed: {e}")
+
+        print("memory")
+        cue_bytes = peak_memory(lambda: subtitle_io.read(work_dir / "bench.srt"))
+        segment_bytes = peak_memory(lambda: old_parse(old_path))
+        print(f"  CueList             {cue_bytes / count:8.0f} bytes/cue (peak while reading)")
+        print(f"  SubtitleSegment     {segment_bytes / count:8.0f} bytes/cue (peak while reading)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Offline OpenAI-compatible stand-in for load tests and failure drills.
+
+Serves ``/v1/audio/transcriptions`` (verbose_json) and ``/v1/chat/completions``
+with deterministic output, configurable latency and a configurable error
+rate. Point the app at it with ``ASR_BACKEND=local`` and
+``TRANSLATION_BACKEND=local``, then run::
+
+    python local_ai_server.py
+
+Settings (environment variables):
+    LOCAL_AI_PORT               port to listen on (default 8001)
+    LOCAL_AI_LATENCY_MS         base latency per request (default 200)
+    LOCAL_AI_JITTER_MS          random extra latency, 0..N ms (default 0)
+    LOCAL_AI_ASR_SPEED          audio seconds transcribed per second of latency,
+                                0 disables (default 0)
+    LOCAL_AI_ERROR_RATE         probability of answering with an error (default 0)
+    LOCAL_AI_ERROR_STATUS       status code used for injected errors (default 500)
+    LOCAL_AI_SEGMENT_SECONDS    length of generated transcript segments (default 4)
+    LOCAL_AI_DROP_RATE          probability of leaving out each id of a JSON batch
+                                translation, to exercise partial repair (default 0)
+    LOCAL_AI_SEED               seed for jitter and error injection (default 0)
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import tempfile
+from pathlib import Path
+from fastapi import FastAPI, File, UploadFile, Form, Request
+from fastapi.responses import JSONResponse
+
+from services.audio_splitter import AudioSplitter
+
+LATENCY_MS = float(os.getenv("LOCAL_AI_LATENCY_MS", "200"))
+JITTER_MS = float(os.getenv("LOCAL_AI_JITTER_MS", "0"))
+ASR_SPEED = float(os.getenv("LOCAL_AI_ASR_SPEED", "0"))
+ERROR_RATE = float(os.getenv("LOCAL_AI_ERROR_RATE", "0"))
+ERROR_STATUS = int(os.getenv("LOCAL_AI_ERROR_STATUS", "500"))
+SEGMENT_SECONDS = float(os.getenv("LOCAL_AI_SEGMENT_SECONDS", "4"))
+DROP_RATE = float(os.getenv("LOCAL_AI_DROP_RATE", "0"))
+
+# Used only when ffmpeg cannot read the upload: 32 kbps, the extraction default
+FALLBACK_BYTES_PER_SECOND = 4000
+
+app = FastAPI(title="Local AI stand-in", version="1.0.0")
+rng = random.Random(int(os.getenv("LOCAL_AI_SEED", "0")))
+audio_splitter = AudioSplitter()
+stats = {"transcriptions": 0, "chat_completions": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+async def _simulate(extra_seconds: float = 0.0):
+    """Sleep for the configured latency; return an error response if one is injected"""
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        delay = LATENCY_MS / 1000 + rng.uniform(0, JITTER_MS) / 1000 + extra_seconds
+        await asyncio.sleep(delay)
+    finally:
+        stats["in_flight"] -= 1
+
+    if ERROR_RATE and rng.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=ERROR_STATUS,
+            content={"error": {"message": "Injected failure", "type": "server_error", "code": None}}
+        )
+    return None
+
+
+def _audio_duration(data: bytes, suffix: str) -> float:
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        tmp.write(data)
+        tmp.flush()
+        try:
+            return audio_splitter.get_duration(Path(tmp.name))
+        except Exception:
+            return len(data) / FALLBACK_BYTES_PER_SECOND
+
+
+def _translate_json(user_content: str) -> str:
+    """Answer an index-keyed batch, optionally dropping some ids"""
+    try:
+        segments = json.loads(user_content).get("segments", [])
+    except (ValueError, AttributeError):
+        return "{}"
+    translations = [
+        {"id": segment["id"], "text": f"[แปล] {segment['text']}"}
+        for segment in segments
+        if not (DROP_RATE and rng.random() < DROP_RATE)
+    ]
+    return json.dumps({"translations": translations}, ensure_ascii=False)
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(
+    file: UploadFile = File(...),
+    model: str = Form("whisper-1"),
+    language: str = Form(None),
+    response_format: str = Form("json")
+):
+    stats["transcriptions"] += 1
+    data = await file.read()
+    loop = asyncio.get_event_loop()
+    duration = await loop.run_in_executor(None, _audio_duration, data, Path(file.filename or "audio.mp3").suffix)
+
+    error = await _simulate(duration / ASR_SPEED if ASR_SPEED else 0.0)
+    if error:
+        return error
+
+    digest = hashlib.sha1(data).hexdigest()[:6]
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(start + SEGMENT_SECONDS, duration)
+        index = len(segments)
+        segments.append({
+            "id": index,
+            "seek": 0,
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "text": f" ข้อความทดสอบ {digest}-{index + 1}",
+            "tokens": [],
+            "temperature": 0.0,
+            "avg_logprob": -0.1,
+            "compression_ratio": 1.0,
+            "no_speech_prob": 0.0
+        })
+        start = end
+
+    text = "".join(segment["text"] for segment in segments).strip()
+    if response_format != "verbose_json":
+        return {"text": text}
+    return {
+        "task": "transcribe",
+        "language": "thai" if language in (None, "th") else language,
+        "duration": duration,
+        "text": text,
+        "segments": segments
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    stats["chat_completions"] += 1
+    body = await request.json()
+
+    error = await _simulate()
+    if error:
+        return error
+
+    user_content = next(
+        (message["content"] for message in reversed(body.get("messages", [])) if message.get("role") == "user"),
+        ""
+    )
+    if body.get("response_format", {}).get("type") == "json_object":
+        content = _translate_json(user_content)
+    else:
+        content = f"[แปล] {user_content}"
+
+    prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-local-{stats['chat_completions']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "local"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("LOCAL_AI_PORT", "8001")))
@@ -1,18 +1,27 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 import os
-import shutil
+import json
+import time
+import re
+import hashlib
 import uuid
+import aiofiles
 from pathlib import Path
 from dotenv import load_dotenv
 import asyncio
 from typing import List, Optional
 
-from services.video_processor import VideoProcessor
-from services.transcription_service import TranscriptionService
-from services.translation_service import TranslationService
-from models.subtitle_models import SubtitleResponse, TranslationRequest
+from services.pipeline import Pipeline
+from services.job_queue import create_job_queue
+from services.ai_backends import close_http_client
+from services.upload_service import UploadService, UploadOffsetMismatch, ALLOWED_VIDEO_EXTENSIONS
+from services import subtitle_io
+from services.transcript_editor import TranscriptVersionConflict
+from models.subtitle_models import (
+    SubtitleResponse, TranslationRequest, MultiTranslationRequest, UploadInitRequest, TranscriptEditRequest
+)
 
 load_dotenv()
 
@@ -27,56 +36,175 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-video_processor = VideoProcessor()
-transcription_service = TranscriptionService()
-translation_service = TranslationService()
-
 # Create upload directory
 UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Size of each read when streaming request bodies to disk
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# Initialize services
+pipeline = Pipeline(UPLOAD_DIR)
+video_processor = pipeline.video_processor
+translation_service = pipeline.translation_service
+translation_cache = pipeline.translation_cache
+content_store = pipeline.content_store
+upload_service = UploadService(UPLOAD_DIR, content_store, pipeline.media_prober)
+
+# Transcribe / translate / embed run in worker processes (see worker.py)
+job_queue = create_job_queue(UPLOAD_DIR)
+
+async def enqueue_job(job_type: str, payload: dict) -> dict:
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(None, job_queue.enqueue, job_type, payload)
+    return {
+        **payload,
+        "job_id": job["id"],
+        "job_type": job["type"],
+        "status": job["status"],
+        "message": "รับงานเข้าคิวแล้ว"
+    }
+
+@app.on_event("startup")
+async def index_legacy_uploads():
+    # One-time index of uploads from before the content store
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, content_store.import_legacy)
+
+@app.on_event("startup")
+async def start_upload_expiry():
+    # Abandoned chunked uploads and their in-memory state
+    interval = float(os.getenv("UPLOAD_CLEANUP_INTERVAL", "300"))
+
+    async def expire_periodically():
+        while True:
+            try:
+                await upload_service.expire_uploads()
+            except Exception as e:
+                print(f"Upload cleanup failed: {e}")
+            await asyncio.sleep(interval)
+
+    asyncio.create_task(expire_periodically())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
+
 @app.get("/")
 async def root():
     return {"message": "Video Subtitle Generator API"}
 
+async def finish_upload(file_id: str, filename: str, stored: dict) -> dict:
+    """Convert a stored upload to MP3 unless the same video already was"""
+    loop = asyncio.get_event_loop()
+    paths = stored["paths"]
+    if not paths.mp3.exists():
+        await video_processor.convert_to_mp3(paths.video, paths.stem)
+        await loop.run_in_executor(None, pipeline.index_upload, file_id)
+    
+    return {
+        "file_id": file_id,
+        "original_filename": filename,
+        "video_path": str(paths.video),
+        "mp3_path": str(paths.mp3),
+        "content_hash": stored["content_hash"],
+        "deduplicated": stored["deduplicated"],
+        "artifacts": await loop.run_in_executor(None, content_store.artifacts, file_id),
+        "message": "ไฟล์นี้เคยอัปโหลดแล้ว ใช้ข้อมูลเดิม" if stored["deduplicated"] else "อัปโหลดและแปลงเป็น MP3 สำเร็จ"
+    }
+
 @app.post("/upload-video")
 async def upload_video(file: UploadFile = File(...)):
     """อัปโหลดไฟล์วิดีโอและแปลงเป็น MP3"""
+    part_path = None
     try:
         # Validate file type
-        allowed_extensions = {'.mp4', '.mov', '.avi', '.mkv', '.wmv'}
         file_extension = Path(file.filename).suffix.lower()
         
-        if file_extension not in allowed_extensions:
+        if file_extension not in ALLOWED_VIDEO_EXTENSIONS:
             raise HTTPException(status_code=400, detail="ไฟล์ต้องเป็น MP4, MOV, AVI, MKV หรือ WMV เท่านั้น")
         
         # Generate unique filename
         file_id = str(uuid.uuid4())
-        video_path = UPLOAD_DIR / f"{file_id}{file_extension}"
+        part_path = UPLOAD_DIR / f"{file_id}{file_extension}.part"
         
-        # Save uploaded file
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Save uploaded file without blocking the event loop, hashing as it streams
+        hasher = hashlib.sha256()
+        async with aiofiles.open(part_path, "wb") as buffer:
+            while data := await file.read(UPLOAD_READ_SIZE):
+                await buffer.write(data)
+                hasher.update(data)
         
-        # Convert to MP3
-        mp3_path = await video_processor.convert_to_mp3(video_path, file_id)
+        # Corrupt or audio-less videos are rejected before any conversion
+        try:
+            probe = await upload_service.probe_upload(part_path, hasher.hexdigest())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        return {
-            "file_id": file_id,
-            "original_filename": file.filename,
-            "video_path": str(video_path),
-            "mp3_path": str(mp3_path),
-            "message": "อัปโหลดและแปลงเป็น MP3 สำเร็จ"
-        }
+        loop = asyncio.get_event_loop()
+        stored = await loop.run_in_executor(
+            None, content_store.add, file_id, part_path, hasher.hexdigest(), file_extension, file.filename, probe
+        )
+        return await finish_upload(file_id, file.filename, stored)
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"เกิดข้อผิดพลาด: {str(e)}")
+    finally:
+        # content_store.add moves the part file into the store; anything left is an upload that failed
+        if part_path is not None:
+            part_path.unlink(missing_ok=True)
+
+@app.post("/upload-video/init")
+async def init_chunked_upload(request: UploadInitRequest):
+    """เริ่มการอัปโหลดวิดีโอแบบแบ่งส่วน (resumable)"""
+    try:
+        return await upload_service.init_upload(request.filename, request.total_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/upload-video/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    """ดู offset ล่าสุดที่เซิร์ฟเวอร์ได้รับ เพื่ออัปโหลดต่อจากจุดเดิม"""
+    try:
+        return await upload_service.get_status(upload_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.put("/upload-video/{upload_id}/chunk")
+async def append_upload_chunk(upload_id: str, offset: int, request: Request):
+    """รับข้อมูล chunk (raw body) และเขียนต่อท้ายไฟล์ที่ offset"""
+    try:
+        return await upload_service.append_chunk(upload_id, offset, request.stream())
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected_offset})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/upload-video/{upload_id}/finalize")
+async def finalize_chunked_upload(upload_id: str):
+    """ปิดการอัปโหลดแบบแบ่งส่วนและแปลงเป็น MP3"""
+    try:
+        upload = await upload_service.finalize_upload(upload_id)
+    except UploadOffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.expected_offset})
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await finish_upload(upload_id, upload["filename"], upload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"เกิดข้อผิดพลาด: {str(e)}")
 
 @app.get("/download-mp3/{file_id}")
 async def download_mp3(file_id: str):
     """ดาวน์โหลดไฟล์ MP3"""
-    mp3_path = UPLOAD_DIR / f"{file_id}.mp3"
+    mp3_path = pipeline.paths(file_id).mp3
     
     if not mp3_path.exists():
         raise HTTPException(status_code=404, detail="ไม่พบไฟล์ MP3")
@@ -87,74 +215,318 @@ async def download_mp3(file_id: str):
         media_type="audio/mpeg"
     )
 
-@app.post("/transcribe/{file_id}")
-async def transcribe_audio(file_id: str):
-    """แกะเสียงจากไฟล์ MP3 เป็นข้อความพร้อม timestamp"""
-    try:
-        mp3_path = UPLOAD_DIR / f"{file_id}.mp3"
-        
-        if not mp3_path.exists():
-            raise HTTPException(status_code=404, detail="ไม่พบไฟล์ MP3")
-        
-        print(f"Starting transcription for file: {mp3_path}")  # Add logging
-        
-        # Transcribe audio
-        result = await transcription_service.transcribe_with_timestamps(mp3_path)
-        
-        print(f"Transcription completed, saving SRT file")  # Add logging
-        
-        # Save SRT file
-        srt_path = UPLOAD_DIR / f"{file_id}_original.srt"
-        await transcription_service.save_srt(result, srt_path)
-        
-        return {
-            "file_id": file_id,
-            "transcription": result,
-            "srt_path": str(srt_path),
-            "message": "แกะเสียงสำเร็จ"
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Transcription API error: {str(e)}")  # Add logging
-        raise HTTPException(status_code=500, detail=f"เกิดข้อผิดพลาด: {str(e)}")
+@app.post("/transcribe/{file_id}", status_code=202)
+async def transcribe_audio(file_id: str, force: bool = False):
+    """แกะเสียงจากไฟล์ MP3 เป็นข้อความพร้อม timestamp (ทำงานเบื้องหลัง คืน job_id ทันที)
+
+    A video that was transcribed before reuses that SRT unless force=true.
+    """
+    mp3_path = pipeline.paths(file_id).mp3
+    
+    if not mp3_path.exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์ MP3")
+    
+    return await enqueue_job("transcribe", {"file_id": file_id, "force": force})
+
+@app.get("/transcribe/{file_id}/stream")
+async def stream_transcription(file_id: str, request: Request, job_id: Optional[str] = None, from_index: int = 0):
+    """Server-Sent Events: segment ที่แกะเสียงเสร็จแล้ว ทยอยส่งระหว่างที่งานแกะเสียงยังทำอยู่
+
+    ``segments`` events carry finalized segments with absolute timestamps
+    (``start_index`` is the index of the first one), read from the SRT
+    the worker appends to as each audio chunk finishes. ``done`` follows
+    once the job succeeds and the full SRT is written; ``error`` if it
+    fails. When a failed attempt is retried, ``reset`` tells the client to
+    drop what it has, and segments start again from index 0.
+    job_id defaults to the file's latest transcribe job; from_index skips
+    segments a reconnecting client already has.
+    """
+    poll_interval = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.5"))
+    loop = asyncio.get_event_loop()
+    paths = pipeline.paths(file_id)
+    partial_path = paths.partial_transcript(file_id)
 
-@app.post("/translate")
+    async def find_job():
+        if job_id:
+            return await loop.run_in_executor(None, job_queue.get, job_id)
+        jobs = await loop.run_in_executor(None, job_queue.list_for_file, file_id)
+        return next((job for job in jobs if job["type"] == "transcribe"), None)
+
+    def segments_event(start_index: int, cues) -> str:
+        data = {"start_index": start_index, "segments": [segment.dict() for segment in cues.to_segments()]}
+        return f"event: segments\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        nonlocal from_index
+        sent = 0
+        offset = 0
+        attempt = None
+        last_event = time.monotonic()
+        while not await request.is_disconnected():
+            job = await find_job()
+            status = job["status"] if job else "succeeded"
+            # A retried job rewrites the partial file from scratch: start over
+            # and tell the client to drop the segments of the failed attempt
+            try:
+                partial_size = partial_path.stat().st_size
+            except FileNotFoundError:
+                partial_size = None
+            restarted = job is not None and attempt is not None and job["attempts"] != attempt
+            if restarted or (partial_size is not None and partial_size < offset):
+                if sent or from_index:
+                    yield f"event: reset\ndata: {json.dumps({'attempt': job['attempts'] if job else None})}\n\n"
+                sent = offset = from_index = 0
+            if job is not None:
+                attempt = job["attempts"]
+            if status == "failed":
+                yield f"event: error\ndata: {json.dumps({'message': job['error']}, ensure_ascii=False)}\n\n"
+                return
+            if status == "succeeded":
+                srt_path = paths.srt("original")
+                if not srt_path.exists():
+                    yield f"event: error\ndata: {json.dumps({'message': 'ไม่พบไฟล์ SRT ต้นฉบับ'}, ensure_ascii=False)}\n\n"
+                    return
+                # Whatever the partial file did not deliver, from the finished SRT
+                cues = await loop.run_in_executor(None, pipeline.transcription_service.read_cues, srt_path)
+                first = max(sent, from_index)
+                if first < len(cues):
+                    yield segments_event(first, cues[first:])
+                yield f"event: done\ndata: {json.dumps({'segments': len(cues), 'job_id': job['id'] if job else None})}\n\n"
+                return
+
+            if partial_path.exists():
+                try:
+                    cues, offset = await loop.run_in_executor(
+                        None, subtitle_io.read_appended_srt, partial_path, offset
+                    )
+                except FileNotFoundError:
+                    cues = None
+                if cues:
+                    first = max(sent, from_index)
+                    if first < sent + len(cues):
+                        yield segments_event(first, cues[first - sent:])
+                        last_event = time.monotonic()
+                    sent += len(cues)
+            # Keep proxies from closing an idle stream
+            if time.monotonic() - last_event > 15:
+                last_event = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(poll_interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/translate", status_code=202)
 async def translate_subtitles(request: TranslationRequest):
-    """แปลซับไตเติ้ลเป็นภาษาต่างๆ"""
+    """แปลซับไตเติ้ลเป็นภาษาต่างๆ (ทำงานเบื้องหลัง คืน job_id ทันที)"""
+    srt_path = pipeline.paths(request.file_id).srt("original")
+    
+    if not srt_path.exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT ต้นฉบับ")
+    
+    return await enqueue_job("translate", {
+        "file_id": request.file_id,
+        "target_language": request.target_language,
+        "style_prompt": request.style_prompt
+    })
+
+@app.post("/translate-multi", status_code=202)
+async def translate_subtitles_multi(request: MultiTranslationRequest):
+    """แปลซับไตเติ้ลเป็นหลายภาษาในครั้งเดียว (ทำงานเบื้องหลัง คืน job_id ทันที)"""
+    srt_path = pipeline.paths(request.file_id).srt("original")
+    
+    if not srt_path.exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT ต้นฉบับ")
+    
+    if not request.targets:
+        raise HTTPException(status_code=400, detail="ต้องระบุภาษาอย่างน้อยหนึ่งภาษา")
+    
+    # One entry per language; the last style prompt wins for duplicates
+    targets = {target.target_language: target.style_prompt for target in request.targets}
+    
+    return await enqueue_job("translate", {
+        "file_id": request.file_id,
+        "targets": [
+            {"target_language": target_language, "style_prompt": style_prompt}
+            for target_language, style_prompt in targets.items()
+        ]
+    })
+
+def transcript_version_info(version: dict) -> dict:
+    return {key: version[key] for key in ("version", "segments", "changed", "created_at")}
+
+@app.get("/transcript/{file_id}")
+async def get_transcript(file_id: str, version: Optional[int] = None):
+    """SRT ต้นฉบับเป็นรายการ segment พร้อมเลขเวอร์ชัน (ใช้เป็น base_version ตอนแก้ไข)"""
+    loop = asyncio.get_event_loop()
     try:
-        srt_path = UPLOAD_DIR / f"{request.file_id}_original.srt"
-        
-        if not srt_path.exists():
-            raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT ต้นฉบับ")
-        
-        # Translate subtitles
-        translated_srt = await translation_service.translate_srt(
-            srt_path, 
-            request.target_language,
-            request.style_prompt
-        )
-        
-        # Save translated SRT
-        output_path = UPLOAD_DIR / f"{request.file_id}_{request.target_language}.srt"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(translated_srt)
-        
-        return {
-            "file_id": request.file_id,
-            "target_language": request.target_language,
-            "translated_srt_path": str(output_path),
-            "message": f"แปลเป็น{request.target_language}สำเร็จ"
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"เกิดข้อผิดพลาด: {str(e)}")
+        latest = await loop.run_in_executor(None, pipeline.transcript_version, file_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    selected = latest
+    if version is not None and version != latest["version"]:
+        selected = await loop.run_in_executor(None, content_store.transcript_version, file_id, version)
+        if selected is None:
+            raise HTTPException(status_code=404, detail=f"ไม่พบ transcript เวอร์ชัน {version}")
+    
+    cues = await loop.run_in_executor(
+        None, pipeline.transcription_service.read_cues, pipeline.paths(file_id).transcript(selected["version"])
+    )
+    versions = await loop.run_in_executor(None, content_store.transcript_versions, file_id)
+    return {
+        "file_id": file_id,
+        "version": selected["version"],
+        "latest_version": latest["version"],
+        "segments": cues.to_segments(),
+        "versions": [transcript_version_info(row) for row in versions]
+    }
+
+@app.patch("/transcript/{file_id}")
+async def edit_transcript(file_id: str, request: TranscriptEditRequest):
+    """แก้ไข SRT ต้นฉบับทีละ segment แล้วแปลใหม่เฉพาะ segment ที่เปลี่ยน
+
+    Saves a new version of the transcript. Unless retranslate is false,
+    a translate job then updates every existing translation, sending
+    only the changed segments to the translation API.
+    """
+    loop = asyncio.get_event_loop()
+    edits = [edit.dict() for edit in request.edits]
+    try:
+        result = await loop.run_in_executor(None, pipeline.edit_transcript, file_id, edits, request.base_version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TranscriptVersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "latest_version": e.latest_version})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    translations = (await loop.run_in_executor(None, content_store.artifacts, file_id))["translations"]
+    result["translations"] = translations
+    if request.retranslate and translations and result["version"] != result["previous_version"]:
+        job = await enqueue_job("translate", {
+            "file_id": file_id,
+            "incremental": True,
+            "since_version": result["previous_version"]
+        })
+        result["job_id"] = job["job_id"]
+    return result
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """ดูสถานะและผลลัพธ์ของงาน"""
+    loop = asyncio.get_event_loop()
+    job = await loop.run_in_executor(None, job_queue.get, job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="ไม่พบงาน")
+    
+    return job
+
+@app.get("/progress/{file_id}")
+async def stream_progress(file_id: str, request: Request):
+    """Server-Sent Events: สถานะและ progress ของ ffmpeg ของทุกงานของไฟล์นี้
+
+    Each event carries a whole job (status, progress, result, error) and
+    is sent whenever the job changes.
+    """
+    poll_interval = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.5"))
+    loop = asyncio.get_event_loop()
+
+    async def events():
+        sent = {}
+        last_event = time.monotonic()
+        while not await request.is_disconnected():
+            jobs = await loop.run_in_executor(None, job_queue.list_for_file, file_id)
+            for job in reversed(jobs):
+                if sent.get(job["id"]) == job["updated_at"]:
+                    continue
+                sent[job["id"]] = job["updated_at"]
+                last_event = time.monotonic()
+                yield f"event: job\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            # Keep proxies from closing an idle stream
+            if time.monotonic() - last_event > 15:
+                last_event = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(poll_interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, type: Optional[str] = None, limit: int = 50):
+    """รายการงานล่าสุด และจำนวนงานแยกตามสถานะ"""
+    loop = asyncio.get_event_loop()
+    jobs = await loop.run_in_executor(None, job_queue.list, status, type, min(limit, 500))
+    counts = await loop.run_in_executor(None, job_queue.stats)
+    return {"jobs": jobs, "counts": counts}
+
+@app.get("/encode-stats")
+async def get_encode_stats():
+    """คิวและเวลารอของงาน ffmpeg แยกตาม lane (API และ worker แต่ละตัว)"""
+    loop = asyncio.get_event_loop()
+    workers = await loop.run_in_executor(None, job_queue.worker_stats)
+    return {
+        "api": video_processor.scheduler.stats(),
+        "workers": workers
+    }
+
+@app.get("/content-store/stats")
+async def get_content_store_stats():
+    """จำนวนไฟล์ที่อัปโหลด จำนวนวิดีโอที่เก็บจริง และพื้นที่ที่ประหยัดได้จากไฟล์ซ้ำ"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, content_store.stats)
+
+@app.get("/files")
+async def list_files(limit: int = 50, offset: int = 0):
+    """รายการไฟล์ที่อัปโหลดล่าสุด พร้อมไฟล์ที่สร้างแล้ว (MP3, SRT แต่ละภาษา, วิดีโอที่ฝัง subtitle)"""
+    limit, offset = min(limit, 500), max(offset, 0)
+    loop = asyncio.get_event_loop()
+    files = await loop.run_in_executor(None, content_store.list, limit, offset)
+    total = await loop.run_in_executor(None, content_store.count)
+    return {"files": files, "total": total, "limit": limit, "offset": offset}
+
+@app.get("/files/{file_id}")
+async def get_file(file_id: str):
+    """ข้อมูลของไฟล์ที่อัปโหลด และไฟล์ทั้งหมดที่สร้างจากไฟล์นี้"""
+    loop = asyncio.get_event_loop()
+    described = await loop.run_in_executor(None, content_store.get, file_id)
+    if described is None:
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์")
+    return described
+
+@app.get("/translation-cache/stats")
+async def get_translation_cache_stats():
+    """สถิติของ translation cache (hit/miss และจำนวนรายการ) รวมทุก worker"""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, translation_cache.stats)
+
+@app.get("/translation-stats")
+async def get_translation_stats():
+    """จำนวน request และ token ที่ใช้ในการแปลทั้งหมด (รวมทุก worker ตั้งแต่สร้าง translation cache)"""
+    loop = asyncio.get_event_loop()
+    usage = await loop.run_in_executor(None, translation_service.usage_totals)
+    cache = await loop.run_in_executor(None, translation_cache.stats)
+    return {
+        "usage": usage,
+        "batching": {
+            "input_budget": translation_service.batcher.input_budget,
+            "output_budget": translation_service.batcher.output_budget,
+            "max_segments": translation_service.batcher.max_segments
+        },
+        "cache": cache
+    }
 
 @app.get("/download-srt/{file_id}/{language}")
 async def download_srt(file_id: str, language: str = "original"):
     """ดาวน์โหลดไฟล์ SRT"""
-    srt_path = UPLOAD_DIR / f"{file_id}_{language}.srt"
+    srt_path = pipeline.paths(file_id).srt(language)
     
     if not srt_path.exists():
         raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT")
@@ -168,80 +540,142 @@ async def download_srt(file_id: str, language: str = "original"):
         }
     )
 
-@app.post("/embed-subtitles")
+@app.post("/embed-subtitles", status_code=202)
 async def embed_subtitles(request: dict):
-    """ฝัง subtitle เข้ากับวิดีโอ (hard subtitle)"""
-    try:
-        file_id = request.get("file_id")
-        language = request.get("language", "original")
-        subtitle_type = request.get("type", "hard")  # "hard" or "soft"
-        
-        if not file_id:
-            raise HTTPException(status_code=400, detail="file_id is required")
-        
-        # Find original video file
-        video_files = list(UPLOAD_DIR.glob(f"{file_id}.*"))
-        video_path = None
-        for file_path in video_files:
-            if file_path.suffix.lower() in ['.mp4', '.mov', '.avi', '.mkv', '.wmv']:
-                video_path = file_path
-                break
-        
-        if not video_path or not video_path.exists():
-            raise HTTPException(status_code=404, detail="ไม่พบไฟล์วิดีโอต้นฉบับ")
-        
-        # Check SRT file
-        srt_path = UPLOAD_DIR / f"{file_id}_{language}.srt"
-        if not srt_path.exists():
+    """ฝัง subtitle เข้ากับวิดีโอ (ทำงานเบื้องหลัง คืน job_id ทันที)
+
+    soft subtitle ใส่ language "all" เพื่อฝังทุกภาษาเป็นคนละ track ในไฟล์เดียว
+    และเลือก container "mp4" หรือ "mkv" ได้
+    """
+    file_id = request.get("file_id")
+    language = request.get("language", "original")
+    subtitle_type = request.get("type", "hard")  # "hard" or "soft"
+    container = request.get("container", "mp4")  # "mp4" or "mkv" (soft only)
+    default_language = request.get("default_language")
+    
+    if not file_id:
+        raise HTTPException(status_code=400, detail="file_id is required")
+    
+    if container not in ("mp4", "mkv") or (subtitle_type == "hard" and container != "mp4"):
+        raise HTTPException(status_code=400, detail="hard subtitle รองรับเฉพาะ mp4, soft subtitle รองรับ mp4 และ mkv")
+    
+    if language == "all" and subtitle_type != "soft":
+        raise HTTPException(status_code=400, detail="ฝังทุกภาษาได้เฉพาะ soft subtitle")
+    
+    if not pipeline.find_video(file_id):
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์วิดีโอต้นฉบับ")
+    
+    if language == "all":
+        loop = asyncio.get_event_loop()
+        if not await loop.run_in_executor(None, content_store.languages, file_id):
             raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT")
-        
-        # Create output path
-        suffix = "_hard" if subtitle_type == "hard" else "_soft"
-        output_filename = f"{file_id}_{language}{suffix}.mp4"
-        output_path = UPLOAD_DIR / output_filename
-        
-        # Embed subtitles
-        if subtitle_type == "soft":
-            await video_processor.embed_subtitles_soft(video_path, srt_path, output_path)
-        else:
-            await video_processor.embed_subtitles(video_path, srt_path, output_path)
-        
-        return {
-            "file_id": file_id,
-            "language": language,
-            "type": subtitle_type,
-            "output_path": str(output_path),
-            "output_filename": output_filename,
-            "message": f"ฝัง {subtitle_type} subtitle สำเร็จ"
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Embed subtitles error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"เกิดข้อผิดพลาด: {str(e)}")
+    elif not pipeline.paths(file_id).srt(language).exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT")
+    
+    payload = {"file_id": file_id, "language": language, "type": subtitle_type, "container": container}
+    if default_language:
+        payload["default_language"] = default_language
+    return await enqueue_job("embed", payload)
 
 @app.get("/download-video/{file_id}/{language}/{subtitle_type}")
-async def download_video_with_subtitles(file_id: str, language: str = "original", subtitle_type: str = "hard"):
+async def download_video_with_subtitles(file_id: str, language: str = "original", subtitle_type: str = "hard",
+                                        container: str = "mp4"):
     """ดาวน์โหลดวิดีโอที่ฝัง subtitle แล้ว"""
-    # Find the embedded video file
-    suffix = "_hard" if subtitle_type == "hard" else "_soft"
-    video_files = list(UPLOAD_DIR.glob(f"{file_id}_{language}{suffix}.*"))
+    if container not in ("mp4", "mkv"):
+        raise HTTPException(status_code=400, detail="container ต้องเป็น mp4 หรือ mkv")
+    video_path = pipeline.paths(file_id).embedded(language, subtitle_type, container)
     
-    if not video_files:
+    if not video_path.exists():
         raise HTTPException(status_code=404, detail="ไม่พบไฟล์วิดีโอที่ฝัง subtitle แล้ว")
     
-    video_path = video_files[0]
-    
+    filename = f"video_{subtitle_type}_subtitles_{language}.{container}"
     return FileResponse(
         path=video_path,
-        filename=f"video_{subtitle_type}_subtitles_{language}.mp4",
-        media_type="video/mp4",
+        filename=filename,
+        media_type="video/mp4" if container == "mp4" else "video/x-matroska",
         headers={
-            "Content-Disposition": f"attachment; filename=video_{subtitle_type}_subtitles_{language}.mp4"
+            "Content-Disposition": f"attachment; filename={filename}"
         }
     )
 
+# HLS: segmented WebVTT per language + the video as fMP4 segments (see HlsPackager)
+HLS_MEDIA_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".mp4": "video/mp4", ".m4s": "video/iso.segment"}
+HLS_VIDEO_FILE_RE = re.compile(r"^(index\.m3u8|init\.mp4|\d+\.m4s)$")
+HLS_IMMUTABLE = "public, max-age=31536000, immutable"
+
+def hls_response(request: Request, content: str, media_type: str, etag: str, cache_control: str) -> Response:
+    """Playlist/segment response with an ETag; 304 when the client already has it"""
+    headers = {"ETag": f'"{etag}"', "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+@app.post("/hls/{file_id}", status_code=202)
+async def package_hls(file_id: str):
+    """สร้าง HLS ของวิดีโอ (ทำครั้งเดียวต่อวิดีโอ ภาษาที่เพิ่มทีหลังไม่ต้องสร้างใหม่)"""
+    if not pipeline.find_video(file_id):
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์วิดีโอต้นฉบับ")
+    return await enqueue_job("package", {"file_id": file_id})
+
+@app.get("/hls/{file_id}/master.m3u8")
+async def hls_master_playlist(file_id: str, request: Request, default: str = "original"):
+    """HLS master playlist: วิดีโอ + subtitle ทุกภาษาที่มี"""
+    loop = asyncio.get_event_loop()
+    described = await loop.run_in_executor(None, content_store.get, file_id)
+    if described is None:
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์")
+    if not (pipeline.paths(file_id).hls / "index.m3u8").exists():
+        raise HTTPException(status_code=404, detail="ยังไม่ได้สร้าง HLS ของวิดีโอนี้ (POST /hls/{file_id})")
+    
+    duration = described["duration"] or 0
+    media = described["media"] or {}
+    bandwidth = media.get("bit_rate") or (
+        int(described["size"] * 8 / duration) if described["size"] and duration else 1_000_000
+    )
+    codecs = await loop.run_in_executor(
+        None, pipeline.hls_packager.codecs, media, pipeline.paths(file_id).hls / "init.mp4"
+    )
+    playlist = pipeline.hls_packager.master_playlist(described["languages"], default, "video/index.m3u8",
+                                                     bandwidth, codecs)
+    # Languages can be added at any time, so clients revalidate
+    return hls_response(request, playlist, HLS_MEDIA_TYPES[".m3u8"],
+                        hashlib.sha256(playlist.encode()).hexdigest()[:16], "no-cache")
+
+@app.get("/hls/{file_id}/video/{name}")
+async def hls_video_file(file_id: str, name: str):
+    """playlist และ segment ของวิดีโอ"""
+    if not HLS_VIDEO_FILE_RE.match(name):
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์")
+    path = pipeline.paths(file_id).hls / name
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์")
+    return FileResponse(path=path, media_type=HLS_MEDIA_TYPES[path.suffix], headers={"Cache-Control": HLS_IMMUTABLE})
+
+@app.get("/hls/{file_id}/{language}/index.m3u8")
+async def hls_subtitle_playlist(file_id: str, language: str, request: Request):
+    """HLS media playlist ของ subtitle หนึ่งภาษา"""
+    srt_path = pipeline.paths(file_id).srt(language)
+    if not srt_path.exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT")
+    loop = asyncio.get_event_loop()
+    described = await loop.run_in_executor(None, content_store.get, file_id)
+    playlist, version = await loop.run_in_executor(
+        None, pipeline.hls_packager.media_playlist, srt_path, described["duration"] if described else None
+    )
+    return hls_response(request, playlist, HLS_MEDIA_TYPES[".m3u8"], version, "no-cache")
+
+@app.get("/hls/{file_id}/{language}/{index}.vtt")
+async def hls_subtitle_segment(file_id: str, language: str, index: int, request: Request, v: Optional[str] = None):
+    """WebVTT segment ที่ index (เฉพาะ cue ในช่วงเวลานั้น)"""
+    srt_path = pipeline.paths(file_id).srt(language)
+    if index < 0 or not srt_path.exists():
+        raise HTTPException(status_code=404, detail="ไม่พบไฟล์ SRT")
+    loop = asyncio.get_event_loop()
+    segment, version = await loop.run_in_executor(None, pipeline.hls_packager.segment, srt_path, index)
+    # URLs from the current playlist carry the version, so their content never changes
+    cache_control = HLS_IMMUTABLE if v == version else "no-cache"
+    return hls_response(request, segment, "text/vtt; charset=utf-8", f"{version}-{index}", cache_control)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
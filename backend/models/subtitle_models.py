@@ -15,11 +15,37 @@ class TranslationRequest(BaseModel):
     target_language: str
     style_prompt: Optional[str] = None
 
+class TranslationTarget(BaseModel):
+    target_language: str
+    style_prompt: Optional[str] = None
+
+class MultiTranslationRequest(BaseModel):
+    file_id: str
+    targets: List[TranslationTarget]
+
 class TranscriptionResult(BaseModel):
     text: str
     segments: List[SubtitleSegment]
     language: str
+    # Audio left out by the VAD pre-pass (seconds and bytes), when it ran
+    speech_trim: Optional[dict] = None
 
 class EmbedSubtitlesRequest(BaseModel):
     file_id: str
-    language: str = "original"
\ No newline at end of file
+    language: str = "original"
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    total_size: Optional[int] = None
+
+class SegmentEdit(BaseModel):
+    op: str = "update"
+    index: int
+    text: Optional[str] = None
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+class TranscriptEditRequest(BaseModel):
+    edits: List[SegmentEdit]
+    base_version: Optional[int] = None
+    retranslate: bool = True
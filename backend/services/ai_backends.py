@@ -0,0 +1,193 @@
+import os
+import httpx
+import aiofiles
+from pathlib import Path
+from typing import Optional
+from openai import AsyncOpenAI
+from models.subtitle_models import SubtitleSegment, TranscriptionResult
+
+# Default endpoint of the offline stand-in (see local_ai_server.py)
+LOCAL_BASE_URL = "http://localhost:8001/v1"
+
+# One connection pool per process, shared by every backend
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+class ChatResult:
+    """Text of a chat completion plus the usage the server reported"""
+
+    def __init__(self, content: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                 finish_reason: Optional[str] = None):
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+
+    @property
+    def truncated(self) -> bool:
+        return self.finish_reason == "length"
+
+
+class TranscriptionBackend:
+    """Speech-to-text backend used by TranscriptionService"""
+
+    name = "base"
+
+    async def transcribe(self, audio_path: Path) -> TranscriptionResult:
+        raise NotImplementedError
+
+
+class ChatBackend:
+    """Chat-completion backend used by TranslationService"""
+
+    name = "base"
+    model: str
+    fallback_model: str
+
+    async def complete(self, system_prompt: str, user_content: str, max_tokens: int,
+                       model: Optional[str] = None, temperature: float = 0.3,
+                       json_mode: bool = False) -> ChatResult:
+        raise NotImplementedError
+
+
+class OpenAITranscriptionBackend(TranscriptionBackend):
+    """Any OpenAI-compatible /audio/transcriptions endpoint returning verbose_json"""
+
+    name = "openai"
+
+    def __init__(self, client: AsyncOpenAI, model: str = "whisper-1", language: Optional[str] = "th"):
+        self.client = client
+        self.model = model
+        self.language = language
+
+    async def transcribe(self, audio_path: Path) -> TranscriptionResult:
+        async with aiofiles.open(audio_path, "rb") as audio_file:
+            audio_bytes = await audio_file.read()
+
+        transcript = await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=(audio_path.name, audio_bytes),
+            response_format="verbose_json",
+            timestamp_granularities=["segment"],
+            language=self.language
+        )
+
+        segments = [
+            SubtitleSegment(start=segment.start, end=segment.end, text=segment.text.strip())
+            for segment in transcript.segments or []
+        ]
+        return TranscriptionResult(text=transcript.text, segments=segments, language=transcript.language)
+
+
+class OpenAIChatBackend(ChatBackend):
+    """Any OpenAI-compatible /chat/completions endpoint"""
+
+    name = "openai"
+
+    def __init__(self, client: AsyncOpenAI, model: str = "gpt-4.1-mini", fallback_model: str = "gpt-4o-mini"):
+        self.client = client
+        self.model = model
+        self.fallback_model = fallback_model
+
+    async def complete(self, system_prompt: str, user_content: str, max_tokens: int,
+                       model: Optional[str] = None, temperature: float = 0.3,
+                       json_mode: bool = False) -> ChatResult:
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = await self.client.chat.completions.create(
+            model=model or self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **extra
+        )
+        choice = response.choices[0]
+        usage = response.usage
+        return ChatResult(
+            content=choice.message.content or "",
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            finish_reason=choice.finish_reason
+        )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide keep-alive pool, creating it on first use.
+
+    Limits and timeouts come from OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS, OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_TIMEOUT and OPENAI_CONNECT_TIMEOUT.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "200")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "50")),
+                keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+            ),
+            timeout=httpx.Timeout(
+                float(os.getenv("OPENAI_TIMEOUT", "600")),
+                connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+            ),
+            follow_redirects=True
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """ปิด connection pool ที่ใช้ร่วมกัน (เรียกตอนปิด server)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _create_client(prefix: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+    """Build an async client for the backend selected by {prefix}_BACKEND.
+
+    ``openai`` talks to the OpenAI API (or {prefix}_BASE_URL when set, e.g. a
+    self-hosted OpenAI-compatible server); ``local`` talks to the offline
+    stand-in and does not need an API key. Every client rides on the shared
+    connection pool unless one is passed in.
+    """
+    backend = os.getenv(f"{prefix}_BACKEND", "openai").lower()
+    base_url = os.getenv(f"{prefix}_BASE_URL")
+    http_client = http_client or get_http_client()
+    max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+    if backend == "local":
+        return AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY") or "local",
+            base_url=base_url or LOCAL_BASE_URL,
+            http_client=http_client,
+            max_retries=max_retries
+        )
+
+    if backend != "openai":
+        raise ValueError(f"Unknown {prefix}_BACKEND: {backend}")
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY environment variable is required")
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+
+
+def create_transcription_backend(http_client: Optional[httpx.AsyncClient] = None) -> TranscriptionBackend:
+    """สร้าง ASR backend ตามค่า ASR_BACKEND / ASR_BASE_URL / ASR_MODEL"""
+    return OpenAITranscriptionBackend(
+        _create_client("ASR", http_client),
+        model=os.getenv("ASR_MODEL", "whisper-1"),
+        language=os.getenv("ASR_LANGUAGE", "th") or None
+    )
+
+
+def create_chat_backend(http_client: Optional[httpx.AsyncClient] = None) -> ChatBackend:
+    """สร้าง backend สำหรับการแปลตามค่า TRANSLATION_BACKEND / TRANSLATION_BASE_URL / TRANSLATION_MODEL"""
+    return OpenAIChatBackend(
+        _create_client("TRANSLATION", http_client),
+        model=os.getenv("TRANSLATION_MODEL", "gpt-4.1-mini"),
+        fallback_model=os.getenv("TRANSLATION_FALLBACK_MODEL", "gpt-4o-mini")
+    )
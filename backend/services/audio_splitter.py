@@ -0,0 +1,142 @@
+import os
+import re
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_SILENCE_START_RE = re.compile(r"silence_start:\s*(-?\d+(?:\.\d+)?)")
+_SILENCE_END_RE = re.compile(r"silence_end:\s*(-?\d+(?:\.\d+)?)")
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    path: Path
+    offset: float      # where the chunk starts in the original audio (seconds)
+    start: float       # nominal range covered by this chunk, without overlap
+    end: float
+
+
+class AudioSplitter:
+    """Split long audio into bounded chunks, cutting at silences where possible"""
+
+    def __init__(self):
+        self.max_chunk_seconds = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "600"))
+        self.min_chunk_seconds = float(os.getenv("TRANSCRIBE_MIN_CHUNK_SECONDS", "60"))
+        self.overlap_seconds = float(os.getenv("TRANSCRIBE_CHUNK_OVERLAP", "1.0"))
+        self.silence_noise = os.getenv("TRANSCRIBE_SILENCE_NOISE", "-35dB")
+        self.silence_duration = float(os.getenv("TRANSCRIBE_SILENCE_DURATION", "0.5"))
+
+    def get_duration(self, audio_path: Path) -> float:
+        """Read the container duration from ffmpeg's header output without decoding"""
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-nostdin', '-i', str(audio_path)],
+                capture_output=True,
+                text=True
+            )
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+        return self._parse_duration(result.stderr)
+
+    def _parse_duration(self, ffmpeg_output: str) -> float:
+        duration_match = _DURATION_RE.search(ffmpeg_output)
+        if not duration_match:
+            raise Exception("ไม่สามารถอ่านความยาวไฟล์เสียงได้")
+        h, m, s = duration_match.groups()
+        return int(h) * 3600 + int(m) * 60 + float(s)
+
+    def detect_silences(self, audio_path: Path) -> Tuple[float, List[Tuple[float, float]]]:
+        """Return (duration, [(silence_start, silence_end), ...]) using ffmpeg silencedetect"""
+        cmd = [
+            'ffmpeg',
+            '-nostdin',
+            '-i', str(audio_path),
+            '-af', f"silencedetect=noise={self.silence_noise}:d={self.silence_duration}",
+            '-f', 'null',
+            '-'
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"ffmpeg silencedetect ล้มเหลว: {e.stderr.strip()}")
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+
+        duration = self._parse_duration(result.stderr)
+
+        silences = []
+        silence_start = None
+        for line in result.stderr.splitlines():
+            start_match = _SILENCE_START_RE.search(line)
+            if start_match:
+                silence_start = max(0.0, float(start_match.group(1)))
+                continue
+            end_match = _SILENCE_END_RE.search(line)
+            if end_match and silence_start is not None:
+                silences.append((silence_start, float(end_match.group(1))))
+                silence_start = None
+        if silence_start is not None:
+            silences.append((silence_start, duration))
+
+        return duration, silences
+
+    def plan_cuts(self, duration: float, silences: List[Tuple[float, float]],
+                  max_chunk_seconds: float) -> List[Tuple[float, float, bool]]:
+        """Choose chunk ranges as (start, end, cut_at_silence).
+
+        Each chunk ends at the midpoint of the latest silence that keeps it
+        under max_chunk_seconds, or at a hard cut when there is none.
+        """
+        min_chunk = min(self.min_chunk_seconds, max_chunk_seconds / 2)
+        midpoints = [(start + end) / 2 for start, end in silences]
+
+        ranges = []
+        start = 0.0
+        while duration - start > max_chunk_seconds:
+            limit = start + max_chunk_seconds
+            candidates = [mid for mid in midpoints if start + min_chunk <= mid <= limit]
+            if candidates:
+                ranges.append((start, candidates[-1], True))
+                start = candidates[-1]
+            else:
+                ranges.append((start, limit, False))
+                start = limit
+        ranges.append((start, duration, True))
+        return ranges
+
+    def split(self, audio_path: Path, output_dir: Path, max_chunk_seconds: float = None) -> List[AudioChunk]:
+        """ตัดไฟล์เสียงเป็นช่วงๆ ตามช่วงเงียบ"""
+        max_chunk_seconds = max_chunk_seconds or self.max_chunk_seconds
+        duration, silences = self.detect_silences(audio_path)
+        ranges = self.plan_cuts(duration, silences, max_chunk_seconds)
+
+        chunks = []
+        previous_hard_cut = False
+        for index, (start, end, at_silence) in enumerate(ranges):
+            # Hard cuts may split a word, so the next chunk re-hears a little of
+            # the previous one; the duplicated segments are dropped on merge.
+            offset = max(0.0, start - self.overlap_seconds) if previous_hard_cut else start
+            chunk_path = output_dir / f"chunk_{index:04d}{audio_path.suffix}"
+            cmd = [
+                'ffmpeg',
+                '-nostdin',
+                '-ss', f"{offset:.3f}",
+                '-t', f"{end - offset:.3f}",
+                '-i', str(audio_path),
+                '-c', 'copy',
+                '-loglevel', 'error',
+                '-y',
+                str(chunk_path)
+            ]
+            try:
+                subprocess.run(cmd, capture_output=True, text=True, check=True)
+            except subprocess.CalledProcessError as e:
+                raise Exception(f"ไม่สามารถตัดไฟล์เสียงได้: {e.stderr.strip()}")
+
+            chunks.append(AudioChunk(index=index, path=chunk_path, offset=offset, start=start, end=end))
+            previous_hard_cut = not at_silence
+
+        return chunks
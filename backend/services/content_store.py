@@ -0,0 +1,523 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from services.upload_service import ALLOWED_VIDEO_EXTENSIONS
+
+# Names in the layout used before the store: {file_id}{ext}, {file_id}.mp3,
+# {file_id}_{language}.srt and {file_id}_{language}_{hard|soft}.mp4
+_LEGACY_NAME_RE = re.compile(
+    r"^(?P<file_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
+    r"(?:_(?P<language>[A-Za-z0-9-]+?)(?:_(?P<variant>hard|soft))?)?(?P<ext>\.[A-Za-z0-9]+)$"
+)
+
+
+class ArtifactPaths:
+    """Where a video and everything derived from it live on disk.
+
+    Names share one stem: ``{stem}{ext}`` (the video), ``{stem}.mp3``,
+    ``{stem}_{language}.srt``, ``{stem}_original.v{n}.srt`` (transcript
+    versions) and ``{stem}_{language}_{type}.mp4`` (or ``.mkv``).
+    """
+
+    def __init__(self, directory: Path, stem: str, extension: Optional[str]):
+        self.directory = directory
+        self.stem = stem
+        self.extension = extension
+
+    @property
+    def video(self) -> Optional[Path]:
+        return self.directory / f"{self.stem}{self.extension}" if self.extension else None
+
+    @property
+    def mp3(self) -> Path:
+        return self.directory / f"{self.stem}.mp3"
+
+    def srt(self, language: str = "original") -> Path:
+        return self.directory / f"{self.stem}_{language}.srt"
+
+    def embedded(self, language: str, subtitle_type: str, container: str = "mp4") -> Path:
+        """language "all" is the soft-subtitle file with every language as a track"""
+        suffix = "_hard" if subtitle_type == "hard" else "_soft"
+        return self.directory / f"{self.stem}_{language}{suffix}.{container}"
+
+    def partial_transcript(self, file_id: str) -> Path:
+        """Original SRT of a transcription still in progress, appended chunk by chunk.
+
+        Uploads of the same video share the stem, so the file is also keyed
+        by file_id: each transcription streams to its own file.
+        """
+        return self.directory / f"{self.stem}_original.{file_id}.partial.srt"
+
+    def transcript(self, version: int) -> Path:
+        """Snapshot of version ``version`` of the original SRT"""
+        return self.directory / f"{self.stem}_original.v{version}.srt"
+
+    @property
+    def hls(self) -> Path:
+        """Directory of the video's HLS rendition (index.m3u8, init.mp4, segments)"""
+        return self.directory / f"{self.stem}_hls"
+
+
+class ContentStore:
+    """Content-addressed storage for uploaded videos, with a metadata index.
+
+    Videos are stored once per sha256 under ``UPLOAD_DIR/content/<2 hex>/``
+    and every file_id maps to a hash, so the MP3, SRTs and embedded videos
+    derived from it are shared by every upload of the same bytes.
+
+    ``UPLOAD_DIR/content.sqlite3`` has one row per file_id (name,
+    extension, hash, times) and one row per artifact (kind, language,
+    path, size, duration), written by each pipeline stage as it finishes,
+    so looking a file up never lists UPLOAD_DIR. The media probe of each
+    video (streams, codecs, duration, keyframes; see ``MediaProber``) is
+    stored next to it, once per content. Uploads from before the
+    store keep their old ``UPLOAD_DIR/{file_id}...`` layout and are
+    indexed once by ``import_legacy``.
+    """
+
+    def __init__(self, upload_dir: Path):
+        self.upload_dir = upload_dir
+        self.content_dir = upload_dir / "content"
+        self.content_dir.mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(upload_dir / "content.sqlite3"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                extension TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        # hash is the file_id itself for legacy rows
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file_id TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                filename TEXT,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        # Columns added after the first version of the table
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for column, definition in (
+            ("extension", "TEXT"),
+            ("legacy", "INTEGER NOT NULL DEFAULT 0"),
+            ("updated_at", "REAL"),
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {definition}")
+                if column == "extension":
+                    self._conn.execute(
+                        "UPDATE files SET extension = (SELECT extension FROM blobs WHERE blobs.hash = files.hash)"
+                    )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_hash ON files(hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_created ON files(created_at)")
+        # Artifacts belong to the content (its hash), so duplicate uploads share them
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS artifacts (
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                language TEXT NOT NULL DEFAULT '',
+                variant TEXT NOT NULL DEFAULT '',
+                path TEXT NOT NULL,
+                size INTEGER,
+                duration REAL,
+                input_key TEXT,
+                style_prompt TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (owner, kind, language, variant)
+            )
+            """
+        )
+        artifact_columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(artifacts)")}
+        for column in ("input_key", "style_prompt"):
+            if column not in artifact_columns:
+                self._conn.execute(f"ALTER TABLE artifacts ADD COLUMN {column} TEXT")
+        # One row per saved version of the original SRT; srt_hash is the sha256 of the file
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transcript_versions (
+                owner TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                srt_hash TEXT NOT NULL,
+                segments INTEGER NOT NULL,
+                changed INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (owner, version)
+            )
+            """
+        )
+        # MediaProber result of each video, as JSON
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS probes (
+                owner TEXT PRIMARY KEY,
+                probe TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _blob_paths(self, content_hash: str, extension: str) -> ArtifactPaths:
+        directory = self.content_dir / content_hash[:2]
+        return ArtifactPaths(directory, content_hash, extension)
+
+    def _row_paths(self, row: sqlite3.Row) -> ArtifactPaths:
+        if row["legacy"]:
+            return ArtifactPaths(self.upload_dir, row["file_id"], row["extension"])
+        return self._blob_paths(row["hash"], row["extension"])
+
+    def _put_artifact(self, owner: str, kind: str, path: Path, language: str = "", variant: str = "",
+                      duration: Optional[float] = None, now: Optional[float] = None,
+                      input_key: Optional[str] = None, style_prompt: Optional[str] = None):
+        now = now or time.time()
+        size = path.stat().st_size if path.exists() else None
+        self._conn.execute(
+            "INSERT INTO artifacts "
+            "(owner, kind, language, variant, path, size, duration, input_key, style_prompt, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (owner, kind, language, variant) DO UPDATE SET "
+            "path = excluded.path, size = excluded.size, "
+            "duration = COALESCE(excluded.duration, artifacts.duration), "
+            "input_key = excluded.input_key, style_prompt = excluded.style_prompt, "
+            "updated_at = excluded.updated_at",
+            (owner, kind, language, variant, str(path), size, duration, input_key, style_prompt, now, now)
+        )
+
+    def add(self, file_id: str, source_path: Path, content_hash: str, extension: str,
+            filename: Optional[str] = None, probe: Optional[dict] = None) -> dict:
+        """Register a finished upload under its hash.
+
+        The first upload of some content is moved into the store; later
+        ones are deleted and point at the existing blob. Returns the
+        paths plus whether the content was already there. probe is the
+        MediaProber result of the video, kept unless one is stored already.
+        """
+        size = source_path.stat().st_size
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT extension FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+            deduplicated = row is not None
+            if deduplicated:
+                # Same bytes already stored, keep that copy (and its extension)
+                paths = self._blob_paths(content_hash, row["extension"])
+                source_path.unlink(missing_ok=True)
+            else:
+                paths = self._blob_paths(content_hash, extension)
+                paths.directory.mkdir(exist_ok=True)
+                os.replace(source_path, paths.video)
+                # Another process may have stored the same bytes a moment ago
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, extension, size, created_at) VALUES (?, ?, ?, ?)",
+                    (content_hash, extension, size, now)
+                )
+                self._put_artifact(content_hash, "video", paths.video,
+                                   duration=probe["duration"] if probe else None, now=now)
+            if probe is not None:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO probes (owner, probe, created_at) VALUES (?, ?, ?)",
+                    (content_hash, json.dumps(probe), now)
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_id, hash, filename, extension, legacy, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (file_id, content_hash, filename, paths.extension, now, now)
+            )
+        return {"paths": paths, "content_hash": content_hash, "deduplicated": deduplicated}
+
+    def probe(self, file_id: str) -> Optional[dict]:
+        """The stored media probe of file_id's video"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT probes.probe FROM files JOIN probes ON probes.owner = files.hash WHERE files.file_id = ?",
+                (file_id,)
+            ).fetchone()
+        return json.loads(row["probe"]) if row else None
+
+    def probe_of_content(self, content_hash: str) -> Optional[dict]:
+        """The stored media probe of some content, e.g. to skip probing a duplicate upload"""
+        with self._lock:
+            row = self._conn.execute("SELECT probe FROM probes WHERE owner = ?", (content_hash,)).fetchone()
+        return json.loads(row["probe"]) if row else None
+
+    def set_probe(self, file_id: str, probe: dict):
+        """Store the media probe of a video: one indexed without it (legacy uploads), or one with keyframes added"""
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO probes (owner, probe, created_at) VALUES (?, ?, ?)",
+                (row["hash"], json.dumps(probe), time.time())
+            )
+
+    def content_hash(self, file_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT hash, legacy FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        return row["hash"] if row and not row["legacy"] else None
+
+    def paths(self, file_id: str) -> ArtifactPaths:
+        """Artifact paths for file_id; an unknown file_id gets paths that do not exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        if row:
+            return self._row_paths(row)
+        return ArtifactPaths(self.upload_dir, file_id, None)
+
+    def record(self, file_id: str, kind: str, path: Path, language: str = "", variant: str = "",
+               duration: Optional[float] = None, input_key: Optional[str] = None,
+               style_prompt: Optional[str] = None):
+        """Index an artifact a pipeline stage just wrote; its size is read from disk.
+
+        kind is one of video, mp3, srt, embed or hls; srt takes a language and
+        embed a language and a variant (hard/soft). input_key identifies
+        the inputs the artifact was made from (see ``artifact``); a
+        translated srt also keeps the style_prompt it was translated with.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                return
+            self._put_artifact(row["hash"], kind, path, language, variant, duration, now, input_key, style_prompt)
+            self._conn.execute("UPDATE files SET updated_at = ? WHERE file_id = ?", (now, file_id))
+
+    def artifact(self, file_id: str, kind: str, language: str = "", variant: str = "") -> Optional[dict]:
+        """The indexed row of one artifact, including its input_key and style_prompt"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT artifacts.* FROM files JOIN artifacts ON artifacts.owner = files.hash "
+                "WHERE files.file_id = ? AND artifacts.kind = ? AND artifacts.language = ? AND artifacts.variant = ?",
+                (file_id, kind, language, variant)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def forget(self, file_id: str, kind: str, language: str = "", variant: str = ""):
+        """Drop an artifact's row, e.g. before its file is rewritten"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM artifacts WHERE owner = (SELECT hash FROM files WHERE file_id = ?) "
+                "AND kind = ? AND language = ? AND variant = ?",
+                (file_id, kind, language, variant)
+            )
+
+    def add_transcript_version(self, file_id: str, srt_hash: str, segments: int, changed: int,
+                               base_version: Optional[int] = None) -> Optional[int]:
+        """Number the next version of file_id's transcript.
+
+        With base_version, the version is only added if base_version is
+        still the latest one (None is returned otherwise).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                return None
+            latest = self._conn.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM transcript_versions WHERE owner = ?", (row["hash"],)
+            ).fetchone()[0]
+            if base_version is not None and base_version != latest:
+                return None
+            self._conn.execute(
+                "INSERT INTO transcript_versions (owner, version, srt_hash, segments, changed, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (row["hash"], latest + 1, srt_hash, segments, changed, time.time())
+            )
+            return latest + 1
+
+    def transcript_version(self, file_id: str, version: Optional[int] = None,
+                           srt_hash: Optional[str] = None) -> Optional[dict]:
+        """One version of the transcript: the latest, a given number, or the latest with a given srt_hash"""
+        query = ("SELECT transcript_versions.* FROM files JOIN transcript_versions "
+                 "ON transcript_versions.owner = files.hash WHERE files.file_id = ?")
+        params: list = [file_id]
+        if version is not None:
+            query += " AND transcript_versions.version = ?"
+            params.append(version)
+        if srt_hash is not None:
+            query += " AND transcript_versions.srt_hash = ?"
+            params.append(srt_hash)
+        with self._lock:
+            row = self._conn.execute(query + " ORDER BY transcript_versions.version DESC LIMIT 1", params).fetchone()
+        return dict(row) if row else None
+
+    def transcript_versions(self, file_id: str) -> List[dict]:
+        """Every version of the transcript, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT transcript_versions.* FROM files JOIN transcript_versions "
+                "ON transcript_versions.owner = files.hash WHERE files.file_id = ? "
+                "ORDER BY transcript_versions.version DESC",
+                (file_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _describe(self, rows: List[sqlite3.Row]) -> List[dict]:
+        """Index rows as dicts, with the artifacts of all rows read in one query per 500 hashes"""
+        owners = list({row["hash"] for row in rows})
+        artifacts: Dict[str, List[dict]] = {}
+        media: Dict[str, dict] = {}
+        for i in range(0, len(owners), 500):
+            batch = owners[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            for probe in self._conn.execute(f"SELECT owner, probe FROM probes WHERE owner IN ({placeholders})", batch):
+                # The keyframe list is for the encoders, not for listings
+                described_probe = json.loads(probe["probe"])
+                described_probe.pop("keyframes", None)
+                media[probe["owner"]] = described_probe
+            for artifact in self._conn.execute(
+                f"SELECT * FROM artifacts WHERE owner IN ({placeholders}) ORDER BY kind, language, variant",
+                batch
+            ):
+                artifacts.setdefault(artifact["owner"], []).append({
+                    "kind": artifact["kind"],
+                    "language": artifact["language"] or None,
+                    "variant": artifact["variant"] or None,
+                    "path": artifact["path"],
+                    "size": artifact["size"],
+                    "duration": artifact["duration"],
+                    "created_at": artifact["created_at"],
+                    "updated_at": artifact["updated_at"]
+                })
+
+        described = []
+        for row in rows:
+            file_artifacts = artifacts.get(row["hash"], [])
+            video = next((artifact for artifact in file_artifacts if artifact["kind"] == "video"), None)
+            languages = sorted(
+                {artifact["language"] for artifact in file_artifacts if artifact["kind"] == "srt"},
+                key=lambda language: (language != "original", language)
+            )
+            described.append({
+                "file_id": row["file_id"],
+                "filename": row["filename"],
+                "extension": row["extension"],
+                "content_hash": None if row["legacy"] else row["hash"],
+                "size": video["size"] if video else None,
+                "duration": video["duration"] if video else None,
+                "languages": languages,
+                "media": media.get(row["hash"]),
+                "artifacts": file_artifacts,
+                "created_at": row["created_at"],
+                "updated_at": row["updated_at"] or row["created_at"]
+            })
+        return described
+
+    def get(self, file_id: str) -> Optional[dict]:
+        """Everything indexed for one file_id"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE file_id = ?", (file_id,)).fetchone()
+            return self._describe([row])[0] if row else None
+
+    def list(self, limit: int = 50, offset: int = 0) -> List[dict]:
+        """Uploads, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM files ORDER BY created_at DESC LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+            return self._describe(rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def languages(self, file_id: str) -> List[str]:
+        """Languages with an SRT, "original" first"""
+        described = self.get(file_id)
+        return described["languages"] if described else []
+
+    def artifacts(self, file_id: str) -> dict:
+        """Which derived files already exist for an upload"""
+        languages = self.languages(file_id)
+        return {
+            "mp3": self.paths(file_id).mp3.exists(),
+            "original_srt": "original" in languages,
+            "translations": [language for language in languages if language != "original"]
+        }
+
+    def import_legacy(self) -> int:
+        """Index uploads from before the store with one pass over UPLOAD_DIR.
+
+        Only runs once per UPLOAD_DIR. Returns how many file_ids were added.
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM settings WHERE key = 'legacy_imported'").fetchone():
+                return 0
+
+        found: Dict[str, dict] = {}
+        with os.scandir(self.upload_dir) as entries:
+            for entry in entries:
+                match = _LEGACY_NAME_RE.match(entry.name)
+                if not match or not entry.is_file():
+                    continue
+                item = found.setdefault(match["file_id"], {"video": None, "artifacts": []})
+                language, variant, ext = match["language"], match["variant"], match["ext"]
+                if language is None and ext.lower() in ALLOWED_VIDEO_EXTENSIONS:
+                    item["video"] = entry
+                elif language is None and ext == ".mp3":
+                    item["artifacts"].append(("mp3", entry.path, "", ""))
+                elif variant is None and ext == ".srt":
+                    item["artifacts"].append(("srt", entry.path, language, ""))
+                elif variant is not None and ext == ".mp4":
+                    item["artifacts"].append(("embed", entry.path, language, variant))
+
+        now = time.time()
+        imported = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for file_id, item in found.items():
+                    video = item["video"]
+                    if video is None:
+                        continue
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO files (file_id, hash, filename, extension, legacy, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, 1, ?, ?)",
+                        (file_id, file_id, video.name, Path(video.name).suffix, video.stat().st_mtime, now)
+                    )
+                    imported += cursor.rowcount
+                    self._put_artifact(file_id, "video", Path(video.path), now=now)
+                    for kind, path, language, variant in item["artifacts"]:
+                        self._put_artifact(file_id, kind, Path(path), language, variant, now=now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES ('legacy_imported', ?)", (str(now),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if imported:
+            print(f"Indexed {imported} uploads from the old layout")
+        return imported
+
+    def stats(self) -> dict:
+        with self._lock:
+            blobs, stored_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            files, uploaded_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(blobs.size), 0) FROM files JOIN blobs ON blobs.hash = files.hash"
+            ).fetchone()
+        return {
+            "files": files,
+            "blobs": blobs,
+            "stored_bytes": stored_bytes,
+            "uploaded_bytes": uploaded_bytes,
+            "saved_bytes": uploaded_bytes - stored_bytes
+        }
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Lanes that never wait on each other: audio extraction for ASR, subtitle
+# burn-in (full video re-encode) and stream-copy muxing (soft subtitles)
+EXTRACT = "extract"
+BURN = "burn"
+MUX = "mux"
+
+
+class EncodeLane:
+    """A fixed number of ffmpeg slots, each with its own thread budget"""
+
+    def __init__(self, name: str, slots: int, threads: int):
+        self.name = name
+        self.slots = slots
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=slots, thread_name_prefix=f"encode-{name}")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def _run(self, submitted: float, func: Callable, args: tuple, kwargs: dict):
+        started = time.monotonic()
+        wait = started - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        if wait > 1:
+            print(f"encode lane {self.name}: job waited {wait:.1f}s for a slot")
+        ok = False
+        try:
+            result = func(*args, threads=self.threads, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.total_run += time.monotonic() - started
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def submit(self, func: Callable, *args, **kwargs):
+        with self._lock:
+            self.queued += 1
+        return self.executor.submit(self._run, time.monotonic(), func, args, kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "slots": self.slots,
+                "threads_per_job": self.threads,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait": round(self.total_wait / finished, 3) if finished else 0.0,
+                "max_wait": round(self.max_wait, 3),
+                "avg_run": round(self.total_run / finished, 3) if finished else 0.0
+            }
+
+
+class EncodeScheduler:
+    """Run ffmpeg jobs in per-type lanes sized to the machine's cores.
+
+    Burn-ins split the cores between ENCODE_BURN_SLOTS concurrent encodes
+    instead of each asking ffmpeg for every core, and extraction and
+    muxing have lanes of their own so they never queue behind a long
+    encode. ENCODE_CPU_COUNT overrides the detected core count (worker.py
+    divides it between its processes).
+    """
+
+    def __init__(self, cpu_count: Optional[int] = None):
+        self.cpu_count = cpu_count or int(os.getenv("ENCODE_CPU_COUNT", "0")) or os.cpu_count() or 2
+
+        burn_slots = int(os.getenv("ENCODE_BURN_SLOTS", "0")) or max(1, self.cpu_count // 4)
+        burn_threads = int(os.getenv("ENCODE_BURN_THREADS", "0")) or max(1, self.cpu_count // burn_slots)
+        # Audio decode + MP3 encode barely uses more than one core
+        extract_slots = int(os.getenv("ENCODE_EXTRACT_SLOTS", "0")) or max(2, self.cpu_count // 2)
+        mux_slots = int(os.getenv("ENCODE_MUX_SLOTS", "2"))
+
+        self.lanes: Dict[str, EncodeLane] = {
+            EXTRACT: EncodeLane(EXTRACT, extract_slots, 1),
+            BURN: EncodeLane(BURN, burn_slots, burn_threads),
+            MUX: EncodeLane(MUX, mux_slots, 1),
+        }
+
+    async def run(self, lane: str, func: Callable, *args, **kwargs):
+        """Run func(*args, threads=<lane budget>, **kwargs) in the lane's pool"""
+        future = self.lanes[lane].submit(func, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        return {
+            "cpu_count": self.cpu_count,
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+        }
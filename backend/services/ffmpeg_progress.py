@@ -0,0 +1,156 @@
+import re
+import time
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, List, Optional
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+# Lines of ffmpeg's log kept for error messages
+STDERR_TAIL_LINES = 50
+
+
+class FFmpegProgress:
+    """One progress report from ``ffmpeg -progress``"""
+
+    def __init__(self):
+        self.frame = 0
+        self.fps = 0.0
+        self.time = 0.0            # seconds of output written
+        self.speed = 0.0           # multiple of real time
+        self.duration: Optional[float] = None
+        self.elapsed = 0.0         # wall-clock seconds since start
+        self.done = False
+
+    @property
+    def percent(self) -> Optional[float]:
+        if self.done:
+            return 100.0
+        if not self.duration:
+            return None
+        return min(99.9, 100.0 * self.time / self.duration)
+
+    def update(self, fields: dict):
+        """Apply one key=value block; fields ffmpeg reports as N/A are left as they were"""
+        def number(key, cast):
+            try:
+                return cast(fields[key].rstrip("x"))
+            except (KeyError, ValueError):
+                return None
+
+        frame = number("frame", int)
+        if frame is not None:
+            self.frame = frame
+        fps = number("fps", float)
+        if fps is not None:
+            self.fps = fps
+        # out_time_us and out_time_ms are both microseconds
+        out_time = number("out_time_us", int)
+        if out_time is None:
+            out_time = number("out_time_ms", int)
+        if out_time is not None and out_time >= 0:
+            self.time = out_time / 1_000_000
+        speed = number("speed", float)
+        if speed is not None:
+            self.speed = speed
+        self.done = fields.get("progress") == "end"
+
+    def to_dict(self) -> dict:
+        return {
+            "frame": self.frame,
+            "fps": self.fps,
+            "time": round(self.time, 3),
+            "speed": self.speed,
+            "duration": self.duration,
+            "percent": round(self.percent, 1) if self.percent is not None else None,
+            "elapsed": round(self.elapsed, 3),
+            "done": self.done
+        }
+
+
+def run_ffmpeg(cmd: List[str], on_progress: Optional[Callable[[FFmpegProgress], None]] = None,
+               timeout: Optional[float] = None, duration: Optional[float] = None) -> FFmpegProgress:
+    """Run an ffmpeg command, reading its progress as it encodes.
+
+    ``-progress pipe:1 -nostats`` is added after ``ffmpeg`` and each
+    key=value block on stdout is parsed and passed to ``on_progress``.
+    stderr is drained on a thread and only its tail is kept, so long
+    encodes do not buffer the whole log. The total duration is read from
+    the first input's header unless passed in.
+
+    Raises ``subprocess.CalledProcessError`` (with the stderr tail) on a
+    non-zero exit and ``subprocess.TimeoutExpired`` after ``timeout``
+    seconds, like ``subprocess.run(check=True, timeout=...)``.
+    """
+    full_cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    progress = FFmpegProgress()
+    progress.duration = duration
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    started = time.monotonic()
+
+    process = subprocess.Popen(
+        full_cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace"
+    )
+
+    def drain_stderr():
+        for line in process.stderr:
+            stderr_tail.append(line.rstrip())
+            if progress.duration is None:
+                match = _DURATION_RE.search(line)
+                if match:
+                    h, m, s = match.groups()
+                    progress.duration = int(h) * 3600 + int(m) * 60 + float(s)
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+
+    try:
+        fields = {}
+        for line in process.stdout:
+            key, sep, value = line.strip().partition("=")
+            if not sep:
+                continue
+            fields[key] = value.strip()
+            # "progress" closes each block
+            if key == "progress":
+                progress.update(fields)
+                progress.elapsed = time.monotonic() - started
+                if on_progress:
+                    on_progress(progress)
+                fields = {}
+        returncode = process.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_thread.join()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(full_cmd, timeout, stderr="\n".join(stderr_tail))
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, full_cmd, stderr="\n".join(stderr_tail))
+
+    progress.elapsed = time.monotonic() - started
+    print(
+        f"ffmpeg finished: {progress.frame} frames, {progress.time:.1f}s of output "
+        f"in {progress.elapsed:.1f}s ({progress.time / progress.elapsed if progress.elapsed else 0:.2f}x)"
+    )
+    return progress
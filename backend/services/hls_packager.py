@@ -0,0 +1,215 @@
+import os
+import math
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services import subtitle_io
+from services.subtitle_io import CueList
+from services.ffmpeg_progress import run_ffmpeg
+from services.languages import language_tag, display_name
+
+# Cue times are media times; the video renditions start at pts 0
+VTT_TIMESTAMP_MAP = "X-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000"
+
+# H.264 profile name -> (profile_idc, constraint flags) of an RFC 6381 avc1 string
+_H264_PROFILES = {
+    "Constrained Baseline": (0x42, 0xE0),
+    "Baseline": (0x42, 0x00),
+    "Main": (0x4D, 0x00),
+    "Extended": (0x58, 0x00),
+    "High": (0x64, 0x00),
+    "High 10": (0x6E, 0x00),
+    "High 4:2:2": (0x7A, 0x00),
+    "High 4:4:4 Predictive": (0xF4, 0x00),
+}
+# AAC profile name -> MPEG-4 audio object type
+_AAC_PROFILES = {"Main": 1, "LC": 2, "LTP": 4, "HE-AAC": 5, "HE-AACv2": 29}
+_AUDIO_CODECS = {"mp3": "mp4a.40.34", "ac3": "ac-3", "eac3": "ec-3", "opus": "Opus", "flac": "fLaC", "alac": "alac"}
+
+
+def _video_codec(stream: dict, init_path: Optional[Path]) -> Optional[str]:
+    if stream.get("codec") != "h264":
+        return None
+    profile = _H264_PROFILES.get(stream.get("profile"))
+    level = stream.get("level")
+    if profile and level and level > 0:
+        return "avc1.%02X%02X%02X" % (profile[0], profile[1], level)
+    # The ffmpeg header has no level; the init segment's avcC box has all three bytes
+    return _avc_config(init_path) if init_path else None
+
+
+def _avc_config(init_path: Path) -> Optional[str]:
+    try:
+        data = init_path.read_bytes()  # An init segment is a few KB
+    except OSError:
+        return None
+    at = data.find(b"avcC")
+    if at < 0 or len(data) < at + 8:
+        return None
+    # configurationVersion, AVCProfileIndication, profile_compatibility, AVCLevelIndication
+    return "avc1." + data[at + 5:at + 8].hex().upper()
+
+
+def _audio_codec(stream: dict) -> Optional[str]:
+    if stream.get("codec") == "aac":
+        return f"mp4a.40.{_AAC_PROFILES.get(stream.get('profile'), 2)}"
+    return _AUDIO_CODECS.get(stream.get("codec"))
+
+
+class _SegmentedCues:
+    """Cues of one subtitle file, bucketed by segment index"""
+
+    def __init__(self, cues: CueList, segment_seconds: float, version: str):
+        self.cues = cues
+        self.version = version
+        self.buckets: Dict[int, List[int]] = {}
+        for index, (start, end, _) in enumerate(cues):
+            first = int(start // segment_seconds)
+            # A cue that crosses a boundary is repeated in the next segment
+            last = max(first, math.ceil(end / segment_seconds) - 1)
+            for segment in range(first, last + 1):
+                self.buckets.setdefault(segment, []).append(index)
+
+
+class HlsPackager:
+    """Serve subtitles as segmented WebVTT renditions of an HLS stream.
+
+    Subtitle segments are cut from the SRT files on request: each SRT is
+    parsed once per version (mtime and size) and its cues are bucketed by
+    segment, so a player that seeks only pays for the few cues around the
+    playhead. Media playlists point at ``{n}.vtt?v=<version>``, so
+    segments can be cached for good and an edited SRT gets new URLs.
+
+    The video itself is packaged once per upload as fMP4 HLS with a stream
+    copy (``package_video``); adding or editing a language never touches it.
+
+    Settings (env): HLS_SEGMENT_SECONDS (10), HLS_CUE_CACHE_SIZE (32).
+    """
+
+    def __init__(self):
+        self.segment_seconds = float(os.getenv("HLS_SEGMENT_SECONDS", "10"))
+        self.cache_size = int(os.getenv("HLS_CUE_CACHE_SIZE", "32"))
+        self._cache: "OrderedDict[str, _SegmentedCues]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, srt_path: Path) -> str:
+        """Changes whenever the SRT file or the segment duration does"""
+        stat = srt_path.stat()
+        key = f"{stat.st_mtime_ns}:{stat.st_size}:{self.segment_seconds}"
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _segmented(self, srt_path: Path) -> _SegmentedCues:
+        version = self.version(srt_path)
+        with self._lock:
+            cached = self._cache.get(str(srt_path))
+            if cached and cached.version == version:
+                self._cache.move_to_end(str(srt_path))
+                return cached
+        segmented = _SegmentedCues(subtitle_io.read(srt_path, "srt"), self.segment_seconds, version)
+        with self._lock:
+            self._cache[str(srt_path)] = segmented
+            self._cache.move_to_end(str(srt_path))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return segmented
+
+    def segment_count(self, duration: float) -> int:
+        return max(1, math.ceil(duration / self.segment_seconds))
+
+    def codecs(self, media: dict, init_path: Optional[Path] = None) -> Optional[str]:
+        """CODECS of the packaged video (first video stream, every audio stream), from the stored probe.
+
+        None when a codec has no known RFC 6381 string (anything but H.264
+        video); CODECS is then left out rather than guessed.
+        """
+        streams = media.get("streams") or []
+        video = next((stream for stream in streams if stream["type"] == "video"), None)
+        if video is None:
+            return None
+        codecs = [_video_codec(video, init_path)]
+        codecs += [_audio_codec(stream) for stream in streams if stream["type"] == "audio"]
+        if None in codecs:
+            return None
+        return ",".join(dict.fromkeys(codecs))
+
+    def master_playlist(self, languages: List[str], default_language: str,
+                        video_uri: str, bandwidth: int, codecs: Optional[str] = None) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for language in languages:
+            lines.append(
+                f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{display_name(language)}",'
+                f'LANGUAGE="{language_tag(language)}",DEFAULT={"YES" if language == default_language else "NO"},'
+                f'AUTOSELECT=YES,FORCED=NO,URI="{language}/index.m3u8"'
+            )
+        codecs = f',CODECS="{codecs}"' if codecs else ""
+        subtitles = ',SUBTITLES="subs"' if languages else ""
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}{codecs}{subtitles}")
+        lines.append(video_uri)
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self, srt_path: Path, duration: Optional[float]) -> Tuple[str, str]:
+        """(playlist, version) of one language; duration defaults to the last cue's end"""
+        segmented = self._segmented(srt_path)
+        duration = duration or segmented.cues.end_time
+        count = self.segment_count(duration)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_seconds)}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:VOD",
+        ]
+        for index in range(count):
+            length = min(self.segment_seconds, duration - index * self.segment_seconds)
+            lines.append(f"#EXTINF:{max(length, 0.001):.3f},")
+            lines.append(f"{index}.vtt?v={segmented.version}")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n", segmented.version
+
+    def segment(self, srt_path: Path, index: int) -> Tuple[str, str]:
+        """(WebVTT, version) of segment ``index``; cues keep their absolute times"""
+        segmented = self._segmented(srt_path)
+        cues = CueList(segmented.cues[i] for i in segmented.buckets.get(index, []))
+        return subtitle_io.dumps(cues, "vtt", header=f"WEBVTT\n{VTT_TIMESTAMP_MAP}"), segmented.version
+
+    def package_video(self, video_path: str, output_dir: str, threads: int = 1):
+        """Stream-copy the video (and audio) into fMP4 HLS segments in output_dir.
+
+        Written to a temporary directory first, so a half-written package
+        is never served.
+        """
+        output = Path(output_dir)
+        work_dir = output.with_name(output.name + ".tmp")
+        work_dir.mkdir(parents=True, exist_ok=True)
+        cmd = [
+            'ffmpeg',
+            '-i', video_path,
+            '-map', '0:v:0',
+            '-map', '0:a?',
+            '-c', 'copy',            # Segments are cut at keyframes, nothing is re-encoded
+            '-f', 'hls',
+            '-hls_time', str(self.segment_seconds),
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', 'init.mp4',
+            '-hls_segment_filename', str(work_dir / '%05d.m4s'),
+            '-threads', str(threads),
+            '-y',
+            str(work_dir / 'index.m3u8')
+        ]
+        try:
+            run_ffmpeg(cmd)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"ไม่สามารถสร้าง HLS ได้: {e.stderr.strip()}")
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+
+        if output.exists():
+            for old in output.iterdir():
+                old.unlink()
+            output.rmdir()
+        os.replace(work_dir, output)
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+JOB_TYPES = ("transcribe", "translate", "embed", "package")
+
+
+class JobQueue:
+    """Durable job queue stored in SQLite.
+
+    Workers claim jobs with a lease and renew it while they run. A job whose
+    lease runs out (the worker crashed or was killed) becomes claimable
+    again, and jobs that failed with a transient error are retried with a
+    backoff until ``max_attempts`` is used up. Any process that can open the database file - the API and
+    workers on this node, or on others sharing UPLOAD_DIR - can use it.
+    """
+
+    def __init__(self, db_path: Path, max_attempts: int = 3, retry_backoff: float = 10.0):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                worker_id TEXT,
+                lease_expires REAL,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                progress TEXT
+            )
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "progress" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, type, run_after)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, stats TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _to_dict(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        return job
+
+    def enqueue(self, job_type: str, payload: dict, max_attempts: Optional[int] = None) -> dict:
+        """เพิ่มงานเข้าคิว"""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, type, payload, status, max_attempts, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(payload, ensure_ascii=False),
+                 max_attempts or self.max_attempts, now, now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = "SELECT * FROM jobs"
+        conditions, params = [], []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if job_type:
+            conditions.append("type = ?")
+            params.append(job_type)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def list_for_file(self, file_id: str, limit: int = 20) -> List[dict]:
+        """Most recent jobs whose payload names file_id"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE json_extract(payload, '$.file_id') = ? ORDER BY created_at DESC LIMIT ?",
+                (file_id, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, worker_id: str, job_types: List[str], lease_seconds: float) -> Optional[dict]:
+        """Atomically take the oldest runnable job of the given types.
+
+        Runnable means queued and due, or running with an expired lease.
+        """
+        now = time.time()
+        placeholders = ",".join("?" * len(job_types))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases whose attempts are used up will never succeed
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'worker lost'), "
+                    "worker_id = NULL, lease_expires = NULL, finished_at = ?, updated_at = ? "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+                    (now, now, now)
+                )
+                row = self._conn.execute(
+                    f"SELECT id FROM jobs WHERE type IN ({placeholders}) AND ("
+                    "(status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_expires < ?)"
+                    ") ORDER BY created_at LIMIT 1",
+                    (*job_types, now, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires = ?, progress = NULL, "
+                    "attempts = attempts + 1, started_at = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now + lease_seconds, now, now, row["id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extend the lease; False means the job was taken over by someone else"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def set_progress(self, job_id: str, worker_id: str, progress: dict):
+        """Store the latest progress report of a running job"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (json.dumps(progress), now, job_id, worker_id)
+            )
+
+    def complete(self, job_id: str, worker_id: str, result: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, lease_expires = NULL, "
+                "finished_at = ?, updated_at = ? WHERE id = ? AND worker_id = ?",
+                (json.dumps(result, ensure_ascii=False), now, now, job_id, worker_id)
+            )
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True):
+        """Record a failure; requeue with backoff while attempts remain, unless ``retry`` is False"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "run_after = ? + ? * attempts, "
+                "finished_at = CASE WHEN ? AND attempts < max_attempts THEN NULL ELSE ? END, "
+                "error = ?, worker_id = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND worker_id = ?",
+                (retry, now, self.retry_backoff, retry, now, error, now, job_id, worker_id)
+            )
+
+    def report_worker(self, worker_id: str, stats: dict):
+        """Publish a worker's encode scheduler stats"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (id, stats, updated_at) VALUES (?, ?, ?)",
+                (worker_id, json.dumps(stats), time.time())
+            )
+
+    def worker_stats(self, max_age: float = 60.0) -> List[dict]:
+        """Stats of workers that reported within max_age seconds; older rows are dropped"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE updated_at < ?", (cutoff,))
+            rows = self._conn.execute("SELECT id, stats, updated_at FROM workers ORDER BY id").fetchall()
+        return [
+            {"worker_id": row["id"], "updated_at": row["updated_at"], **json.loads(row["stats"])}
+            for row in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT type, status, COUNT(*) FROM jobs GROUP BY type, status").fetchall()
+        stats: dict = {}
+        for job_type, status, count in rows:
+            stats.setdefault(job_type, {})[status] = count
+        return stats
+
+
+def create_job_queue(upload_dir: Path) -> JobQueue:
+    """คิวงานที่ใช้ร่วมกันระหว่าง API และ worker (UPLOAD_DIR/jobs.sqlite3)"""
+    return JobQueue(
+        upload_dir / "jobs.sqlite3",
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        retry_backoff=float(os.getenv("JOB_RETRY_BACKOFF", "10"))
+    )
@@ -0,0 +1,41 @@
+import os
+from typing import Dict, Tuple
+
+# Language names used in file names and requests -> (BCP 47 tag, ISO 639-2 code, display name)
+LANGUAGES: Dict[str, Tuple[str, str, str]] = {
+    "thai": ("th", "tha", "ไทย"),
+    "english": ("en", "eng", "English"),
+    "lao": ("lo", "lao", "ລາວ"),
+    "myanmar": ("my", "mya", "မြန်မာ"),
+    "khmer": ("km", "khm", "ខ្មែរ"),
+    "vietnamese": ("vi", "vie", "Tiếng Việt"),
+}
+
+_BY_TAG = {tag: name for name, (tag, _, _) in LANGUAGES.items()}
+
+
+def _resolve(language: str) -> str:
+    """Name in LANGUAGES for a language name or tag; "original" is the ASR language"""
+    if language == "original":
+        language = os.getenv("ASR_LANGUAGE", "th") or "th"
+    language = language.lower()
+    return _BY_TAG.get(language, language)
+
+
+def language_tag(language: str) -> str:
+    """BCP 47 tag (HLS LANGUAGE, WebVTT), e.g. english -> en"""
+    name = _resolve(language)
+    return LANGUAGES[name][0] if name in LANGUAGES else name
+
+
+def iso639_2(language: str) -> str:
+    """ISO 639-2 code (ffmpeg/MP4/MKV language metadata), e.g. english -> eng; und if unknown"""
+    name = _resolve(language)
+    return LANGUAGES[name][1] if name in LANGUAGES else "und"
+
+
+def display_name(language: str) -> str:
+    if language == "original":
+        return f"ต้นฉบับ ({display_name(_resolve(language))})"
+    name = _resolve(language)
+    return LANGUAGES[name][2] if name in LANGUAGES else language
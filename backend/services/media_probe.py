@@ -0,0 +1,299 @@
+import re
+import json
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from services.ffmpeg_progress import _DURATION_RE
+
+_INPUT_RE = re.compile(r"^Input #0, (.+?), from ", re.MULTILINE)
+_BITRATE_RE = re.compile(r"Duration:.*?bitrate:\s*(\d+) kb/s")
+_STREAM_RE = re.compile(
+    r"^\s*Stream #0:(\d+)(?:\[0x[0-9a-fA-F]+\])?(?:\((\w+)\))?: (Video|Audio|Subtitle|Data|Attachment): (\w+)(.*)$",
+    re.MULTILINE
+)
+_SIZE_RE = re.compile(r"\b(\d{2,5})x(\d{2,5})\b")
+_FPS_RE = re.compile(r"([\d.]+)(k?) (?:fps|tbr)")
+_SAMPLE_RATE_RE = re.compile(r"(\d+) Hz, ([^,]+)")
+_STREAM_BITRATE_RE = re.compile(r"(\d+) kb/s")
+# "h264 (High) (avc1 / 0x31637661)": the first bracket is the profile, the fourcc has a slash
+_PROFILE_RE = re.compile(r"^ \(([^)/]+)\)")
+_CHANNELS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "4.0": 4, "5.0": 5, "5.1": 6, "6.1": 7, "7.1": 8}
+
+
+def probe_keyframes(video_path: Path) -> Tuple[float, List[float]]:
+    """Return (duration, keyframe times) of the first video stream.
+
+    Stream-copies the video into ffmpeg's framecrc muxer, which lists
+    every packet with its pts and flags, so nothing is decoded. Times are
+    relative to the first keyframe, the origin ``-ss`` seeks from.
+    """
+    try:
+        result = subprocess.run(
+            [
+                'ffmpeg', '-nostdin', '-nostats',
+                '-i', str(video_path),
+                '-map', '0:v:0',
+                '-c', 'copy',
+                '-f', 'framecrc', '-'
+            ],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    except FileNotFoundError:
+        raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"ไม่สามารถอ่านข้อมูลวิดีโอได้: {e.stderr.strip()}")
+
+    duration_match = _DURATION_RE.search(result.stderr)
+    if not duration_match:
+        raise Exception("ไม่สามารถอ่านความยาววิดีโอได้")
+    h, m, sec = duration_match.groups()
+    duration = int(h) * 3600 + int(m) * 60 + float(sec)
+
+    time_base = None
+    keyframe_pts = []
+    for line in result.stdout.splitlines():
+        if line.startswith("#tb 0:"):
+            num, den = line.split(":", 1)[1].strip().split("/")
+            time_base = int(num) / int(den)
+        elif line and not line.startswith("#"):
+            # stream, dts, pts, duration, size, crc[, F=flags]; flags are
+            # only written when they are not exactly "keyframe"
+            fields = [field.strip() for field in line.split(",")]
+            flags = next((int(field[2:], 16) for field in fields[6:] if field.startswith("F=")), 0x1)
+            if len(fields) >= 6 and flags & 0x1:
+                keyframe_pts.append(int(fields[2]))
+
+    if time_base is None or not keyframe_pts:
+        return duration, []
+    origin = min(keyframe_pts)
+    return duration, sorted({(pts - origin) * time_base for pts in keyframe_pts})
+
+
+class MediaProber:
+    """Inspect an upload once and describe it for every later stage.
+
+    ``probe`` reads the container and its streams with a single ffprobe
+    JSON call (or, where ffprobe is not installed, from the input header
+    ffmpeg prints). Neither reads past the header, so probing an upload
+    costs the same whatever its size. The result is a plain dict, stored
+    with the file in the content store:
+
+    ``{"format", "duration", "bit_rate", "size", "streams": [...],
+    "keyframes": None, "keyframe_interval": None}``
+
+    Listing keyframes means reading every video packet, so
+    ``add_keyframes`` is only called by the first stage that needs them
+    (a segmented burn). It fills in ``keyframes`` and
+    ``{"average", "max"}`` ``keyframe_interval``, and the stored probe is
+    updated.
+
+    Every stream has ``index``, ``type`` (video/audio/subtitle/...),
+    ``codec``, ``profile``, ``language`` and ``bit_rate``; video streams add
+    ``width``, ``height``, ``fps`` and ``level`` (ffprobe only, None from the
+    ffmpeg header), audio streams ``sample_rate`` and ``channels``.
+    """
+
+    def __init__(self):
+        self.ffprobe = shutil.which("ffprobe")
+
+    def probe(self, path: Path) -> dict:
+        """Describe a media file from its header; raises ValueError if it cannot be read"""
+        info = self._probe_ffprobe(path) if self.ffprobe else self._probe_ffmpeg(path)
+        info["size"] = path.stat().st_size
+        info["keyframes"] = None
+        info["keyframe_interval"] = None
+        return info
+
+    def add_keyframes(self, info: dict, path: Path) -> dict:
+        """Fill in the keyframes of the first video stream (times from the first keyframe)"""
+        if self.ffprobe:
+            duration, keyframes = self._keyframes_ffprobe(path)
+        else:
+            duration, keyframes = probe_keyframes(path)
+        info["duration"] = info["duration"] or duration
+        info["keyframes"] = keyframes
+        if len(keyframes) > 1:
+            gaps = [b - a for a, b in zip(keyframes, keyframes[1:])]
+            info["keyframe_interval"] = {"average": sum(gaps) / len(gaps), "max": max(gaps)}
+        return info
+
+    def _keyframes_ffprobe(self, path: Path) -> Tuple[Optional[float], List[float]]:
+        """Keyframe packets of the first video stream, listed by ffprobe without decoding"""
+        try:
+            result = subprocess.run(
+                [
+                    self.ffprobe,
+                    '-v', 'error',
+                    '-select_streams', 'v:0',
+                    '-show_entries', 'packet=pts_time,flags',
+                    '-of', 'csv=p=0',
+                    str(path)
+                ],
+                capture_output=True,
+                text=True,
+                check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"ไม่สามารถอ่านข้อมูลวิดีโอได้: {e.stderr.strip()}")
+
+        times = []
+        for line in result.stdout.splitlines():
+            pts_time, _, flags = line.partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                times.append(float(pts_time))
+        if not times:
+            return None, []
+        origin = min(times)
+        return None, sorted({time - origin for time in times})
+
+    def validate(self, info: dict):
+        """Reject uploads no later stage could use"""
+        if not info["streams"] or not info["duration"]:
+            raise ValueError("ไฟล์วิดีโอเสียหายหรือไม่รองรับ")
+        if not any(stream["type"] == "video" for stream in info["streams"]):
+            raise ValueError("ไม่พบภาพวิดีโอในไฟล์")
+        if not any(stream["type"] == "audio" for stream in info["streams"]):
+            raise ValueError("วิดีโอนี้ไม่มีเสียง ไม่สามารถสร้าง subtitle ได้")
+
+    def _probe_ffprobe(self, path: Path) -> dict:
+        try:
+            result = subprocess.run(
+                [
+                    self.ffprobe,
+                    '-v', 'error',
+                    '-print_format', 'json',
+                    '-show_format',
+                    '-show_streams',
+                    str(path)
+                ],
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            probed = json.loads(result.stdout)
+        except subprocess.CalledProcessError as e:
+            raise ValueError(f"ไฟล์วิดีโอเสียหาย: {e.stderr.strip()}")
+        except json.JSONDecodeError:
+            raise ValueError("ไฟล์วิดีโอเสียหายหรือไม่รองรับ")
+
+        streams = []
+        for stream in probed.get("streams", []):
+            described = {
+                "index": stream.get("index"),
+                "type": stream.get("codec_type"),
+                "codec": stream.get("codec_name"),
+                "profile": stream.get("profile"),
+                "language": stream.get("tags", {}).get("language"),
+                "bit_rate": _int(stream.get("bit_rate"))
+            }
+            if described["type"] == "video":
+                described.update({
+                    "width": stream.get("width"),
+                    "height": stream.get("height"),
+                    "fps": _rate(stream.get("avg_frame_rate")) or _rate(stream.get("r_frame_rate")),
+                    "level": _int(stream.get("level"))
+                })
+            elif described["type"] == "audio":
+                described.update({
+                    "sample_rate": _int(stream.get("sample_rate")),
+                    "channels": stream.get("channels")
+                })
+            streams.append(described)
+
+        container = probed.get("format", {})
+        return {
+            "format": container.get("format_name"),
+            "duration": _float(container.get("duration")),
+            "bit_rate": _int(container.get("bit_rate")),
+            "streams": streams
+        }
+
+    def _probe_ffmpeg(self, path: Path) -> dict:
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-nostdin', '-hide_banner', '-i', str(path)],
+                capture_output=True,
+                text=True
+            )
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+        # Without an output ffmpeg always exits non-zero; an unreadable input has no header
+        header = result.stderr
+        input_match = _INPUT_RE.search(header)
+        if not input_match:
+            raise ValueError(f"ไฟล์วิดีโอเสียหาย: {header.strip().splitlines()[-1] if header.strip() else ''}")
+
+        duration = None
+        duration_match = _DURATION_RE.search(header)
+        if duration_match:
+            h, m, sec = duration_match.groups()
+            duration = int(h) * 3600 + int(m) * 60 + float(sec)
+        bitrate_match = _BITRATE_RE.search(header)
+
+        streams = []
+        for match in _STREAM_RE.finditer(header):
+            index, language, kind, codec, details = match.groups()
+            bitrate = _STREAM_BITRATE_RE.search(details)
+            profile = _PROFILE_RE.match(details)
+            described = {
+                "index": int(index),
+                "type": kind.lower(),
+                "codec": codec,
+                "profile": profile.group(1) if profile else None,
+                "language": language,
+                "bit_rate": int(bitrate.group(1)) * 1000 if bitrate else None
+            }
+            if kind == "Video":
+                size = _SIZE_RE.search(details)
+                fps = _FPS_RE.search(details)
+                described.update({
+                    "width": int(size.group(1)) if size else None,
+                    "height": int(size.group(2)) if size else None,
+                    "fps": float(fps.group(1)) * (1000 if fps.group(2) else 1) if fps else None,
+                    "level": None
+                })
+            elif kind == "Audio":
+                sample_rate = _SAMPLE_RATE_RE.search(details)
+                layout = sample_rate.group(2).split("(")[0].strip() if sample_rate else None
+                described.update({
+                    "sample_rate": int(sample_rate.group(1)) if sample_rate else None,
+                    "channels": _CHANNELS.get(layout)
+                })
+            streams.append(described)
+
+        return {
+            "format": input_match.group(1),
+            "duration": duration,
+            "bit_rate": int(bitrate_match.group(1)) * 1000 if bitrate_match else None,
+            "streams": streams
+        }
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _rate(value: Optional[str]) -> Optional[float]:
+    """Frame rate from an ffprobe fraction such as 30000/1001"""
+    if not value:
+        return None
+    num, _, den = value.partition("/")
+    try:
+        rate = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return rate or None
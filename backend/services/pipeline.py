@@ -0,0 +1,520 @@
+import os
+import shutil
+import asyncio
+import hashlib
+import threading
+import aiofiles
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from services.video_processor import VideoProcessor, ProgressCallback, HARD_SUBTITLE_STYLE, SOFT_SUBTITLE_CODECS
+from services.transcription_service import TranscriptionService
+from services.translation_service import TranslationService
+from services.translation_cache import TranslationCache
+from services.translation_batcher import TranslationUsage
+from models.subtitle_models import TranscriptionResult
+from services.content_store import ContentStore
+from services.hls_packager import HlsPackager
+from services import subtitle_io, transcript_editor
+from services.subtitle_io import CueList
+from services.transcript_editor import TranscriptVersionConflict
+from services.encode_scheduler import MUX
+from services.upload_service import hash_file
+from services.ai_backends import create_transcription_backend, create_chat_backend, get_http_client
+
+
+class Pipeline:
+    """Transcribe / translate / embed steps, shared by the API and the job workers.
+
+    Each step reads its inputs from and writes its outputs to UPLOAD_DIR, so
+    it can run in whichever process claims the job. Outputs are keyed by the
+    video's content hash (see ContentStore), so every upload of the same
+    video shares them, and each step records what it wrote in the store's
+    metadata index.
+    """
+
+    def __init__(self, upload_dir: Path):
+        self.upload_dir = upload_dir
+        self.content_store = ContentStore(upload_dir)
+
+        # Both AI backends share one async connection pool
+        http_client = get_http_client()
+        self.transcription_service = TranscriptionService(create_transcription_backend(http_client))
+        self.video_processor = VideoProcessor(self.transcription_service)
+        self.media_prober = self.video_processor.media_prober
+        self.hls_packager = HlsPackager()
+        self.translation_cache = TranslationCache(
+            upload_dir / "translation_cache.sqlite3",
+            max_entries=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "200000"))
+        )
+        self.translation_service = TranslationService(
+            create_chat_backend(http_client),
+            cache=self.translation_cache,
+            transcription_service=self.transcription_service
+        )
+        # Serializes transcript edits made through this process
+        self._transcript_lock = threading.Lock()
+
+    def paths(self, file_id: str):
+        """Artifact paths for file_id"""
+        return self.content_store.paths(file_id)
+
+    async def _record(self, file_id: str, kind: str, path: Path, language: str = "", variant: str = "",
+                      duration: Optional[float] = None, input_key: Optional[str] = None,
+                      style_prompt: Optional[str] = None):
+        await asyncio.to_thread(
+            self.content_store.record, file_id, kind, path, language, variant, duration, input_key, style_prompt
+        )
+
+    @staticmethod
+    def _file_hash(path: Path) -> str:
+        return hash_file(path).hexdigest()
+
+    def media_info(self, file_id: str, keyframes: bool = False) -> Optional[dict]:
+        """The stored media probe of file_id's video.
+
+        Uploads from before probing are probed once now; with keyframes,
+        the keyframe list is added (and stored) if it is not there yet.
+        """
+        probe = self.content_store.probe(file_id)
+        if probe is not None and (probe.get("keyframes") is not None or not keyframes):
+            return probe
+        video_path = self.find_video(file_id)
+        if not video_path:
+            return probe
+        probe = probe or self.media_prober.probe(video_path)
+        if keyframes:
+            probe = self.media_prober.add_keyframes(probe, video_path)
+        self.content_store.set_probe(file_id, probe)
+        return probe
+
+    def index_upload(self, file_id: str):
+        """Record the video and MP3 of a new upload, with their durations"""
+        paths = self.paths(file_id)
+        media = self.media_info(file_id)
+        self.content_store.record(file_id, "video", paths.video, duration=media["duration"] if media else None)
+        if paths.mp3.exists():
+            get_duration = self.transcription_service.audio_splitter.get_duration
+            self.content_store.record(file_id, "mp3", paths.mp3, duration=get_duration(paths.mp3))
+
+    def _embed_key(self, file_id: str, video_path: Path, tracks: List[Tuple[str, Path]], settings: str) -> str:
+        """Hash of everything an embedded video depends on"""
+        video_identity = self.content_store.content_hash(file_id)
+        if video_identity is None:
+            # Legacy upload, not content-addressed
+            stat = video_path.stat()
+            video_identity = f"{video_path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+        hasher = hashlib.sha256(f"{video_identity}|{settings}|".encode())
+        for language, srt_path in tracks:
+            hasher.update(f"{language}|".encode())
+            hash_file(srt_path, hasher)
+        return hasher.hexdigest()
+
+    def find_video(self, file_id: str) -> Optional[Path]:
+        """Locate the original upload for file_id"""
+        video_path = self.paths(file_id).video
+        return video_path if video_path and video_path.exists() else None
+
+    async def transcribe(self, file_id: str, force: bool = False) -> dict:
+        """แกะเสียงจากไฟล์ MP3 และบันทึกเป็น SRT ต้นฉบับ"""
+        paths = self.paths(file_id)
+        mp3_path = paths.mp3
+        if not mp3_path.exists():
+            raise FileNotFoundError("ไม่พบไฟล์ MP3")
+
+        srt_path = paths.srt("original")
+        if srt_path.exists() and not force:
+            # Same video was transcribed before (possibly under another file_id)
+            print(f"Reusing existing transcription: {srt_path}")
+            segments = self.transcription_service.parse_srt_file(srt_path)
+            result = TranscriptionResult(
+                text=" ".join(segment.text for segment in segments),
+                segments=segments,
+                language=os.getenv("ASR_LANGUAGE", "th") or "unknown"
+            )
+            return {
+                "file_id": file_id,
+                "transcription": result,
+                "srt_path": str(srt_path),
+                "reused": True,
+                "message": "แกะเสียงสำเร็จ (ใช้ผลเดิมของวิดีโอเดียวกัน)"
+            }
+
+        print(f"Starting transcription for file: {mp3_path}")
+        # Finalized segments are appended here as chunks finish (see /transcribe/{file_id}/stream)
+        partial_path = paths.partial_transcript(file_id)
+        partial_path.write_text("", encoding="utf-8")
+        appended = 0
+
+        async def append_segments(segments):
+            nonlocal appended
+            await asyncio.to_thread(
+                subtitle_io.append_srt, partial_path, CueList.from_segments(segments), appended + 1
+            )
+            appended += len(segments)
+
+        try:
+            result = await self.transcription_service.transcribe_with_timestamps(mp3_path, append_segments)
+
+            print(f"Transcription completed, saving SRT file")
+            await self.transcription_service.save_srt(result, srt_path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+        await self._record(
+            file_id, "srt", srt_path, "original",
+            duration=result.segments[-1].end if result.segments else 0.0
+        )
+        await asyncio.to_thread(self.transcript_version, file_id)
+
+        return {
+            "file_id": file_id,
+            "transcription": result,
+            "srt_path": str(srt_path),
+            "reused": False,
+            "speech_trim": result.speech_trim,
+            "message": "แกะเสียงสำเร็จ"
+        }
+
+    async def translate(self, file_id: str, target_language: str, style_prompt: Optional[str] = None) -> dict:
+        """แปล SRT ต้นฉบับเป็นภาษาเดียว"""
+        paths = self.paths(file_id)
+        srt_path = paths.srt("original")
+        if not srt_path.exists():
+            raise FileNotFoundError("ไม่พบไฟล์ SRT ต้นฉบับ")
+
+        # Translations remember which transcript they were made from (see retranslate_changes)
+        source_hash = await asyncio.to_thread(self._file_hash, srt_path)
+        usage = TranslationUsage()
+        translated_srt = await self.translation_service.translate_srt(
+            srt_path,
+            target_language,
+            style_prompt,
+            usage=usage
+        )
+
+        output_path = paths.srt(target_language)
+        async with aiofiles.open(output_path, 'w', encoding='utf-8') as f:
+            await f.write(translated_srt)
+        await self._record(file_id, "srt", output_path, target_language, input_key=source_hash,
+                           style_prompt=style_prompt)
+
+        return {
+            "file_id": file_id,
+            "target_language": target_language,
+            "translated_srt_path": str(output_path),
+            "usage": usage.to_dict(),
+            "message": f"แปลเป็น{target_language}สำเร็จ"
+        }
+
+    async def translate_multi(self, file_id: str, targets: List[Tuple[str, Optional[str]]]) -> dict:
+        """แปล SRT ต้นฉบับเป็นหลายภาษาพร้อมกัน"""
+        paths = self.paths(file_id)
+        srt_path = paths.srt("original")
+        if not srt_path.exists():
+            raise FileNotFoundError("ไม่พบไฟล์ SRT ต้นฉบับ")
+
+        source_hash = await asyncio.to_thread(self._file_hash, srt_path)
+        styles = dict(targets)
+
+        async def save_translation(target_language: str, translated_srt: str):
+            output_path = paths.srt(target_language)
+            async with aiofiles.open(output_path, 'w', encoding='utf-8') as f:
+                await f.write(translated_srt)
+            await self._record(file_id, "srt", output_path, target_language, input_key=source_hash,
+                               style_prompt=styles.get(target_language))
+
+        outcomes = await self.translation_service.translate_srt_multi(srt_path, targets, save_translation)
+
+        results = []
+        for target_language, outcome in outcomes.items():
+            error = outcome["error"]
+            results.append({
+                "target_language": target_language,
+                "translated_srt_path": None if error else str(paths.srt(target_language)),
+                "usage": outcome["usage"],
+                "error": error
+            })
+
+        succeeded = [result["target_language"] for result in results if not result["error"]]
+        return {
+            "file_id": file_id,
+            "results": results,
+            "message": f"แปลสำเร็จ {len(succeeded)}/{len(results)} ภาษา"
+        }
+
+    def transcript_version(self, file_id: str) -> dict:
+        """Latest version of the original SRT.
+
+        An SRT that changed outside ``edit_transcript`` (a new
+        transcription, an upload from before versioning) is saved as a new
+        version first, so every edit has a snapshot to diff against.
+        """
+        paths = self.paths(file_id)
+        srt_path = paths.srt("original")
+        if not srt_path.exists():
+            raise FileNotFoundError("ไม่พบไฟล์ SRT ต้นฉบับ")
+
+        srt_hash = self._file_hash(srt_path)
+        latest = self.content_store.transcript_version(file_id)
+        if latest and latest["srt_hash"] == srt_hash:
+            return latest
+
+        cues = self.transcription_service.read_cues(srt_path)
+        changed = len(cues)
+        if latest and paths.transcript(latest["version"]).exists():
+            previous = self.transcription_service.read_cues(paths.transcript(latest["version"]))
+            changed = len(transcript_editor.changed_segments(previous, cues))
+        version = self.content_store.add_transcript_version(file_id, srt_hash, len(cues), changed)
+        shutil.copyfile(srt_path, paths.transcript(version))
+        return self.content_store.transcript_version(file_id, version)
+
+    def edit_transcript(self, file_id: str, edits: List[dict], base_version: Optional[int] = None) -> dict:
+        """แก้ไข SRT ต้นฉบับทีละ segment และบันทึกเป็นเวอร์ชันใหม่
+
+        edits use the indices of the latest version (see
+        ``transcript_editor.apply_edits``). With base_version, the edits
+        are rejected with TranscriptVersionConflict if someone saved a
+        newer version in the meantime. Translations are not touched here;
+        ``retranslate_changes`` brings them up to date.
+        """
+        with self._transcript_lock:
+            paths = self.paths(file_id)
+            srt_path = paths.srt("original")
+            base = self.transcript_version(file_id)
+            if base_version is not None and base_version != base["version"]:
+                raise TranscriptVersionConflict(base["version"])
+
+            previous = self.transcription_service.read_cues(srt_path)
+            current = transcript_editor.apply_edits(previous, edits)
+            changed = transcript_editor.changed_segments(previous, current)
+
+            work_path = srt_path.with_name(srt_path.name + ".tmp")
+            subtitle_io.write(work_path, current, "srt")
+            srt_hash = self._file_hash(work_path)
+            if srt_hash == base["srt_hash"]:
+                work_path.unlink()
+                version = base["version"]
+            else:
+                version = self.content_store.add_transcript_version(
+                    file_id, srt_hash, len(current), len(changed), base["version"]
+                )
+                if version is None:
+                    work_path.unlink()
+                    raise TranscriptVersionConflict(self.content_store.transcript_version(file_id)["version"])
+                shutil.copyfile(work_path, paths.transcript(version))
+                os.replace(work_path, srt_path)
+                self.content_store.record(file_id, "srt", srt_path, "original", duration=current.end_time)
+
+        return {
+            "file_id": file_id,
+            "version": version,
+            "previous_version": base["version"],
+            "segments": len(current),
+            "changed_segments": changed,
+            "message": f"บันทึก transcript เวอร์ชัน {version} แล้ว (แก้ไข {len(changed)} segment)"
+        }
+
+    async def retranslate_changes(self, file_id: str, since_version: Optional[int] = None) -> dict:
+        """แปลเฉพาะ segment ที่เปลี่ยนไปในทุกภาษาที่แปลไว้แล้ว
+
+        Each translation records the hash of the transcript it was made
+        from; that version is diffed against the current one and the
+        translated text of every unchanged segment is spliced back in, so
+        only new or reworded segments go to the translation API.
+        Translations from before versioning are diffed against
+        since_version when they line up with it, and retranslated in full
+        otherwise. Retranslated lines use the style_prompt the translation
+        was made with, so an edit never changes its style.
+        """
+        paths = self.paths(file_id)
+        srt_path = paths.srt("original")
+        if not srt_path.exists():
+            raise FileNotFoundError("ไม่พบไฟล์ SRT ต้นฉบับ")
+
+        read_cues = self.transcription_service.read_cues
+        current = await asyncio.to_thread(read_cues, srt_path)
+        current_hash = await asyncio.to_thread(self._file_hash, srt_path)
+        languages = [
+            language for language in await asyncio.to_thread(self.content_store.languages, file_id)
+            if language != "original"
+        ]
+        semaphore = asyncio.Semaphore(self.translation_service.concurrency)
+
+        async def update_language(language: str) -> dict:
+            usage = TranslationUsage()
+            artifact = await asyncio.to_thread(self.content_store.artifact, file_id, "srt", language)
+            source_hash = artifact["input_key"] if artifact else None
+            style_prompt = artifact["style_prompt"] if artifact else None
+            if source_hash == current_hash:
+                return {"target_language": language, "retranslated": 0, "reused": len(current),
+                        "usage": usage.to_dict(), "error": None}
+
+            if source_hash:
+                base = await asyncio.to_thread(self.content_store.transcript_version, file_id, None, source_hash)
+            elif since_version:
+                base = await asyncio.to_thread(self.content_store.transcript_version, file_id, since_version)
+            else:
+                base = None
+            if base and paths.transcript(base["version"]).exists():
+                previous = await asyncio.to_thread(read_cues, paths.transcript(base["version"]))
+                translation = await asyncio.to_thread(read_cues, paths.srt(language))
+                texts = transcript_editor.splice_translation(previous, current, translation)
+            else:
+                texts = [None] * len(current)
+
+            pending = [index for index, text in enumerate(texts) if text is None]
+            translated = await self.translation_service.translate_lines(
+                [current.texts[index] for index in pending], language, style_prompt, semaphore, usage
+            )
+            for index, text in zip(pending, translated):
+                texts[index] = text
+
+            output_path = paths.srt(language)
+            await asyncio.to_thread(subtitle_io.write, output_path, current.with_texts(texts), "srt")
+            await self._record(file_id, "srt", output_path, language, input_key=current_hash,
+                               style_prompt=style_prompt)
+            return {"target_language": language, "retranslated": len(pending),
+                    "reused": len(current) - len(pending), "usage": usage.to_dict(), "error": None}
+
+        outcomes = await asyncio.gather(*(update_language(language) for language in languages), return_exceptions=True)
+        results = [
+            {"target_language": language, "retranslated": 0, "reused": 0, "usage": None,
+             "error": f"การแปลล้มเหลว: {str(outcome)}"}
+            if isinstance(outcome, Exception) else outcome
+            for language, outcome in zip(languages, outcomes)
+        ]
+        retranslated = sum(result["retranslated"] for result in results)
+        return {
+            "file_id": file_id,
+            "results": results,
+            "message": f"แปลใหม่ {retranslated} segment ใน {len(results)} ภาษา"
+        }
+
+    async def embed_subtitles(self, file_id: str, language: str = "original", subtitle_type: str = "hard",
+                              on_progress: Optional[ProgressCallback] = None, container: str = "mp4",
+                              default_language: Optional[str] = None) -> dict:
+        """ฝัง subtitle เข้ากับวิดีโอ (hard หรือ soft)
+
+        language "all" (soft only) muxes every language with an SRT as a
+        separate track in one pass. container is mp4 or mkv (soft only).
+        """
+        paths = self.paths(file_id)
+        video_path = self.find_video(file_id)
+        if not video_path:
+            raise FileNotFoundError("ไม่พบไฟล์วิดีโอต้นฉบับ")
+        if container not in SOFT_SUBTITLE_CODECS or (subtitle_type == "hard" and container != "mp4"):
+            raise ValueError(f"ไม่รองรับไฟล์ {container} สำหรับ {subtitle_type} subtitle")
+
+        if language == "all":
+            if subtitle_type == "hard":
+                raise ValueError("hard subtitle ฝังได้ครั้งละภาษาเดียว")
+            languages = await asyncio.to_thread(self.content_store.languages, file_id)
+        else:
+            languages = [language]
+        tracks = [(track_language, paths.srt(track_language)) for track_language in languages]
+        if not tracks or not all(srt_path.exists() for _, srt_path in tracks):
+            raise FileNotFoundError("ไม่พบไฟล์ SRT")
+        if default_language not in languages:
+            default_language = languages[0]
+
+        output_path = paths.embedded(language, subtitle_type, container)
+        output_filename = output_path.name
+        variant = subtitle_type if container == "mp4" else f"{subtitle_type}-{container}"
+        result = {
+            "file_id": file_id,
+            "language": language,
+            "languages": languages,
+            "type": subtitle_type,
+            "container": container,
+            "output_path": str(output_path),
+            "output_filename": output_filename
+        }
+
+        # Same video, same subtitle text and same settings give the same output
+        if subtitle_type == "hard":
+            settings = f"hard|{HARD_SUBTITLE_STYLE}"
+        else:
+            settings = f"soft|{SOFT_SUBTITLE_CODECS[container]}|default={default_language}"
+        input_key = await asyncio.to_thread(self._embed_key, file_id, video_path, tracks, settings)
+        indexed = await asyncio.to_thread(self.content_store.artifact, file_id, "embed", language, variant)
+        if indexed and indexed["input_key"] == input_key and output_path.exists():
+            print(f"Reusing embedded video: {output_path}")
+            return {
+                **result,
+                "reused": True,
+                "message": f"ฝัง {subtitle_type} subtitle สำเร็จ (ใช้ไฟล์เดิม วิดีโอและ subtitle ไม่เปลี่ยน)"
+            }
+        # The old output is about to be overwritten; a failed encode must not look reusable
+        await asyncio.to_thread(self.content_store.forget, file_id, "embed", language, variant)
+
+        if subtitle_type == "soft":
+            await self.video_processor.embed_subtitles_soft(
+                video_path, tracks, output_path, on_progress, default_language
+            )
+        else:
+            # Segment planning reads the keyframes from the stored probe; the
+            # first burn of a video lists them
+            media = await asyncio.to_thread(
+                self.media_info, file_id, self.video_processor.segmented_mode != "off"
+            )
+            result["burn"] = await self.video_processor.embed_subtitles(
+                video_path, tracks[0][1], output_path, on_progress, media
+            )
+        video = await asyncio.to_thread(self.content_store.get, file_id)
+        await asyncio.to_thread(
+            self.content_store.record, file_id, "embed", output_path, language, variant,
+            video["duration"] if video else None, input_key
+        )
+
+        return {
+            **result,
+            "reused": False,
+            "message": f"ฝัง {subtitle_type} subtitle สำเร็จ" + (f" ({len(tracks)} ภาษา)" if len(tracks) > 1 else "")
+        }
+
+    async def package_hls(self, file_id: str) -> dict:
+        """แปลงวิดีโอเป็น HLS (stream copy) เพื่อใช้คู่กับ subtitle แบบแบ่ง segment"""
+        paths = self.paths(file_id)
+        video_path = self.find_video(file_id)
+        if not video_path:
+            raise FileNotFoundError("ไม่พบไฟล์วิดีโอต้นฉบับ")
+
+        playlist = paths.hls / "index.m3u8"
+        reused = playlist.exists()
+        if not reused:
+            await self.video_processor.scheduler.run(
+                MUX, self.hls_packager.package_video, str(video_path), str(paths.hls)
+            )
+            video = await asyncio.to_thread(self.content_store.get, file_id)
+            await self._record(file_id, "hls", playlist, duration=video["duration"] if video else None)
+
+        return {
+            "file_id": file_id,
+            "master_url": f"/hls/{file_id}/master.m3u8",
+            "reused": reused,
+            "message": "สร้าง HLS สำเร็จ" if not reused else "มี HLS ของวิดีโอนี้อยู่แล้ว"
+        }
+
+    async def run_job(self, job_type: str, payload: dict, on_progress: Optional[ProgressCallback] = None) -> dict:
+        """Dispatch a queued job to the matching pipeline step"""
+        if job_type == "transcribe":
+            return await self.transcribe(payload["file_id"], payload.get("force", False))
+        if job_type == "translate":
+            if payload.get("incremental"):
+                return await self.retranslate_changes(payload["file_id"], payload.get("since_version"))
+            if payload.get("targets"):
+                targets = [(target["target_language"], target.get("style_prompt")) for target in payload["targets"]]
+                return await self.translate_multi(payload["file_id"], targets)
+            return await self.translate(payload["file_id"], payload["target_language"], payload.get("style_prompt"))
+        if job_type == "embed":
+            return await self.embed_subtitles(
+                payload["file_id"],
+                payload.get("language", "original"),
+                payload.get("type", "hard"),
+                on_progress,
+                payload.get("container", "mp4"),
+                payload.get("default_language")
+            )
+        if job_type == "package":
+            return await self.package_hls(payload["file_id"])
+        raise ValueError(f"Unknown job type: {job_type}")
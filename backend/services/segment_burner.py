@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services import subtitle_io
+from services.encode_scheduler import EncodeScheduler, BURN, MUX
+from services.ffmpeg_progress import FFmpegProgress, run_ffmpeg
+from services.media_probe import probe_keyframes
+
+
+def plan_ranges(duration: float, keyframes: List[float], target_seconds: float) -> List[Tuple[float, float]]:
+    """Cut at the first keyframe at or after every ``target_seconds``.
+
+    Every range starts on a keyframe so each piece can be encoded on its
+    own and joined with a stream copy. Keyframes too close to (or past)
+    the end are not cut at; a zero or unknown duration has no ranges.
+    """
+    if not duration or duration <= 0:
+        return []
+    cuts = [0.0]
+    for keyframe in keyframes:
+        if keyframe - cuts[-1] >= target_seconds and duration - keyframe >= target_seconds / 4:
+            cuts.append(keyframe)
+    return list(zip(cuts, cuts[1:] + [duration]))
+
+
+def nearest_boundaries(starts: List[float], keyframes: List[float], duration: float,
+                       tolerance: float = 0.5) -> Optional[List[float]]:
+    """Keyframe times in a burned output where each range starts, plus its duration.
+
+    Every encoded range starts with a keyframe, so range i begins at the
+    output keyframe closest to ``starts[i]``. None if one is missing.
+    """
+    if not keyframes:
+        return None
+    boundaries = []
+    for start in starts:
+        keyframe = min(keyframes, key=lambda time: abs(time - start))
+        if abs(keyframe - start) > tolerance:
+            return None
+        boundaries.append(keyframe)
+    return boundaries + [duration]
+
+
+class SegmentBurner:
+    """Burn hard subtitles into keyframe-aligned ranges in parallel.
+
+    Each range gets its own subtitle file with times shifted to start at
+    zero and is encoded as a separate job in the scheduler's burn lane.
+    The video pieces are then joined with the concat demuxer and the
+    original audio is copied across in one go, so there are no audio
+    gaps at the joins. A range that fails or times out is retried on its
+    own; the others are kept.
+
+    Next to each output, ``{output}.ranges.json`` records the ranges, a
+    hash of each range's subtitle file and where each range starts in the
+    output. Burning the same video again after an SRT edit only encodes
+    the ranges whose subtitles changed; runs of unchanged ranges are
+    stream-copied out of the previous output.
+
+    Settings (env): BURN_SEGMENT_SECONDS (120), BURN_SEGMENT_RETRIES (2),
+    BURN_SEGMENT_TIMEOUT (600).
+    """
+
+    def __init__(self, scheduler: EncodeScheduler, transcription_service):
+        self.scheduler = scheduler
+        # Only used for SRT parsing
+        self.transcription_service = transcription_service
+        self.segment_seconds = float(os.getenv("BURN_SEGMENT_SECONDS", "120"))
+        self.retries = int(os.getenv("BURN_SEGMENT_RETRIES", "2"))
+        self.timeout = float(os.getenv("BURN_SEGMENT_TIMEOUT", "600"))
+
+    async def plan(self, video_path: Path, media: Optional[dict] = None) -> Tuple[float, List[Tuple[float, float]]]:
+        """Ranges to burn; the keyframes come from the stored probe of the video when there is one"""
+        if media and media.get("keyframes"):
+            duration, keyframes = media["duration"], media["keyframes"]
+        else:
+            loop = asyncio.get_event_loop()
+            duration, keyframes = await loop.run_in_executor(None, probe_keyframes, video_path)
+        return duration, plan_ranges(duration, keyframes, self.segment_seconds)
+
+    @staticmethod
+    def _manifest_path(output_path: Path) -> Path:
+        return output_path.with_name(output_path.name + ".ranges.json")
+
+    def _render_key(self, video_path: Path, style: str) -> str:
+        """Everything besides the subtitles that decides how a range is encoded"""
+        stat = video_path.stat()
+        key = f"{video_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}|{style}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _previous_render(self, output_path: Path, render_key: str,
+                         ranges: List[Tuple[float, float]]) -> Optional[dict]:
+        """Manifest of the output on disk, if it was burned from the same video, style and ranges"""
+        try:
+            manifest = json.loads(self._manifest_path(output_path).read_text(encoding="utf-8"))
+            stat = output_path.stat()
+        except (OSError, ValueError):
+            return None
+        if (manifest.get("render_key") != render_key
+                or manifest.get("output") != [stat.st_size, stat.st_mtime_ns]
+                or [tuple(r) for r in manifest.get("ranges", [])] != [tuple(r) for r in ranges]
+                or not manifest.get("boundaries")):
+            return None
+        return manifest
+
+    def _write_manifest(self, output_path: Path, render_key: str, ranges: List[Tuple[float, float]],
+                        piece_keys: List[str]):
+        duration, keyframes = probe_keyframes(output_path)
+        stat = output_path.stat()
+        manifest = {
+            "render_key": render_key,
+            "ranges": [list(r) for r in ranges],
+            "keys": piece_keys,
+            "boundaries": nearest_boundaries([start for start, _ in ranges], keyframes, duration),
+            "output": [stat.st_size, stat.st_mtime_ns]
+        }
+        manifest_path = self._manifest_path(output_path)
+        work_path = manifest_path.with_name(manifest_path.name + ".tmp")
+        work_path.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(work_path, manifest_path)
+
+    async def burn(self, video_path: Path, srt_path: Path, output_path: Path, style: str,
+                   ranges: List[Tuple[float, float]], on_progress=None) -> Dict[str, float]:
+        """Burn srt_path into video_path, encoding only ranges that differ from the last burn.
+
+        Returns how many ranges there were, how many were encoded and how
+        many seconds of video that was.
+        """
+        loop = asyncio.get_event_loop()
+        cues = self.transcription_service.read_cues(srt_path)
+        render_key = await loop.run_in_executor(None, self._render_key, video_path, style)
+        previous = await loop.run_in_executor(None, self._previous_render, output_path, render_key, ranges)
+
+        with tempfile.TemporaryDirectory(dir=output_path.parent, prefix=".burn-") as work_dir:
+            work_dir = Path(work_dir)
+            pieces = []
+            piece_keys = []
+            for index, (start, end) in enumerate(ranges):
+                piece_srt = work_dir / f"{index:04d}.srt"
+                content = subtitle_io.dumps(cues.window(start, end), "srt")
+                piece_srt.write_text(content, encoding="utf-8")
+                piece_keys.append(hashlib.sha256(content.encode("utf-8")).hexdigest())
+                pieces.append((index, start, end, piece_srt, work_dir / f"{index:04d}.mp4"))
+
+            reused = set()
+            if previous:
+                reused = {index for index, key in enumerate(piece_keys) if previous["keys"][index] == key}
+            encode = [piece for piece in pieces if piece[0] not in reused]
+            aggregate = _ProgressAggregator(len(encode), sum(end - start for _, start, end, _, _ in encode), on_progress)
+
+            print(f"Burning {len(encode)} of {len(pieces)} segments of ~{self.segment_seconds:.0f}s in parallel"
+                  + (f", copying {len(reused)} unchanged from the previous output" if reused else ""))
+            await asyncio.gather(
+                *[
+                    self._burn_piece(video_path, piece, style, aggregate, position,
+                                     last=piece[0] == len(pieces) - 1)
+                    for position, piece in enumerate(encode)
+                ],
+                *[
+                    self.scheduler.run(
+                        MUX, self._copy_run, str(output_path),
+                        previous["boundaries"][first], previous["boundaries"][last + 1],
+                        str(work_dir / f"{first:04d}.mp4")
+                    )
+                    for first, last in _runs(sorted(reused))
+                ]
+            )
+
+            # A run of reused ranges is one file, named after its first range
+            list_path = work_dir / "pieces.txt"
+            list_path.write_text(
+                "".join(f"file '{piece[4]}'\n" for piece in pieces if piece[4].exists()), encoding="utf-8"
+            )
+            joined_path = work_dir / f"joined{output_path.suffix}"
+            await self.scheduler.run(MUX, self._concat, str(list_path), str(video_path), str(joined_path))
+            os.replace(joined_path, output_path)
+
+        aggregate.finish()
+        try:
+            await loop.run_in_executor(None, self._write_manifest, output_path, render_key, ranges, piece_keys)
+        except Exception as e:
+            # The output is fine; the next burn just cannot reuse it
+            print(f"Could not record burned ranges: {str(e)}")
+            self._manifest_path(output_path).unlink(missing_ok=True)
+
+        return {
+            "ranges": len(pieces),
+            "encoded_ranges": len(encode),
+            "encoded_seconds": round(sum(end - start for _, start, end, _, _ in encode), 3)
+        }
+
+    async def _burn_piece(self, video_path: Path, piece: tuple, style: str, aggregate: "_ProgressAggregator",
+                          position: int, last: bool):
+        index, start, end, piece_srt, piece_path = piece
+        for attempt in range(1, self.retries + 2):
+            aggregate.reset(position)
+            try:
+                await self.scheduler.run(
+                    BURN,
+                    self._encode_piece,
+                    str(video_path), start, None if last else end - start,
+                    str(piece_srt), str(piece_path), style,
+                    lambda progress: aggregate.update(position, progress)
+                )
+                return
+            except Exception as e:
+                if attempt > self.retries:
+                    raise Exception(f"segment {index} ({start:.1f}-{end:.1f}s) ล้มเหลว: {str(e)}")
+                print(f"segment {index} ({start:.1f}-{end:.1f}s) failed, retrying: {str(e)}")
+
+    def _encode_piece(self, video_path: str, start: float, duration: Optional[float], srt_path: str,
+                      output_path: str, style: str, on_progress, threads: int = 0):
+        cmd = ['ffmpeg', '-ss', f"{start:.6f}", '-i', video_path]
+        if duration is not None:
+            cmd += ['-t', f"{duration:.6f}"]
+        cmd += [
+            '-map', '0:v:0',
+            '-vf', f"subtitles='{srt_path}':force_style='{style}'",
+            '-an', '-sn', '-dn',
+            '-c:v', 'libx264',
+            '-preset', 'ultrafast',
+            '-crf', '23',
+            '-threads', str(threads),
+            '-y',
+            output_path
+        ]
+        try:
+            run_ffmpeg(cmd, on_progress=on_progress, timeout=self.timeout, duration=duration)
+        except subprocess.TimeoutExpired:
+            raise Exception(f"timeout หลัง {self.timeout:.0f} วินาที")
+        except subprocess.CalledProcessError as e:
+            raise Exception(e.stderr.strip().splitlines()[-1] if e.stderr.strip() else f"exit {e.returncode}")
+
+    def _copy_run(self, previous_output: str, start: float, end: float, output_path: str, threads: int = 0):
+        """Stream-copy [start, end) of a previous output; both ends are keyframes of it"""
+        cmd = [
+            'ffmpeg',
+            '-ss', f"{start:.6f}",
+            '-i', previous_output,
+            '-t', f"{max(end - start - 0.001, 0.001):.6f}",   # Stop just short of the next range's keyframe
+            '-map', '0:v:0',
+            '-an', '-sn', '-dn',
+            '-c', 'copy',
+            '-y',
+            output_path
+        ]
+        try:
+            run_ffmpeg(cmd)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"การคัดลอกช่วงเดิม ({start:.1f}-{end:.1f}s) ล้มเหลว: {e.stderr.strip()}")
+
+    def _concat(self, list_path: str, video_path: str, output_path: str, threads: int = 0):
+        cmd = [
+            'ffmpeg',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-i', video_path,
+            '-map', '0:v:0',
+            '-map', '1:a?',             # Original audio, copied once for the whole file
+            '-c', 'copy',
+            '-movflags', '+faststart',
+            '-y',
+            output_path
+        ]
+        try:
+            run_ffmpeg(cmd)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"การรวม segment ล้มเหลว: {e.stderr.strip()}")
+
+
+def _runs(indices: List[int]) -> List[Tuple[int, int]]:
+    """(first, last) of each run of consecutive indices"""
+    runs = []
+    for index in indices:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+
+class _ProgressAggregator:
+    """Combine per-segment ffmpeg progress into one report for the whole file"""
+
+    def __init__(self, count: int, duration: float, on_progress):
+        self.on_progress = on_progress
+        self.times = [0.0] * count
+        self.frames = [0] * count
+        self.progress = FFmpegProgress()
+        self.progress.duration = duration
+        self._lock = threading.Lock()
+        self._started = None
+
+    def reset(self, index: int):
+        with self._lock:
+            self.times[index] = 0.0
+            self.frames[index] = 0
+
+    def update(self, index: int, piece: FFmpegProgress):
+        if not self.on_progress:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._started is None:
+                self._started = now - piece.elapsed
+            self.times[index] = piece.time
+            self.frames[index] = piece.frame
+            self.progress.time = sum(self.times)
+            self.progress.frame = sum(self.frames)
+            self.progress.elapsed = now - self._started
+            self.progress.fps = round(self.progress.frame / self.progress.elapsed, 2) if self.progress.elapsed else 0.0
+            self.progress.speed = round(self.progress.time / self.progress.elapsed, 2) if self.progress.elapsed else 0.0
+            self.on_progress(self.progress)
+
+    def finish(self):
+        if not self.on_progress:
+            return
+        with self._lock:
+            self.progress.time = self.progress.duration or self.progress.time
+            self.progress.done = True
+            self.on_progress(self.progress)
@@ -0,0 +1,357 @@
+"""Reading and writing SRT, WebVTT and ASS subtitles.
+
+Cues are kept in a ``CueList``: two ``array('d')`` columns for the start
+and end times plus a list of texts, so a long transcript costs a few
+dozen bytes per cue instead of one pydantic object each. Convert to
+``SubtitleSegment`` only where a model is needed (API responses,
+TranscriptionResult).
+
+Parsers read line by line from any iterable of lines (an open file, a
+list, a generator) and tolerate CRLF, a BOM, missing or extra blank
+lines, missing cue numbers and ``.``/``,`` as the millisecond separator.
+Writers format timestamps a block at a time and write each block with a
+single ``write`` call.
+"""
+import re
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from models.subtitle_models import SubtitleSegment
+
+FORMATS = ("srt", "vtt", "ass")
+
+# Cues formatted and written per write() call
+WRITE_BLOCK_SIZE = 4096
+
+Cue = Tuple[float, float, str]
+
+_TIMESTAMP = r"(?:(\d+):)?(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?"
+_TIMING_RE = re.compile(rf"^\s*{_TIMESTAMP}\s*-->\s*{_TIMESTAMP}")
+_ASS_TIME_RE = re.compile(r"^\s*(\d+):(\d{1,2}):(\d{1,2})(?:\.(\d{1,3}))?\s*$")
+_ASS_OVERRIDE_RE = re.compile(r"\{[^}]*\}")
+
+# "MM:SS" for every second of an hour, so formatting is one lookup per cue
+_MINUTES_SECONDS = [f"{m:02d}:{s:02d}" for m in range(60) for s in range(60)]
+
+
+class CueList:
+    """Subtitle cues in parallel arrays: ``starts``, ``ends`` (seconds) and ``texts``"""
+
+    __slots__ = ("starts", "ends", "texts")
+
+    def __init__(self, cues: Iterable[Cue] = ()):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.texts: List[str] = []
+        self.extend(cues)
+
+    def append(self, start: float, end: float, text: str):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.texts.append(text)
+
+    def extend(self, cues: Iterable[Cue]):
+        for start, end, text in cues:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.texts.append(text)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __iter__(self) -> Iterator[Cue]:
+        return zip(self.starts, self.ends, self.texts)
+
+    def __getitem__(self, index):
+        """A cue, or a CueList for a slice"""
+        if isinstance(index, slice):
+            cues = CueList()
+            cues.starts = self.starts[index]
+            cues.ends = self.ends[index]
+            cues.texts = self.texts[index]
+            return cues
+        return self.starts[index], self.ends[index], self.texts[index]
+
+    @property
+    def end_time(self) -> float:
+        return max(self.ends) if self.ends else 0.0
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[SubtitleSegment]) -> "CueList":
+        return cls((segment.start, segment.end, segment.text) for segment in segments)
+
+    def to_segments(self) -> List[SubtitleSegment]:
+        return [SubtitleSegment(start=start, end=end, text=text) for start, end, text in self]
+
+    def with_texts(self, texts: List[str]) -> "CueList":
+        """Same timings, new texts (e.g. a translation)"""
+        if len(texts) != len(self):
+            raise ValueError(f"expected {len(self)} texts, got {len(texts)}")
+        cues = CueList()
+        cues.starts = array("d", self.starts)
+        cues.ends = array("d", self.ends)
+        cues.texts = list(texts)
+        return cues
+
+    def window(self, start: float, end: float) -> "CueList":
+        """Cues visible in [start, end), clipped to it and moved so start becomes 0"""
+        cues = CueList()
+        for cue_start, cue_end, text in self:
+            if cue_end <= start or cue_start >= end:
+                continue
+            cues.append(max(cue_start, start) - start, min(cue_end, end) - start, text)
+        return cues
+
+
+# --- timestamps ---
+
+def _seconds(hours: Optional[str], minutes: str, seconds: str, fraction: Optional[str]) -> float:
+    value = int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+    if fraction:
+        value += int(fraction) / 10 ** len(fraction)
+    return value
+
+
+def parse_timestamp(value: str) -> float:
+    """``01:02:03,456``, ``01:02:03.456`` or ``02:03.456`` to seconds"""
+    match = re.fullmatch(_TIMESTAMP, value.strip())
+    if not match:
+        raise ValueError(f"invalid timestamp: {value!r}")
+    return _seconds(*match.groups())
+
+
+def format_timestamps(seconds: Iterable[float], separator: str = ",") -> List[str]:
+    """``HH:MM:SS,mmm`` for each value, rounded to the millisecond"""
+    table = _MINUTES_SECONDS
+    formatted = []
+    for value in seconds:
+        total_ms = int(value * 1000 + 0.5) if value > 0 else 0
+        total_seconds, ms = divmod(total_ms, 1000)
+        hours, rest = divmod(total_seconds, 3600)
+        formatted.append(f"{hours:02d}:{table[rest]}{separator}{ms:03d}")
+    return formatted
+
+
+def format_ass_timestamps(seconds: Iterable[float]) -> List[str]:
+    """``H:MM:SS.cc`` for each value, rounded to the centisecond"""
+    table = _MINUTES_SECONDS
+    formatted = []
+    for value in seconds:
+        total_cs = int(value * 100 + 0.5) if value > 0 else 0
+        total_seconds, cs = divmod(total_cs, 100)
+        hours, rest = divmod(total_seconds, 3600)
+        formatted.append(f"{hours}:{table[rest]}.{cs:02d}")
+    return formatted
+
+
+# --- parsers ---
+
+def iter_srt(lines: Iterable[str]) -> Iterator[Cue]:
+    """Cues of an SRT (or WebVTT body) given line by line.
+
+    A cue starts at a timing line and runs to the next blank line. A
+    number right before a timing line is the cue number and is dropped,
+    even when the blank line before it is missing.
+    """
+    timing = None
+    text: List[str] = []
+    for line in lines:
+        line = line.rstrip("\r\n").lstrip("\ufeff")
+        match = _TIMING_RE.match(line) if "-->" in line else None
+        if match:
+            if timing is not None:
+                if text and text[-1].strip().isdigit():
+                    text.pop()
+                yield timing[0], timing[1], "\n".join(text).strip()
+            groups = match.groups()
+            timing = (_seconds(*groups[:4]), _seconds(*groups[4:]))
+            text = []
+        elif timing is not None:
+            if line.strip():
+                text.append(line.rstrip())
+            elif text:
+                yield timing[0], timing[1], "\n".join(text).strip()
+                timing = None
+                text = []
+    if timing is not None:
+        yield timing[0], timing[1], "\n".join(text).strip()
+
+
+def iter_vtt(lines: Iterable[str]) -> Iterator[Cue]:
+    """Cues of a WebVTT file; NOTE, STYLE and REGION blocks are skipped"""
+    def body():
+        skipping = False
+        for line in lines:
+            stripped = line.strip().lstrip("\ufeff")
+            if not stripped:
+                skipping = False
+                yield line
+            elif skipping:
+                continue
+            elif stripped.startswith(("WEBVTT", "NOTE", "STYLE", "REGION")) and "-->" not in stripped:
+                skipping = True
+            else:
+                yield line
+
+    # Cue settings after the end time are ignored; tags like <i> stay in the text
+    yield from iter_srt(body())
+
+
+def iter_ass(lines: Iterable[str]) -> Iterator[Cue]:
+    """Dialogue lines of an ASS/SSA file, with override tags removed"""
+    in_events = False
+    fields = ["layer", "start", "end", "style", "name", "marginl", "marginr", "marginv", "effect", "text"]
+    for line in lines:
+        line = line.strip().lstrip("\ufeff")
+        if line.startswith("["):
+            in_events = line.lower() == "[events]"
+            continue
+        if not in_events:
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key = key.strip().lower()
+        if key == "format":
+            fields = [field.strip().lower() for field in value.split(",")]
+        elif key == "dialogue":
+            values = value.lstrip().split(",", len(fields) - 1)
+            if len(values) < len(fields):
+                continue
+            row = dict(zip(fields, values))
+            start = _ASS_TIME_RE.match(row.get("start", ""))
+            end = _ASS_TIME_RE.match(row.get("end", ""))
+            if not start or not end:
+                continue
+            text = _ASS_OVERRIDE_RE.sub("", row.get("text", ""))
+            text = text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+            yield _seconds(*start.groups()), _seconds(*end.groups()), text.strip()
+
+
+_PARSERS = {"srt": iter_srt, "vtt": iter_vtt, "ass": iter_ass}
+
+
+def detect_format(path: Path) -> str:
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix == "ssa":
+        return "ass"
+    if suffix not in FORMATS:
+        raise ValueError(f"unsupported subtitle format: {suffix or path}")
+    return suffix
+
+
+def read(path: Path, subtitle_format: Optional[str] = None) -> CueList:
+    """Read a subtitle file into a CueList (format from the suffix unless given)"""
+    parser = _PARSERS[subtitle_format or detect_format(path)]
+    # newline=None turns CRLF and CR into \n; utf-8-sig drops a BOM
+    with open(path, "r", encoding="utf-8-sig", newline=None) as f:
+        return CueList(parser(f))
+
+
+def parse(content: str, subtitle_format: str = "srt") -> CueList:
+    return CueList(_PARSERS[subtitle_format](content.splitlines()))
+
+
+# --- writers ---
+
+def _srt_blocks(cues: CueList, start_index: int = 1) -> Iterator[str]:
+    for offset in range(0, len(cues), WRITE_BLOCK_SIZE):
+        stop = offset + WRITE_BLOCK_SIZE
+        starts = format_timestamps(cues.starts[offset:stop])
+        ends = format_timestamps(cues.ends[offset:stop])
+        yield "".join([
+            f"{index}\n{start} --> {end}\n{text}\n\n"
+            for index, start, end, text in zip(
+                range(start_index + offset, start_index + stop), starts, ends, cues.texts[offset:stop]
+            )
+        ])
+
+
+def _vtt_blocks(cues: CueList, header: str = "WEBVTT") -> Iterator[str]:
+    yield f"{header}\n\n"
+    for offset in range(0, len(cues), WRITE_BLOCK_SIZE):
+        stop = offset + WRITE_BLOCK_SIZE
+        starts = format_timestamps(cues.starts[offset:stop], ".")
+        ends = format_timestamps(cues.ends[offset:stop], ".")
+        yield "".join([
+            f"{start} --> {end}\n{text}\n\n"
+            for start, end, text in zip(starts, ends, cues.texts[offset:stop])
+        ])
+
+
+ASS_HEADER = (
+    "[Script Info]\n"
+    "ScriptType: v4.00+\n"
+    "WrapStyle: 0\n"
+    "ScaledBorderAndShadow: yes\n"
+    "\n"
+    "[V4+ Styles]\n"
+    "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+    "Alignment, MarginL, MarginR, MarginV, Encoding\n"
+    "Style: Default,Tahoma,24,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,"
+    "0,0,0,0,100,100,0,0,1,2,0,2,10,10,30,1\n"
+    "\n"
+    "[Events]\n"
+    "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+)
+
+
+def _ass_blocks(cues: CueList) -> Iterator[str]:
+    yield ASS_HEADER
+    for offset in range(0, len(cues), WRITE_BLOCK_SIZE):
+        stop = offset + WRITE_BLOCK_SIZE
+        starts = format_ass_timestamps(cues.starts[offset:stop])
+        ends = format_ass_timestamps(cues.ends[offset:stop])
+        texts = [text.replace("\n", "\\N") for text in cues.texts[offset:stop]]
+        yield "".join([
+            f"Dialogue: 0,{start},{end},Default,,0,0,0,,{text}\n"
+            for start, end, text in zip(starts, ends, texts)
+        ])
+
+
+_WRITERS = {"srt": _srt_blocks, "vtt": _vtt_blocks, "ass": _ass_blocks}
+
+
+def dump(cues: CueList, f: TextIO, subtitle_format: str = "srt", header: Optional[str] = None):
+    """Write cues to an open text file, one write() per block.
+
+    header replaces the ``WEBVTT`` line of WebVTT output (e.g. to add
+    an HLS ``X-TIMESTAMP-MAP``); other formats ignore it.
+    """
+    options = {"header": header} if header and subtitle_format == "vtt" else {}
+    for block in _WRITERS[subtitle_format](cues, **options):
+        f.write(block)
+
+
+def dumps(cues: CueList, subtitle_format: str = "srt", header: Optional[str] = None) -> str:
+    options = {"header": header} if header and subtitle_format == "vtt" else {}
+    return "".join(_WRITERS[subtitle_format](cues, **options))
+
+
+def write(path: Path, cues: CueList, subtitle_format: Optional[str] = None):
+    """Write a subtitle file (format from the suffix unless given)"""
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        dump(cues, f, subtitle_format or detect_format(path))
+
+
+def append_srt(path: Path, cues: CueList, start_index: int = 1):
+    """Append cues to an SRT file, numbered from start_index, in a single write"""
+    with open(path, "a", encoding="utf-8", newline="\n") as f:
+        f.write("".join(_srt_blocks(cues, start_index)))
+
+
+def read_appended_srt(path: Path, offset: int = 0) -> Tuple[CueList, int]:
+    """Cues appended to an SRT file since byte offset, and the offset to continue from.
+
+    Only whole blocks are returned: a block still being written (no
+    blank line after it yet) is left for the next call.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n\n")
+    if end < 0:
+        return CueList(), offset
+    return parse(data[:end + 2].decode("utf-8"), "srt"), offset + end + 2
@@ -0,0 +1,104 @@
+from difflib import SequenceMatcher
+from typing import Iterable, List, Optional, Tuple
+
+from services.subtitle_io import CueList
+
+EDIT_OPS = ("update", "insert", "delete")
+
+
+class TranscriptVersionConflict(Exception):
+    """Raised when edits were made against a version that is no longer the latest"""
+
+    def __init__(self, latest_version: int):
+        super().__init__(f"transcript ถูกแก้ไขไปแล้ว (เวอร์ชันล่าสุดคือ {latest_version})")
+        self.latest_version = latest_version
+
+
+def apply_edits(cues: CueList, edits: Iterable[dict]) -> CueList:
+    """Apply segment-level edits to a transcript and return the new version.
+
+    Every edit refers to a segment index of ``cues`` (the version being
+    edited), so a batch of edits does not shift under itself:
+
+    - ``{"op": "update", "index": i, "text"?, "start"?, "end"?}``
+    - ``{"op": "delete", "index": i}``
+    - ``{"op": "insert", "index": i, "start", "end", "text"}`` adds a
+      segment before segment i (``i == len(cues)`` appends)
+    """
+    updates = {}
+    deleted = set()
+    inserts = {}
+    for edit in edits:
+        op = edit.get("op") or "update"
+        index = edit.get("index")
+        if op not in EDIT_OPS:
+            raise ValueError(f"ไม่รู้จักการแก้ไขแบบ {op}")
+        limit = len(cues) if op == "insert" else len(cues) - 1
+        if index is None or not 0 <= index <= limit:
+            raise ValueError(f"ไม่พบ segment ที่ {index}")
+        if op == "delete":
+            deleted.add(index)
+        elif op == "insert":
+            if edit.get("start") is None or edit.get("end") is None or edit.get("text") is None:
+                raise ValueError("การเพิ่ม segment ต้องระบุ start, end และ text")
+            inserts.setdefault(index, []).append((edit["start"], edit["end"], edit["text"]))
+        else:
+            if index in updates:
+                raise ValueError(f"segment ที่ {index} ถูกแก้ไขซ้ำ")
+            updates[index] = edit
+
+    edited = CueList()
+    for index in range(len(cues) + 1):
+        for cue in inserts.get(index, []):
+            edited.append(*_checked(*cue))
+        if index == len(cues) or index in deleted:
+            continue
+        start, end, text = cues[index]
+        edit = updates.get(index)
+        if edit:
+            start = start if edit.get("start") is None else edit["start"]
+            end = end if edit.get("end") is None else edit["end"]
+            text = text if edit.get("text") is None else edit["text"]
+            start, end, text = _checked(start, end, text)
+        edited.append(start, end, text)
+    return edited
+
+
+def _checked(start: float, end: float, text: str) -> Tuple[float, float, str]:
+    if start < 0 or end <= start:
+        raise ValueError(f"เวลาของ segment ไม่ถูกต้อง ({start} - {end})")
+    text = text.strip()
+    if not text:
+        raise ValueError("ข้อความของ segment ว่างเปล่า")
+    return start, end, text
+
+
+def changed_segments(previous: CueList, current: CueList) -> List[int]:
+    """Indices in ``current`` whose text is new, i.e. not carried over from ``previous``"""
+    changed = []
+    for tag, _, _, j1, j2 in _opcodes(previous, current):
+        if tag != "equal":
+            changed.extend(range(j1, j2))
+    return changed
+
+
+def splice_translation(previous: CueList, current: CueList, translation: CueList) -> List[Optional[str]]:
+    """Translated text for each segment of ``current``, None where it must be retranslated.
+
+    ``translation`` is the translation of ``previous``, segment for
+    segment. Segments are matched on their text, so a segment whose
+    timing changed or that moved because of an insert or delete keeps its
+    translation; only new or reworded segments come back as None.
+    """
+    if len(translation) != len(previous):
+        return [None] * len(current)
+    texts: List[Optional[str]] = [None] * len(current)
+    for tag, i1, i2, j1, j2 in _opcodes(previous, current):
+        if tag == "equal":
+            texts[j1:j2] = translation.texts[i1:i2]
+    return texts
+
+
+def _opcodes(previous: CueList, current: CueList):
+    # Mostly-equal sequences, so this stays close to linear for long transcripts
+    return SequenceMatcher(None, previous.texts, current.texts, autojunk=False).get_opcodes()
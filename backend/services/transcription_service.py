@@ -1,124 +1,171 @@
 import os
+import tempfile
 from pathlib import Path
-from openai import OpenAI
-from typing import List, Dict
+from typing import Awaitable, Callable, List, Dict, Optional
 import asyncio
 from models.subtitle_models import SubtitleSegment, TranscriptionResult
+from services.audio_splitter import AudioSplitter, AudioChunk
+from services.voice_activity import VoiceActivityDetector, TimeMap
+from services.ai_backends import TranscriptionBackend, create_transcription_backend
+from services import subtitle_io
+from services.subtitle_io import CueList
+
+# Whisper rejects uploads over 25 MB; keep a little headroom
+MAX_UPLOAD_BYTES = 24 * 1024 * 1024
+
+# Receives each batch of finalized segments, in order, while transcription runs
+SegmentsCallback = Callable[[List[SubtitleSegment]], Awaitable[None]]
 
 class TranscriptionService:
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, backend: Optional[TranscriptionBackend] = None):
+        self.backend = backend or create_transcription_backend()
+        self.audio_splitter = AudioSplitter()
+        self.voice_activity = VoiceActivityDetector()
+        self.concurrency = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
     
-    async def transcribe_with_timestamps(self, audio_path: Path) -> TranscriptionResult:
-        """ใช้ OpenAI ASR แกะเสียงพร้อม timestamp"""
+    async def transcribe_with_timestamps(self, audio_path: Path,
+                                         on_segments: Optional[SegmentsCallback] = None) -> TranscriptionResult:
+        """ใช้ OpenAI ASR แกะเสียงพร้อม timestamp
+
+        Non-speech is cut out first (see VoiceActivityDetector) and the
+        segment times are mapped back to the original audio; the result's
+        speech_trim reports the seconds and bytes that were not uploaded.
+        Chunks are transcribed in parallel but merged in order; as soon as
+        a chunk and every chunk before it are done, its new segments (on
+        the original timeline) are final and passed to on_segments.
+        """
         try:
-            with open(audio_path, "rb") as audio_file:
-                # Run transcription in thread pool to avoid blocking
-                loop = asyncio.get_event_loop()
+            loop = asyncio.get_event_loop()
+            
+            with tempfile.TemporaryDirectory(prefix="asr_chunks_") as tmp_dir:
+                speech = await loop.run_in_executor(None, self.voice_activity.trim, audio_path, Path(tmp_dir))
+                time_map = speech.time_map if speech else None
+                speech_trim = speech.stats if speech else None
+                if speech_trim:
+                    print(f"VAD: uploading {speech_trim['uploaded_seconds']:.0f}s of {speech_trim['original_seconds']:.0f}s "
+                          f"({speech_trim['saved_bytes']} bytes saved, {speech_trim['speech_regions']} speech regions)")
+                
+                chunks = await loop.run_in_executor(
+                    None,
+                    self._split_audio,
+                    speech.path if speech else audio_path,
+                    Path(tmp_dir)
+                )
                 
-                def transcribe_audio():
-                    return self.client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        response_format="verbose_json",
-                        timestamp_granularities=["segment"],
-                        language="th"
+                if len(chunks) == 1:
+                    # Short file: one request, keep the API's own full text
+                    transcript = await self._transcribe_file(chunks[0].path)
+                    segments = self._to_segments(transcript, 0.0, time_map)
+                    if on_segments and segments:
+                        await on_segments(segments)
+                    return TranscriptionResult(
+                        text=transcript.text,
+                        segments=segments,
+                        language=transcript.language,
+                        speech_trim=speech_trim
                     )
-
-                transcript = await loop.run_in_executor(None, transcribe_audio)
-            
-            # Convert segments to our format
-            segments = []
-            for segment in transcript.segments:
-                segments.append(SubtitleSegment(
-                    start=segment.start,
-                    end=segment.end,
-                    text=segment.text.strip()
-                ))
+                
+                print(f"Transcribing {len(chunks)} chunks with concurrency {self.concurrency}")
+                semaphore = asyncio.Semaphore(self.concurrency)
+                
+                async def transcribe_chunk(chunk: AudioChunk):
+                    async with semaphore:
+                        return await self._transcribe_file(chunk.path)
+                
+                tasks = [asyncio.ensure_future(transcribe_chunk(chunk)) for chunk in chunks]
+                segments: List[SubtitleSegment] = []
+                language = None
+                try:
+                    for chunk, task in zip(chunks, tasks):
+                        transcript = await task
+                        language = language or transcript.language
+                        finalized = len(segments)
+                        self._merge_into(segments, self._to_segments(transcript, chunk.offset, time_map))
+                        if on_segments and len(segments) > finalized:
+                            await on_segments(segments[finalized:])
+                finally:
+                    for task in tasks:
+                        task.cancel()
             
             return TranscriptionResult(
-                text=transcript.text,
+                text=" ".join(segment.text for segment in segments),
                 segments=segments,
-                language=transcript.language
+                language=language,
+                speech_trim=speech_trim
             )
             
         except Exception as e:
             raise Exception(f"การแกะเสียงล้มเหลว: {str(e)}")
     
+    def _split_audio(self, audio_path: Path, output_dir: Path) -> List[AudioChunk]:
+        """Split audio so each chunk fits both the duration and the upload size limit"""
+        file_size = audio_path.stat().st_size
+        duration = self.audio_splitter.get_duration(audio_path)
+        
+        max_chunk_seconds = self.audio_splitter.max_chunk_seconds
+        if file_size > MAX_UPLOAD_BYTES and duration > 0:
+            bytes_per_second = file_size / duration
+            max_chunk_seconds = min(max_chunk_seconds, 0.9 * MAX_UPLOAD_BYTES / bytes_per_second)
+        
+        if duration <= max_chunk_seconds:
+            return [AudioChunk(index=0, path=audio_path, offset=0.0, start=0.0, end=duration)]
+        
+        return self.audio_splitter.split(audio_path, output_dir, max_chunk_seconds)
+    
+    async def _transcribe_file(self, audio_path: Path) -> TranscriptionResult:
+        """Send one audio file to the ASR backend"""
+        return await self.backend.transcribe(audio_path)
+    
+    def _to_segments(self, transcript: TranscriptionResult, offset: float,
+                     time_map: Optional[TimeMap] = None) -> List[SubtitleSegment]:
+        """Shift a chunk's segments to the original timeline"""
+        segments = transcript.segments
+        if offset:
+            segments = [
+                SubtitleSegment(start=segment.start + offset, end=segment.end + offset, text=segment.text)
+                for segment in segments
+            ]
+        return time_map.remap(segments) if time_map else segments
+    
+    def _merge_into(self, merged: List[SubtitleSegment], segments: List[SubtitleSegment]):
+        """Append one chunk's segments, dropping duplicates heard in the overlap.
+
+        Segments already in merged are never changed.
+        """
+        for segment in segments:
+            if not segment.text:
+                continue
+            if merged and segment.start < merged[-1].end:
+                previous = merged[-1]
+                same_text = self._normalize_text(segment.text) == self._normalize_text(previous.text)
+                if same_text or segment.end <= previous.end:
+                    continue
+                # Partial overlap with new speech: start where the previous cue ended
+                segment = SubtitleSegment(start=previous.end, end=segment.end, text=segment.text)
+            merged.append(segment)
+    
+    def _normalize_text(self, text: str) -> str:
+        return "".join(text.split()).lower()
+    
     async def save_srt(self, transcription: TranscriptionResult, output_path: Path):
         """บันทึกผลลัพธ์เป็นไฟล์ SRT"""
         try:
-            srt_content = self._generate_srt_content(transcription.segments)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(srt_content)
-                
+            await asyncio.to_thread(subtitle_io.write, output_path, CueList.from_segments(transcription.segments), "srt")
         except Exception as e:
             raise Exception(f"ไม่สามารถบันทึกไฟล์ SRT ได้: {str(e)}")
     
-    def _generate_srt_content(self, segments: List[SubtitleSegment]) -> str:
-        """สร้างเนื้อหาไฟล์ SRT"""
-        srt_content = ""
-        
-        for i, segment in enumerate(segments, 1):
-            start_time = self._seconds_to_srt_time(segment.start)
-            end_time = self._seconds_to_srt_time(segment.end)
-            
-            srt_content += f"{i}\n"
-            srt_content += f"{start_time} --> {end_time}\n"
-            srt_content += f"{segment.text}\n\n"
-        
-        return srt_content
-    
-    def _seconds_to_srt_time(self, seconds: float) -> str:
-        """แปลงวินาทีเป็นรูปแบบเวลาของ SRT"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millisecs = int((seconds % 1) * 1000)
-        
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
+    def _generate_srt_content(self, segments) -> str:
+        """สร้างเนื้อหาไฟล์ SRT (จาก segments หรือ CueList)"""
+        cues = segments if isinstance(segments, CueList) else CueList.from_segments(segments)
+        return subtitle_io.dumps(cues, "srt")
     
-    def parse_srt_file(self, srt_path: Path) -> List[SubtitleSegment]:
-        """อ่านไฟล์ SRT และแปลงเป็น segments"""
+    def read_cues(self, srt_path: Path) -> CueList:
+        """อ่านไฟล์ subtitle (SRT, WebVTT หรือ ASS) เป็น CueList"""
         try:
-            with open(srt_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            segments = []
-            blocks = content.strip().split('\n\n')
-            
-            for block in blocks:
-                lines = block.strip().split('\n')
-                if len(lines) >= 3:
-                    # Parse timestamp line
-                    timestamp_line = lines[1]
-                    start_str, end_str = timestamp_line.split(' --> ')
-                    
-                    start_seconds = self._srt_time_to_seconds(start_str)
-                    end_seconds = self._srt_time_to_seconds(end_str)
-                    
-                    # Join text lines
-                    text = '\n'.join(lines[2:])
-                    
-                    segments.append(SubtitleSegment(
-                        start=start_seconds,
-                        end=end_seconds,
-                        text=text
-                    ))
-            
-            return segments
-            
+            return subtitle_io.read(srt_path)
         except Exception as e:
             raise Exception(f"ไม่สามารถอ่านไฟล์ SRT ได้: {str(e)}")
     
-    def _srt_time_to_seconds(self, time_str: str) -> float:
-        """แปลงเวลาจากรูปแบบ SRT เป็นวินาที"""
-        time_part, ms_part = time_str.split(',')
-        h, m, s = map(int, time_part.split(':'))
-        ms = int(ms_part)
-        
-        return h * 3600 + m * 60 + s + ms / 1000
\ No newline at end of file
+    def parse_srt_file(self, srt_path: Path) -> List[SubtitleSegment]:
+        """อ่านไฟล์ SRT และแปลงเป็น segments"""
+        return self.read_cues(srt_path).to_segments()
@@ -0,0 +1,133 @@
+import os
+import math
+from typing import List
+
+# Rough characters-per-token for the GPT tokenizers, by Unicode block. Thai,
+# Lao, Khmer and Myanmar have few merged tokens, so one character can cost
+# close to (or more than) a full token.
+SCRIPT_CHARS_PER_TOKEN = [
+    (0x0E00, 0x0E7F, 1.6),   # Thai
+    (0x0E80, 0x0EFF, 1.0),   # Lao
+    (0x1000, 0x109F, 0.5),   # Myanmar
+    (0x1780, 0x17FF, 0.6),   # Khmer
+    (0x1EA0, 0x1EFF, 1.5),   # Vietnamese precomposed letters
+    (0x0000, 0x024F, 4.0),   # Latin (English, Vietnamese base letters, digits, punctuation)
+]
+DEFAULT_CHARS_PER_TOKEN = 1.0
+
+# Output tokens per input (Thai) token when translating into each language
+OUTPUT_TOKEN_RATIO = {
+    "english": 0.8,
+    "vietnamese": 1.3,
+    "lao": 1.8,
+    "khmer": 2.5,
+    "myanmar": 3.0,
+}
+DEFAULT_OUTPUT_TOKEN_RATIO = 1.5
+
+# JSON framing per line ({"id": N, "text": "..."}) on the way in and out
+PER_SEGMENT_OVERHEAD_TOKENS = 12
+
+
+class TranslationBatch:
+    """A contiguous run of texts sent in one request"""
+
+    def __init__(self, start: int, end: int, input_tokens: int, output_tokens: int, max_tokens: int):
+        self.start = start
+        self.end = end
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.max_tokens = max_tokens
+
+
+class TranslationUsage:
+    """Requests and tokens spent on one translation run"""
+
+    def __init__(self):
+        self.requests = 0
+        self.repair_requests = 0
+        self.segments = 0
+        self.estimated_input_tokens = 0
+        self.estimated_output_tokens = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add_batch(self, batch: TranslationBatch):
+        self.segments += batch.end - batch.start
+        self.estimated_input_tokens += batch.input_tokens
+        self.estimated_output_tokens += batch.output_tokens
+
+    def add_response(self, prompt_tokens: int, completion_tokens: int, repair: bool = False):
+        self.requests += 1
+        if repair:
+            self.repair_requests += 1
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+
+    def merge(self, other: "TranslationUsage"):
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class TranslationBatcher:
+    """Pack texts into requests by estimated input and output tokens"""
+
+    def __init__(self):
+        self.input_budget = int(os.getenv("TRANSLATION_BATCH_INPUT_TOKENS", "2000"))
+        self.output_budget = int(os.getenv("TRANSLATION_BATCH_OUTPUT_TOKENS", "3000"))
+        self.max_segments = int(os.getenv("TRANSLATION_BATCH_MAX_SEGMENTS", "60"))
+        self.max_tokens_cap = int(os.getenv("TRANSLATION_MAX_OUTPUT_TOKENS", "16000"))
+
+    def estimate_tokens(self, text: str) -> int:
+        tokens = 0.0
+        for char in text:
+            code = ord(char)
+            for start, end, chars_per_token in SCRIPT_CHARS_PER_TOKEN:
+                if start <= code <= end:
+                    tokens += 1 / chars_per_token
+                    break
+            else:
+                tokens += 1 / DEFAULT_CHARS_PER_TOKEN
+        return math.ceil(tokens)
+
+    def estimate_output_tokens(self, input_tokens: int, target_language: str) -> int:
+        ratio = OUTPUT_TOKEN_RATIO.get(target_language, DEFAULT_OUTPUT_TOKEN_RATIO)
+        return math.ceil(input_tokens * ratio)
+
+    def max_tokens_for(self, output_tokens: int) -> int:
+        """Completion limit with headroom so an estimate that runs short is not truncated"""
+        return min(self.max_tokens_cap, int(output_tokens * 1.5) + 200)
+
+    def plan(self, texts: List[str], target_language: str, prompt_tokens: int = 0) -> List[TranslationBatch]:
+        """แบ่งข้อความเป็นชุดตาม token budget โดยรักษาลำดับเดิม"""
+        input_budget = max(1, self.input_budget - prompt_tokens)
+        batches = []
+        start = 0
+        batch_input = batch_output = 0
+
+        for index, text in enumerate(texts):
+            input_tokens = self.estimate_tokens(text) + PER_SEGMENT_OVERHEAD_TOKENS
+            output_tokens = self.estimate_output_tokens(input_tokens, target_language)
+
+            # A single oversize line still gets its own batch
+            if index > start and (
+                batch_input + input_tokens > input_budget
+                or batch_output + output_tokens > self.output_budget
+                or index - start >= self.max_segments
+            ):
+                batches.append(self._make_batch(start, index, batch_input, batch_output))
+                start = index
+                batch_input = batch_output = 0
+
+            batch_input += input_tokens
+            batch_output += output_tokens
+
+        if start < len(texts):
+            batches.append(self._make_batch(start, len(texts), batch_input, batch_output))
+        return batches
+
+    def _make_batch(self, start: int, end: int, input_tokens: int, output_tokens: int) -> TranslationBatch:
+        return TranslationBatch(start, end, input_tokens, output_tokens, self.max_tokens_for(output_tokens))
@@ -0,0 +1,145 @@
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class TranslationCache:
+    """Persistent translation memory stored in SQLite.
+
+    Entries are keyed by the normalized source text, target language, style
+    prompt and model, and evicted least-recently-used once the table grows
+    past ``max_entries``.
+
+    Hit/miss counts and translation usage totals live in the same file, so
+    the API process reports what every worker process did.
+    """
+
+    def __init__(self, db_path: Path, max_entries: int = 200000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                target_language TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used)")
+        # Running totals shared by every process: hits, misses and usage.<field>
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(text: Optional[str]) -> str:
+        return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+    def make_key(self, text: str, target_language: str, style_prompt: Optional[str], model: str) -> str:
+        raw = "\x1f".join([
+            self.normalize(text),
+            target_language,
+            self.normalize(style_prompt),
+            model
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Return {key: translation} for the keys that are cached"""
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        hit_count = 0
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, translated_text FROM translations WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE translations SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+            hit_count = sum(1 for key in keys if key in found)
+            self._add_counters({"hits": hit_count, "misses": len(keys) - hit_count})
+            self._conn.commit()
+        return found
+
+    def _add_counters(self, values: Dict[str, int]):
+        self._conn.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            [(name, value) for name, value in values.items() if value]
+        )
+
+    def _counters(self, prefix: str = "") -> Dict[str, int]:
+        rows = self._conn.execute(
+            "SELECT name, value FROM counters WHERE substr(name, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall()
+        return {name[len(prefix):]: value for name, value in rows}
+
+    def add_usage(self, usage: Dict[str, int]):
+        """Add one translation run's usage (TranslationUsage.to_dict()) to the totals"""
+        with self._lock:
+            self._add_counters({f"usage.{name}": value for name, value in usage.items()})
+            self._conn.commit()
+
+    def usage_totals(self) -> Dict[str, int]:
+        """Usage of every translation run, in any process, since the cache was created"""
+        with self._lock:
+            return self._counters("usage.")
+
+    def put_many(self, entries: List[tuple]):
+        """Store (key, target_language, source_text, translated_text) rows"""
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, target_language, source_text, translated_text, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(*entry, now) for entry in entries]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Trim to 90% so eviction does not run on every insert once full
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM translations WHERE key IN "
+            "(SELECT key FROM translations ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            counters = self._counters()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        total = hits + misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0
+        }
@@ -1,18 +1,29 @@
 import os
+import re
+import json
 from pathlib import Path
-from openai import OpenAI
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import asyncio
 from services.transcription_service import TranscriptionService
-from models.subtitle_models import SubtitleSegment
+from services.ai_backends import ChatBackend, create_chat_backend
+from services.translation_cache import TranslationCache
+from services.translation_batcher import TranslationBatcher, TranslationBatch, TranslationUsage
+from services import subtitle_io
+from services.subtitle_io import CueList
 
 class TranslationService:
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
-        self.transcription_service = TranscriptionService()
+    def __init__(self, backend: Optional[ChatBackend] = None, cache: Optional[TranslationCache] = None,
+                 transcription_service: Optional[TranscriptionService] = None):
+        self.backend = backend or create_chat_backend()
+        self.cache = cache
+        # Only used for SRT parsing/writing; share the app's instance instead of building a second backend
+        self.transcription_service = transcription_service or TranscriptionService()
+        self.concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", "8"))
+        self.batcher = TranslationBatcher()
+        self.repair_rounds = int(os.getenv("TRANSLATION_REPAIR_ROUNDS", "2"))
+        # Totals across all runs of this process; with a cache they are also
+        # added to its shared totals (see usage_totals)
+        self.usage = TranslationUsage()
         
         self.language_map = {
             "english": "อังกฤษ",
@@ -22,49 +33,170 @@ class TranslationService:
             "vietnamese": "เวียดนาม"
         }
     
-    async def translate_srt(self, srt_path: Path, target_language: str, style_prompt: Optional[str] = None) -> str:
+    async def translate_srt(self, srt_path: Path, target_language: str, style_prompt: Optional[str] = None,
+                            usage: Optional[TranslationUsage] = None) -> str:
         """แปลไฟล์ SRT เป็นภาษาเป้าหมาย"""
         try:
             # Parse SRT file
-            segments = self.transcription_service.parse_srt_file(srt_path)
+            cues = self.transcription_service.read_cues(srt_path)
             
             # Translate segments
-            translated_segments = await self._translate_segments(segments, target_language, style_prompt)
+            translated_cues = await self._translate_segments(cues, target_language, style_prompt, usage=usage)
             
             # Generate SRT content
-            return self.transcription_service._generate_srt_content(translated_segments)
+            return subtitle_io.dumps(translated_cues)
             
         except Exception as e:
             raise Exception(f"การแปลล้มเหลว: {str(e)}")
     
-    async def _translate_segments(self, segments: List[SubtitleSegment], target_language: str, style_prompt: Optional[str] = None) -> List[SubtitleSegment]:
-        """แปลแต่ละ segment"""
-        translated_segments = []
+    async def translate_srt_multi(
+        self,
+        srt_path: Path,
+        targets: List[Tuple[str, Optional[str]]],
+        on_translated: Callable[[str, str], Awaitable[None]]
+    ) -> Dict[str, dict]:
+        """แปลไฟล์ SRT เป็นหลายภาษาพร้อมกัน
+
+        The source is parsed once and every language's batches share one
+        concurrency budget. ``on_translated(language, srt_content)`` is awaited
+        as soon as each language finishes. Returns
+        {language: {"error": str or None, "usage": dict}}; raises when no
+        language could be translated at all.
+        """
+        try:
+            cues = self.transcription_service.read_cues(srt_path)
+        except Exception as e:
+            raise Exception(f"การแปลล้มเหลว: {str(e)}")
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        usages = {target_language: TranslationUsage() for target_language, _ in targets}
+        
+        async def translate_language(target_language: str, style_prompt: Optional[str]):
+            translated_cues = await self._translate_segments(
+                cues, target_language, style_prompt, semaphore, usages[target_language]
+            )
+            await on_translated(target_language, subtitle_io.dumps(translated_cues))
         
-        # Prepare texts for batch translation
-        texts_to_translate = [segment.text for segment in segments]
+        results = await asyncio.gather(
+            *(translate_language(target_language, style_prompt) for target_language, style_prompt in targets),
+            return_exceptions=True
+        )
+        
+        outcomes = {
+            target_language: {
+                "error": f"การแปลล้มเหลว: {str(result)}" if isinstance(result, Exception) else None,
+                "usage": usages[target_language].to_dict()
+            }
+            for (target_language, _), result in zip(targets, results)
+        }
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures and len(failures) == len(results):
+            # Nothing was translated (usually the API is down); fail so the job is retried
+            raise Exception(f"การแปลล้มเหลว: {str(failures[0])}") from failures[0]
+        
+        return outcomes
+    
+    async def _translate_segments(self, cues: CueList, target_language: str, style_prompt: Optional[str] = None,
+                                  semaphore: Optional[asyncio.Semaphore] = None,
+                                  usage: Optional[TranslationUsage] = None) -> CueList:
+        """แปลแต่ละ segment"""
+        translated_texts = await self.translate_lines(cues.texts, target_language, style_prompt, semaphore, usage)
+        return cues.with_texts(translated_texts)
+    
+    def usage_totals(self) -> dict:
+        """Usage of every process (API and workers) when there is a cache, else of this process"""
+        if not self.cache:
+            return self.usage.to_dict()
+        return {**{name: 0 for name in self.usage.to_dict()}, **self.cache.usage_totals()}
+    
+    async def translate_lines(self, texts: List[str], target_language: str, style_prompt: Optional[str] = None,
+                              semaphore: Optional[asyncio.Semaphore] = None,
+                              usage: Optional[TranslationUsage] = None) -> List[str]:
+        """แปลข้อความทีละบรรทัด (ใช้ทั้งการแปลทั้งไฟล์และการแปลเฉพาะ segment ที่แก้ไข)"""
+        if not texts:
+            return []
         
         # Create translation prompt
         system_prompt = self._create_translation_prompt(target_language, style_prompt)
         
-        # Batch translate (process in chunks to avoid token limits)
-        chunk_size = 10
-        for i in range(0, len(texts_to_translate), chunk_size):
-            chunk_texts = texts_to_translate[i:i + chunk_size]
-            chunk_segments = segments[i:i + chunk_size]
-            
-            translated_chunk = await self._translate_text_batch(chunk_texts, system_prompt)
-            
-            # Create translated segments
-            for j, translated_text in enumerate(translated_chunk):
-                original_segment = chunk_segments[j]
-                translated_segments.append(SubtitleSegment(
-                    start=original_segment.start,
-                    end=original_segment.end,
-                    text=translated_text.strip()
-                ))
+        run_usage = TranslationUsage()
+        try:
+            translated_texts = await self._translate_texts(
+                texts, target_language, style_prompt, system_prompt, semaphore, run_usage
+            )
+        finally:
+            # Tokens spent on a run that failed part-way still count
+            self.usage.merge(run_usage)
+            if usage is not None:
+                usage.merge(run_usage)
+            if self.cache:
+                await asyncio.to_thread(self.cache.add_usage, run_usage.to_dict())
+        
+        return [translated_text.strip() for translated_text in translated_texts]
+    
+    async def _translate_texts(self, texts: List[str], target_language: str, style_prompt: Optional[str], system_prompt: str,
+                               semaphore: Optional[asyncio.Semaphore], usage: TranslationUsage) -> List[str]:
+        """Translate texts, calling the API only for lines missing from the cache"""
+        if not self.cache:
+            return await self._translate_uncached(texts, system_prompt, target_language, semaphore, usage)
         
-        return translated_segments
+        loop = asyncio.get_event_loop()
+        model = self.backend.model
+        keys = [self.cache.make_key(text, target_language, style_prompt, model) for text in texts]
+        cached = await loop.run_in_executor(None, self.cache.get_many, keys)
+        
+        # Each distinct missing line is sent once, even if it repeats in the file
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        print(f"Translation cache ({target_language}): {len(texts) - len(missing)} lines reused, {len(missing)} to translate")
+        
+        if missing:
+            translated = await self._translate_uncached(
+                list(missing.values()), system_prompt, target_language, semaphore, usage
+            )
+            new_entries = []
+            for (key, source_text), translated_text in zip(missing.items(), translated):
+                cached[key] = translated_text
+                # Lines that came back unchanged are usually failed fallbacks; do not pin them
+                if translated_text.strip() != source_text.strip():
+                    new_entries.append((key, target_language, source_text, translated_text.strip()))
+            await loop.run_in_executor(None, self.cache.put_many, new_entries)
+        
+        return [cached[key] for key in keys]
+    
+    async def _translate_uncached(self, texts: List[str], system_prompt: str, target_language: str,
+                                  semaphore: Optional[asyncio.Semaphore], usage: TranslationUsage) -> List[str]:
+        """Translate texts in token-budgeted batches, all in flight up to the concurrency limit"""
+        batches = self.batcher.plan(texts, target_language, self.batcher.estimate_tokens(system_prompt))
+        semaphore = semaphore or asyncio.Semaphore(self.concurrency)
+        
+        async def translate_batch(batch: TranslationBatch) -> List[str]:
+            async with semaphore:
+                return await self._translate_text_batch(
+                    texts[batch.start:batch.end], system_prompt, batch.max_tokens, usage
+                )
+        
+        for batch in batches:
+            usage.add_batch(batch)
+        results = await asyncio.gather(
+            *(translate_batch(batch) for batch in batches),
+            return_exceptions=True
+        )
+        
+        # A batch the API kept failing fails the whole run, so the job fails
+        # (or is retried) instead of saving lines in the source language
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        
+        # Reassemble in the original order
+        translated_texts = []
+        for result in results:
+            translated_texts.extend(result)
+        
+        return translated_texts
     
     def _create_translation_prompt(self, target_language: str, style_prompt: Optional[str] = None) -> str:
         """สร้าง prompt สำหรับการแปล"""
@@ -81,73 +213,103 @@ class TranslationService:
         if style_prompt:
             base_prompt += f"\n5. สไตล์การแปล: {style_prompt}"
         
-        base_prompt += "\n\nกรุณาแปลข้อความแต่ละบรรทัดและตอบกลับในรูปแบบเดียวกัน (แต่ละบรรทัดแยกด้วย newline)"
+        base_prompt += (
+            '\n\nข้อมูลเข้าเป็น JSON รูปแบบ {"segments": [{"id": 0, "text": "ข้อความ"}]} '
+            'กรุณาแปล text ของทุก segment และตอบกลับเป็น JSON เท่านั้น ในรูปแบบ '
+            '{"translations": [{"id": 0, "text": "คำแปล"}]} โดยใช้ id เดิมให้ครบทุกตัว'
+        )
         
         return base_prompt
     
-    async def _translate_text_batch(self, texts: List[str], system_prompt: str) -> List[str]:
+    async def _translate_text_batch(self, texts: List[str], system_prompt: str, max_tokens: int,
+                                    usage: TranslationUsage) -> List[str]:
         """แปลข้อความเป็นชุด"""
-        try:
-            # Join texts with special separator
-            input_text = "\n---SEPARATOR---\n".join(texts)
-            
-            # Run in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.chat.completions.create(
-                    model="gpt-4.1-mini",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": input_text}
-                    ],
-                    temperature=0.3,
-                    max_tokens=4000
-                )
+        translations = {}
+        error = None
+        # Round 0 sends the whole batch; repair rounds retry only the ids that
+        # came back missing or malformed (or whose request failed), all of
+        # them together, and the last one goes to the fallback model
+        for repair_round in range(self.repair_rounds + 1):
+            missing = {index: text for index, text in enumerate(texts) if index not in translations}
+            if not missing:
+                break
+            last_round = repair_round == self.repair_rounds and repair_round > 1
+            if repair_round:
+                print(f"Repairing {len(missing)}/{len(texts)} translations (round {repair_round})")
+            try:
+                translations.update(await self._request_translations(
+                    missing,
+                    system_prompt,
+                    max_tokens,
+                    usage,
+                    model=self.backend.fallback_model if last_round else None,
+                    repair=repair_round > 0
+                ))
+                error = None
+            except Exception as e:
+                print(f"Translation request failed: {str(e)}")
+                error = e
+        
+        if error is not None:
+            # The API itself failed (auth, 5xx, timeout) up to the last round
+            raise error
+        # Ids the model kept leaving malformed keep their original text
+        return [translations.get(index, text) for index, text in enumerate(texts)]
+    
+    async def _request_translations(self, items: Dict[int, str], system_prompt: str, max_tokens: int,
+                                    usage: TranslationUsage, model: Optional[str] = None,
+                                    repair: bool = False) -> Dict[int, str]:
+        """Send {id: text} as one JSON request and return the ids that came back valid.
+
+        Backend errors (transport, API status) are raised to the caller.
+        """
+        input_text = json.dumps(
+            {"segments": [{"id": index, "text": text} for index, text in items.items()]},
+            ensure_ascii=False
+        )
+        result = await self.backend.complete(
+            system_prompt, input_text, max_tokens=max_tokens, model=model, json_mode=True
+        )
+        usage.add_response(result.prompt_tokens, result.completion_tokens, repair=repair)
+        
+        if result.truncated and len(items) > 1:
+            # The estimate ran short; halve the batch rather than lose the tail
+            ids = list(items)
+            middle = len(ids) // 2
+            translations = await self._request_translations(
+                {index: items[index] for index in ids[:middle]}, system_prompt, max_tokens, usage, model, repair
             )
-            
-            translated_text = response.choices[0].message.content
-            
-            # Split back into individual translations
-            translated_texts = translated_text.split("\n---SEPARATOR---\n")
-            
-            # Ensure we have the same number of translations
-            if len(translated_texts) != len(texts):
-                # Fallback: translate one by one
-                return await self._translate_texts_individually(texts, system_prompt)
-            
-            return translated_texts
-            
-        except Exception as e:
-            # Fallback: translate one by one
-            return await self._translate_texts_individually(texts, system_prompt)
+            translations.update(await self._request_translations(
+                {index: items[index] for index in ids[middle:]}, system_prompt, max_tokens, usage, model, repair
+            ))
+            return translations
+        
+        return self._parse_translations(result.content, items)
     
-    async def _translate_texts_individually(self, texts: List[str], system_prompt: str) -> List[str]:
-        """แปลข้อความทีละข้อ (fallback method)"""
-        translated_texts = []
+    def _parse_translations(self, content: str, items: Dict[int, str]) -> Dict[int, str]:
+        """Pull valid {id: text} pairs out of a model response, ignoring anything malformed"""
+        # Tolerate a Markdown code fence around the JSON
+        content = re.sub(r"^\s*```(?:json)?\s*|\s*```\s*$", "", content or "")
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return {}
         
-        for text in texts:
-            try:
-                # Run in thread pool to avoid blocking
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: self.client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": text}
-                        ],
-                        temperature=0.3,
-                        max_tokens=1000
-                    )
-                )
-                
-                translated_text = response.choices[0].message.content.strip()
-                translated_texts.append(translated_text)
-                
-            except Exception as e:
-                # If translation fails, keep original text
-                translated_texts.append(text)
+        entries = data.get("translations", data) if isinstance(data, dict) else data
+        if isinstance(entries, dict):
+            entries = [{"id": key, "text": value} for key, value in entries.items()]
+        if not isinstance(entries, list):
+            return {}
         
-        return translated_texts
\ No newline at end of file
+        translations = {}
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                index = int(entry.get("id"))
+            except (TypeError, ValueError):
+                continue
+            text = entry.get("text")
+            if index in items and isinstance(text, str) and text.strip():
+                translations[index] = text.strip()
+        return translations
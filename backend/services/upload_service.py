@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import aiofiles
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:     # Windows: only the in-process lock applies
+    fcntl = None
+
+ALLOWED_VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.mkv', '.wmv'}
+
+# Bytes read at a time when hashing a file already on disk
+HASH_READ_SIZE = 1024 * 1024
+
+
+def hash_file(path: Path, hasher=None):
+    """Feed a file into hasher (a new sha256 by default) and return it"""
+    hasher = hasher or hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(HASH_READ_SIZE):
+            hasher.update(data)
+    return hasher
+
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk does not start at the current end of the upload"""
+
+    def __init__(self, expected_offset: int):
+        super().__init__(f"offset ไม่ตรงกัน (ต้องเริ่มที่ byte {expected_offset})")
+        self.expected_offset = expected_offset
+
+
+class UploadService:
+    """Resumable chunked uploads written straight into UPLOAD_DIR.
+
+    Each upload is a ``{file_id}{ext}.part`` file plus a small JSON sidecar.
+    The acknowledged offset is simply the size of the part file, so a client
+    whose connection dropped asks for the current offset and continues from
+    there instead of restarting.
+
+    Chunks are hashed as they are written. On finalize the upload is
+    probed (see ``probe_upload``) and handed to the content store, which
+    keeps one copy per sha256.
+
+    Appends and finalize hold an ``flock`` on the part file and check the
+    offset against its size under it, so API processes sharing UPLOAD_DIR
+    cannot both write at one offset; a request that finds the file locked
+    gets the usual offset mismatch. ``expire_uploads`` deletes uploads idle
+    for UPLOAD_EXPIRE_SECONDS (24 h) and drops the in-memory lock and hash
+    state of uploads idle for UPLOAD_STATE_IDLE_SECONDS (10 min), which is
+    rebuilt from the part file if the upload resumes.
+    """
+
+    def __init__(self, upload_dir: Path, content_store=None, media_prober=None):
+        self.upload_dir = upload_dir
+        self.content_store = content_store
+        self.media_prober = media_prober
+        max_file_size = os.getenv("MAX_FILE_SIZE")
+        self.max_file_size = int(max_file_size) if max_file_size else None
+        self.expire_seconds = float(os.getenv("UPLOAD_EXPIRE_SECONDS", "86400"))
+        self.state_idle_seconds = float(os.getenv("UPLOAD_STATE_IDLE_SECONDS", "600"))
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # upload_id -> (sha256 of the part file so far, bytes hashed)
+        self._hashers: Dict[str, Tuple[object, int]] = {}
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.upload_dir / f"{upload_id}.upload.json"
+
+    def _part_path(self, upload_id: str, extension: str) -> Path:
+        return self.upload_dir / f"{upload_id}{extension}.part"
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        if upload_id not in self._locks:
+            self._locks[upload_id] = asyncio.Lock()
+        return self._locks[upload_id]
+
+    def _lock_part(self, f, upload_id: str):
+        """Take the cross-process lock of an open part file, or report where the upload is"""
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another process is writing or finalizing this upload
+            raise UploadOffsetMismatch(os.fstat(f.fileno()).st_size)
+
+    def _forget_state(self, upload_id: str):
+        self._locks.pop(upload_id, None)
+        self._hashers.pop(upload_id, None)
+
+    def _scan_uploads(self) -> Tuple[int, set]:
+        """Delete uploads idle past expire_seconds; returns (deleted, ids idle past state_idle_seconds)"""
+        now = time.time()
+        expired = 0
+        idle = set()
+        with os.scandir(self.upload_dir) as entries:
+            sidecars = [entry.path for entry in entries if entry.name.endswith(".upload.json")]
+        for sidecar in map(Path, sidecars):
+            upload_id = sidecar.name[:-len(".upload.json")]
+            try:
+                with open(sidecar, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                part_path = self._part_path(upload_id, meta["extension"])
+                touched = part_path.stat().st_mtime if part_path.exists() else sidecar.stat().st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+            if now - touched > self.expire_seconds:
+                try:
+                    with open(part_path, 'rb') as part:
+                        # Skip an upload some request is writing to right now
+                        self._lock_part(part, upload_id)
+                        part_path.unlink(missing_ok=True)
+                        sidecar.unlink(missing_ok=True)
+                except FileNotFoundError:
+                    sidecar.unlink(missing_ok=True)
+                except UploadOffsetMismatch:
+                    continue
+                expired += 1
+                idle.add(upload_id)
+            elif now - touched > self.state_idle_seconds:
+                idle.add(upload_id)
+        return expired, idle
+
+    async def expire_uploads(self) -> int:
+        """Delete abandoned uploads and drop idle in-memory state; returns how many uploads were deleted"""
+        loop = asyncio.get_event_loop()
+        expired, idle = await loop.run_in_executor(None, self._scan_uploads)
+        for upload_id in list(self._locks.keys() | self._hashers.keys()):
+            lock = self._locks.get(upload_id)
+            if lock is not None and lock.locked():
+                continue
+            # Idle, or finalized / deleted by another process
+            if upload_id in idle or not self._meta_path(upload_id).exists():
+                self._forget_state(upload_id)
+        if expired:
+            print(f"Deleted {expired} abandoned uploads")
+        return expired
+
+    def _load_meta(self, upload_id: str) -> dict:
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise FileNotFoundError(f"ไม่พบการอัปโหลด {upload_id}")
+        meta_path = self._meta_path(upload_id)
+        if not meta_path.exists():
+            raise FileNotFoundError(f"ไม่พบการอัปโหลด {upload_id}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _current_offset(self, meta: dict) -> int:
+        part_path = self._part_path(meta["upload_id"], meta["extension"])
+        return part_path.stat().st_size if part_path.exists() else 0
+
+    async def _hasher(self, meta: dict, offset: int):
+        """Hash state for the first offset bytes of the part file.
+
+        Normally kept in memory between chunks; after a restart, or when
+        another process took the earlier chunks, the part file is re-read.
+        """
+        upload_id = meta["upload_id"]
+        hasher, hashed = self._hashers.get(upload_id, (None, -1))
+        if hashed == offset:
+            return hasher
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, hash_file, self._part_path(upload_id, meta["extension"]))
+
+    def validate_filename(self, filename: str) -> str:
+        """Return the lower-cased extension, or raise ValueError for unsupported files"""
+        extension = Path(filename or "").suffix.lower()
+        if extension not in ALLOWED_VIDEO_EXTENSIONS:
+            raise ValueError("ไฟล์ต้องเป็น MP4, MOV, AVI, MKV หรือ WMV เท่านั้น")
+        return extension
+
+    async def probe_upload(self, part_path: Path, content_hash: str) -> Optional[dict]:
+        """Probe a finished upload before it is stored.
+
+        Content the store already has is not probed again. A corrupt or
+        audio-less upload is deleted and rejected with ValueError, before
+        any conversion is attempted.
+        """
+        if not self.media_prober:
+            return None
+        loop = asyncio.get_event_loop()
+        if self.content_store:
+            probe = await loop.run_in_executor(None, self.content_store.probe_of_content, content_hash)
+            if probe is not None:
+                return probe
+        try:
+            probe = await loop.run_in_executor(None, self.media_prober.probe, part_path)
+            self.media_prober.validate(probe)
+        except ValueError:
+            part_path.unlink(missing_ok=True)
+            raise
+        return probe
+
+    async def init_upload(self, filename: str, total_size: Optional[int] = None) -> dict:
+        """เริ่มการอัปโหลดแบบแบ่งส่วน"""
+        extension = self.validate_filename(filename)
+        if total_size is not None and total_size < 0:
+            raise ValueError("total_size ต้องไม่ติดลบ")
+        if total_size and self.max_file_size and total_size > self.max_file_size:
+            raise ValueError(f"ไฟล์มีขนาดเกิน {self.max_file_size} bytes")
+
+        upload_id = str(uuid.uuid4())
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "extension": extension,
+            "total_size": total_size,
+        }
+
+        async with aiofiles.open(self._part_path(upload_id, extension), 'wb'):
+            pass
+        async with aiofiles.open(self._meta_path(upload_id), 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(meta, ensure_ascii=False))
+
+        return {**meta, "offset": 0}
+
+    async def get_status(self, upload_id: str) -> dict:
+        """ดูสถานะและ offset ล่าสุดของการอัปโหลด"""
+        meta = self._load_meta(upload_id)
+        return {**meta, "offset": self._current_offset(meta)}
+
+    async def append_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+        """เขียน chunk ต่อท้ายไฟล์ที่ offset ที่กำหนด"""
+        async with self._lock(upload_id):
+            meta = self._load_meta(upload_id)
+            total_size = meta.get("total_size")
+            limit = total_size or self.max_file_size
+
+            # Bytes that reach the disk are kept even if the client disconnects
+            # mid-chunk; the next status call reports them as acknowledged.
+            async with aiofiles.open(self._part_path(upload_id, meta["extension"]), 'ab') as f:
+                self._lock_part(f, upload_id)
+                current_offset = os.fstat(f.fileno()).st_size
+                if not self._meta_path(upload_id).exists():
+                    # Finalized or expired by another process meanwhile
+                    if current_offset == 0:
+                        self._part_path(upload_id, meta["extension"]).unlink(missing_ok=True)
+                    raise FileNotFoundError(f"ไม่พบการอัปโหลด {upload_id}")
+                if offset != current_offset:
+                    raise UploadOffsetMismatch(current_offset)
+                written = current_offset
+                hasher = await self._hasher(meta, current_offset)
+                try:
+                    async for data in chunks:
+                        if not data:
+                            continue
+                        if limit and written + len(data) > limit:
+                            raise ValueError(f"ข้อมูลเกินขนาดไฟล์ที่กำหนด ({limit} bytes)")
+                        await f.write(data)
+                        hasher.update(data)
+                        written += len(data)
+                    await f.flush()
+                finally:
+                    self._hashers[upload_id] = (hasher, written)
+
+            return {**meta, "offset": written}
+
+    async def finalize_upload(self, upload_id: str) -> dict:
+        """ปิดการอัปโหลดและย้ายไฟล์ไปเป็นวิดีโอต้นฉบับ"""
+        async with self._lock(upload_id):
+            meta = self._load_meta(upload_id)
+            part_path = self._part_path(upload_id, meta["extension"])
+            if not part_path.exists():
+                raise FileNotFoundError(f"ไม่พบการอัปโหลด {upload_id}")
+            # Held until the part file has been moved, so no append can slip in
+            async with aiofiles.open(part_path, 'rb') as part:
+                self._lock_part(part, upload_id)
+                if not self._meta_path(upload_id).exists():
+                    raise FileNotFoundError(f"ไม่พบการอัปโหลด {upload_id}")
+                offset = os.fstat(part.fileno()).st_size
+                total_size = meta.get("total_size")
+                if total_size is not None and offset != total_size:
+                    raise UploadOffsetMismatch(offset)
+                if offset == 0:
+                    raise ValueError("ไฟล์ว่างเปล่า")
+
+                hasher = await self._hasher(meta, offset)
+                try:
+                    probe = await self.probe_upload(part_path, hasher.hexdigest())
+                except ValueError:
+                    # Rejected uploads cannot be resumed
+                    self._meta_path(upload_id).unlink(missing_ok=True)
+                    self._hashers.pop(upload_id, None)
+                    raise
+                if self.content_store:
+                    loop = asyncio.get_event_loop()
+                    stored = await loop.run_in_executor(
+                        None, self.content_store.add,
+                        upload_id, part_path, hasher.hexdigest(), meta["extension"], meta["filename"], probe
+                    )
+                else:
+                    video_path = self.upload_dir / f"{upload_id}{meta['extension']}"
+                    os.replace(part_path, video_path)
+                    stored = {"paths": None, "content_hash": hasher.hexdigest(), "deduplicated": False}
+                self._meta_path(upload_id).unlink(missing_ok=True)
+
+        self._forget_state(upload_id)
+        video_path = stored["paths"].video if stored["paths"] else video_path
+        return {**meta, **stored, "offset": offset, "video_path": video_path}
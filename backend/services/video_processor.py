@@ -2,13 +2,41 @@ import os
 import subprocess
 import platform
 from pathlib import Path
-from moviepy.editor import VideoFileClip
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from services.ffmpeg_progress import FFmpegProgress, run_ffmpeg
+from services.encode_scheduler import EncodeScheduler, EXTRACT, BURN, MUX
+from services.segment_burner import SegmentBurner
+from services.media_probe import MediaProber
+from services.languages import iso639_2, display_name
+
+# Called from the encoding thread with each ffmpeg progress report
+ProgressCallback = Callable[[FFmpegProgress], None]
+
+# Fast and simple subtitle style for Thai text
+HARD_SUBTITLE_STYLE = (
+    "FontSize=24,"              # Good readable size
+    "PrimaryColour=&Hffffff,"   # White text
+    "OutlineColour=&H000000,"   # Black outline
+    "Outline=2,"                # Simple outline
+    "Alignment=2,"              # Bottom center
+    "MarginV=30"                # Bottom margin
+)
+
+# Subtitle codec of soft-subtitle tracks per output container
+SOFT_SUBTITLE_CODECS = {"mp4": "mov_text", "mkv": "srt"}
 
 class VideoProcessor:
-    def __init__(self):
-        self.executor = ThreadPoolExecutor(max_workers=2)
+    def __init__(self, transcription_service=None):
+        self.scheduler = EncodeScheduler()
+        self.media_prober = MediaProber()
+        # Long videos are burned in keyframe-aligned segments in parallel
+        # ("auto": from BURN_SEGMENT_MIN_DURATION seconds, "on", "off");
+        # needs a TranscriptionService for SRT parsing/writing
+        self.segment_burner = SegmentBurner(self.scheduler, transcription_service) if transcription_service else None
+        self.segmented_mode = os.getenv("BURN_SEGMENTED", "auto").lower()
+        self.segment_min_duration = float(os.getenv("BURN_SEGMENT_MIN_DURATION", "600"))
+        self.asr_sample_rate = int(os.getenv("ASR_AUDIO_SAMPLE_RATE", "16000"))
+        self.asr_audio_bitrate = os.getenv("ASR_AUDIO_BITRATE", "32k")
         self.thai_fonts = self._get_thai_fonts()
     
     def _get_thai_fonts(self):
@@ -26,10 +54,9 @@ class VideoProcessor:
         try:
             mp3_path = video_path.parent / f"{file_id}.mp3"
             
-            # Run conversion in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
+            # Extraction has its own lane so it never waits behind a burn-in
+            await self.scheduler.run(
+                EXTRACT,
                 self._convert_video_to_mp3,
                 str(video_path),
                 str(mp3_path)
@@ -40,84 +67,110 @@ class VideoProcessor:
         except Exception as e:
             raise Exception(f"ไม่สามารถแปลงไฟล์เป็น MP3 ได้: {str(e)}")
     
-    def _convert_video_to_mp3(self, video_path: str, mp3_path: str):
-        """Helper function to convert video to MP3"""
+    def _convert_video_to_mp3(self, video_path: str, mp3_path: str, threads: int = 1):
+        """Helper function to extract ASR-ready audio with a direct ffmpeg demux"""
         try:
-            video = VideoFileClip(video_path)
-            audio = video.audio
-            audio.write_audiofile(mp3_path, verbose=False, logger=None)
-            audio.close()
-            video.close()
+            # Skip video/subtitle/data streams and decode only the first audio
+            # track, downmixed to 16 kHz mono - the rate Whisper resamples to
+            # anyway - and encoded as low-bitrate MP3 to keep uploads small.
+            cmd = [
+                'ffmpeg',
+                '-nostdin',
+                '-i', video_path,
+                '-map', '0:a:0',            # First audio stream only
+                '-vn', '-sn', '-dn',        # Do not decode video/subtitles/data
+                '-ac', '1',                 # Mono
+                '-ar', str(self.asr_sample_rate),
+                '-c:a', 'libmp3lame',
+                '-b:a', self.asr_audio_bitrate,
+                '-threads', str(threads),
+                '-loglevel', 'error',
+                '-f', 'mp3',
+                '-y',
+                f"{mp3_path}.tmp"
+            ]
+            
+            subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            # Publish only a complete file; duplicate uploads reuse it
+            os.replace(f"{mp3_path}.tmp", mp3_path)
+            
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"การแปลงไฟล์ล้มเหลว: {e.stderr.strip()}")
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
         except Exception as e:
             raise Exception(f"การแปลงไฟล์ล้มเหลว: {str(e)}")
     
-    async def embed_subtitles(self, video_path: Path, srt_path: Path, output_path: Path) -> Path:
-        """ฝัง subtitle เข้ากับวิดีโอด้วย ffmpeg"""
+    async def embed_subtitles(self, video_path: Path, srt_path: Path, output_path: Path,
+                              on_progress: Optional[ProgressCallback] = None, media: Optional[dict] = None) -> dict:
+        """ฝัง subtitle เข้ากับวิดีโอด้วย ffmpeg
+
+        Returns how much was encoded: a segmented burn re-encodes only the
+        ranges whose subtitles changed since the last burn of the same output.
+        media is the stored probe of the video (see MediaProber), if any.
+        """
         try:
-            # Run embedding in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
+            if self.segment_burner and self.segmented_mode != "off":
+                duration, ranges = await self.segment_burner.plan(video_path, media)
+                if len(ranges) > 1 and (self.segmented_mode == "on" or duration >= self.segment_min_duration):
+                    return await self.segment_burner.burn(
+                        video_path, srt_path, output_path, HARD_SUBTITLE_STYLE, ranges, on_progress
+                    )
+            
+            # Burn-ins share the cores through the scheduler's burn lane
+            await self.scheduler.run(
+                BURN,
                 self._embed_subtitles_ffmpeg,
                 str(video_path),
                 str(srt_path),
-                str(output_path)
+                str(output_path),
+                on_progress
             )
             
-            return output_path
+            return {"ranges": 1, "encoded_ranges": 1, "encoded_seconds": None}
             
         except Exception as e:
             raise Exception(f"ไม่สามารถฝัง subtitle ได้: {str(e)}")
     
-    def _embed_subtitles_ffmpeg(self, video_path: str, srt_path: str, output_path: str):
+    def _embed_subtitles_ffmpeg(self, video_path: str, srt_path: str, output_path: str,
+                                on_progress: Optional[ProgressCallback] = None, threads: int = 0):
         """Helper function to embed subtitles using ffmpeg - optimized for speed"""
         try:
-            # Fast and simple subtitle style for Thai text
-            simple_style = (
-                "FontSize=24,"              # Good readable size
-                "PrimaryColour=&Hffffff,"   # White text
-                "OutlineColour=&H000000,"   # Black outline
-                "Outline=2,"                # Simple outline
-                "Alignment=2,"              # Bottom center
-                "MarginV=30"                # Bottom margin
-            )
-            
             # Fast ffmpeg command - prioritize speed over quality
             cmd = [
                 'ffmpeg',
                 '-i', video_path,
-                '-vf', f"subtitles='{srt_path}':force_style='{simple_style}'",
+                '-vf', f"subtitles='{srt_path}':force_style='{HARD_SUBTITLE_STYLE}'",
                 '-c:a', 'copy',             # Copy audio (no re-encoding)
                 '-c:v', 'libx264',          # Video codec
                 '-preset', 'ultrafast',     # Fastest encoding preset
                 '-crf', '23',               # Balanced quality/speed
-                '-threads', '0',            # Use all available CPU cores
+                '-threads', str(threads),   # Thread budget from the scheduler
                 '-y',                       # Overwrite output
                 output_path
             ]
             
             print(f"Running fast ffmpeg command for subtitle embedding...")
             
-            # Run ffmpeg command with timeout
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True,
-                timeout=600  # 10 minute timeout
-            )
+            # Run ffmpeg command with timeout, reporting progress as it encodes
+            run_ffmpeg(cmd, on_progress=on_progress, timeout=600)  # 10 minute timeout
             
             print(f"Fast ffmpeg completed successfully")
             
         except subprocess.TimeoutExpired:
             print("ffmpeg timeout - trying simpler method")
-            self._embed_subtitles_simple(video_path, srt_path, output_path)
+            self._embed_subtitles_simple(video_path, srt_path, output_path, on_progress, threads)
         except subprocess.CalledProcessError as e:
             print(f"ffmpeg error: {e.stderr}")
             # Try simpler method
             try:
                 print("Trying simpler method...")
-                self._embed_subtitles_simple(video_path, srt_path, output_path)
+                self._embed_subtitles_simple(video_path, srt_path, output_path, on_progress, threads)
             except Exception as fallback_error:
                 raise Exception(f"ffmpeg ล้มเหลว: {e.stderr}")
         except FileNotFoundError:
@@ -125,7 +178,8 @@ class VideoProcessor:
         except Exception as e:
             raise Exception(f"การฝัง subtitle ล้มเหลว: {str(e)}")
     
-    def _embed_subtitles_simple(self, video_path: str, srt_path: str, output_path: str):
+    def _embed_subtitles_simple(self, video_path: str, srt_path: str, output_path: str,
+                                on_progress: Optional[ProgressCallback] = None, threads: int = 0):
         """Ultra-simple and fast subtitle embedding"""
         try:
             # Minimal ffmpeg command for maximum speed
@@ -137,20 +191,14 @@ class VideoProcessor:
                 '-c:v', 'libx264',                 # Video codec
                 '-preset', 'veryfast',             # Very fast preset
                 '-crf', '25',                      # Lower quality for speed
-                '-threads', '0',                   # Use all cores
+                '-threads', str(threads),          # Thread budget from the scheduler
                 '-y',
                 output_path
             ]
             
             print(f"Running ultra-simple ffmpeg command...")
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True,
-                timeout=300  # 5 minute timeout
-            )
+            run_ffmpeg(cmd, on_progress=on_progress, timeout=300)  # 5 minute timeout
             
             print(f"Simple ffmpeg completed successfully")
             
@@ -158,7 +206,8 @@ class VideoProcessor:
             print(f"Simple ffmpeg failed: {str(e)}")
             raise Exception(f"Simple ffmpeg ล้มเหลว: {str(e)}")
     
-    def _embed_subtitles_fallback(self, video_path: str, srt_path: str, output_path: str):
+    def _embed_subtitles_fallback(self, video_path: str, srt_path: str, output_path: str,
+                                  on_progress: Optional[ProgressCallback] = None, threads: int = 0):
         """Fast fallback method for subtitle embedding"""
         try:
             # Single fast fallback method
@@ -170,20 +219,14 @@ class VideoProcessor:
                 '-c:v', 'libx264',                 # Video codec
                 '-preset', 'superfast',            # Fastest preset
                 '-crf', '28',                      # Lower quality for speed
-                '-threads', '0',                   # Use all cores
+                '-threads', str(threads),          # Thread budget from the scheduler
                 '-y',
                 output_path
             ]
             
             print(f"Running fast fallback method...")
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True,
-                timeout=180  # 3 minute timeout
-            )
+            run_ffmpeg(cmd, on_progress=on_progress, timeout=180)  # 3 minute timeout
             
             print(f"Fast fallback completed successfully")
             
@@ -191,17 +234,26 @@ class VideoProcessor:
             print(f"Fast fallback failed: {str(e)}")
             raise Exception(f"Fast fallback ล้มเหลว: {str(e)}")
     
-    async def embed_subtitles_soft(self, video_path: Path, srt_path: Path, output_path: Path) -> Path:
-        """ฝัง subtitle แบบ soft subtitle (ไม่เผาลงในวิดีโอ)"""
+    async def embed_subtitles_soft(self, video_path: Path, tracks: List[Tuple[str, Path]], output_path: Path,
+                                   on_progress: Optional[ProgressCallback] = None,
+                                   default_language: Optional[str] = None) -> Path:
+        """ฝัง subtitle แบบ soft subtitle (ไม่เผาลงในวิดีโอ)
+
+        tracks is [(language, srt_path), ...]; all of them are muxed as
+        separate subtitle tracks in one stream-copy pass. The container
+        (mp4 or mkv) comes from output_path; default_language (the first
+        track unless given) is flagged as the default track.
+        """
         try:
-            # Run embedding in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
+            # Stream copy only - runs in the mux lane, apart from burn-ins
+            await self.scheduler.run(
+                MUX,
                 self._embed_subtitles_soft_ffmpeg,
                 str(video_path),
-                str(srt_path),
-                str(output_path)
+                [(language, str(srt_path)) for language, srt_path in tracks],
+                str(output_path),
+                default_language or tracks[0][0],
+                on_progress
             )
             
             return output_path
@@ -209,18 +261,36 @@ class VideoProcessor:
         except Exception as e:
             raise Exception(f"ไม่สามารถฝัง soft subtitle ได้: {str(e)}")
     
-    def _embed_subtitles_soft_ffmpeg(self, video_path: str, srt_path: str, output_path: str):
+    def _embed_subtitles_soft_ffmpeg(self, video_path: str, tracks: List[Tuple[str, str]], output_path: str,
+                                     default_language: str, on_progress: Optional[ProgressCallback] = None,
+                                     threads: int = 1):
         """Helper function to embed soft subtitles using ffmpeg"""
         try:
+            codec = SOFT_SUBTITLE_CODECS[Path(output_path).suffix.lstrip(".")]
+            
             # Build ffmpeg command for soft subtitles
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,          # Input video
-                '-i', srt_path,            # Input subtitle
+            cmd = ['ffmpeg', '-i', video_path]            # Input video
+            for _, srt_path in tracks:
+                cmd += ['-i', srt_path]                     # One input per subtitle track
+            cmd += ['-map', '0:v:0', '-map', '0:a?']
+            for index in range(len(tracks)):
+                cmd += ['-map', f'{index + 1}:0']
+            cmd += [
                 '-c:v', 'copy',            # Copy video without re-encoding
                 '-c:a', 'copy',            # Copy audio without re-encoding
-                '-c:s', 'mov_text',        # Subtitle codec for MP4
-                '-metadata:s:s:0', 'language=th',  # Set subtitle language
+                '-c:s', codec,             # mov_text for MP4, srt for MKV
+            ]
+            for index, (language, _) in enumerate(tracks):
+                cmd += [
+                    f'-metadata:s:s:{index}', f'language={iso639_2(language)}',
+                    f'-metadata:s:s:{index}', f'title={display_name(language)}',
+                    f'-disposition:s:{index}', 'default' if language == default_language else '0'
+                ]
+                if codec == 'mov_text':
+                    # MP4 players show the handler name as the track name
+                    cmd += [f'-metadata:s:s:{index}', f'handler_name={display_name(language)}']
+            cmd += [
+                '-threads', str(threads),
                 '-y',                      # Overwrite output file
                 output_path
             ]
@@ -228,14 +298,9 @@ class VideoProcessor:
             print(f"Running ffmpeg soft subtitle command: {' '.join(cmd)}")
             
             # Run ffmpeg command
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            run_ffmpeg(cmd, on_progress=on_progress)
             
-            print(f"ffmpeg soft subtitle completed successfully")
+            print(f"ffmpeg soft subtitle completed successfully ({len(tracks)} tracks)")
             
         except subprocess.CalledProcessError as e:
             print(f"ffmpeg error: {e.stderr}")
@@ -245,17 +310,17 @@ class VideoProcessor:
         except Exception as e:
             raise Exception(f"การฝัง soft subtitle ล้มเหลว: {str(e)}")
 
-    def get_video_info(self, video_path: Path) -> dict:
-        """ดึงข้อมูลของไฟล์วิดีโอ"""
+    def get_video_info(self, video_path: Path, media: Optional[dict] = None) -> dict:
+        """ดึงข้อมูลของไฟล์วิดีโอ (จาก probe ที่เก็บไว้ ถ้ามี)"""
         try:
-            video = VideoFileClip(str(video_path))
-            info = {
-                "duration": video.duration,
-                "fps": video.fps,
-                "size": video.size,
-                "audio_fps": video.audio.fps if video.audio else None
+            media = media or self.media_prober.probe(video_path)
+            video = next((stream for stream in media["streams"] if stream["type"] == "video"), None)
+            audio = next((stream for stream in media["streams"] if stream["type"] == "audio"), None)
+            return {
+                "duration": media["duration"],
+                "fps": video["fps"] if video else None,
+                "size": [video["width"], video["height"]] if video else None,
+                "audio_fps": audio["sample_rate"] if audio else None
             }
-            video.close()
-            return info
         except Exception as e:
             raise Exception(f"ไม่สามารถดึงข้อมูลวิดีโอได้: {str(e)}")
\ No newline at end of file
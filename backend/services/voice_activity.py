@@ -0,0 +1,268 @@
+import os
+import bisect
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from models.subtitle_models import SubtitleSegment
+
+# Audio is analysed (and the speech-only file written) as 16 kHz mono PCM
+SAMPLE_RATE = 16000
+# Frames per block read from ffmpeg
+BLOCK_FRAMES = 4096
+
+
+@dataclass
+class TimeMap:
+    """Where each speech region of the trimmed audio came from in the original"""
+    trimmed_starts: List[float]
+    original_starts: List[float]
+    lengths: List[float]
+
+    def to_original(self, time: float, is_end: bool = False) -> float:
+        """Original time of a trimmed-audio time.
+
+        A time inside the silence put between two regions maps to the end
+        of the region before it (segment ends) or the start of the one
+        after it (segment starts).
+        """
+        index = bisect.bisect_right(self.trimmed_starts, time) - 1
+        if index < 0:
+            return self.original_starts[0] if self.original_starts else time
+        offset = time - self.trimmed_starts[index]
+        if offset <= self.lengths[index]:
+            return self.original_starts[index] + offset
+        if is_end or index + 1 == len(self.lengths):
+            return self.original_starts[index] + self.lengths[index]
+        return self.original_starts[index + 1]
+
+    def remap(self, segments: List[SubtitleSegment]) -> List[SubtitleSegment]:
+        remapped = []
+        for segment in segments:
+            start = self.to_original(segment.start)
+            end = max(start, self.to_original(segment.end, is_end=True))
+            remapped.append(SubtitleSegment(start=start, end=end, text=segment.text))
+        return remapped
+
+
+@dataclass
+class SpeechTrim:
+    path: Path                    # audio to send to ASR
+    time_map: Optional[TimeMap]   # None when nothing was cut
+    stats: dict
+
+
+class VoiceActivityDetector:
+    """Cut non-speech out of audio before it is sent to ASR.
+
+    ffmpeg decodes the audio to 16 kHz mono PCM, which is read in blocks;
+    every VAD_FRAME_MS frame gets its energy (dBFS) and zero-crossing rate
+    in one vectorized NumPy pass. A frame is speech when its energy is at
+    least VAD_THRESHOLD_DB above the noise floor (the 10th percentile of
+    all frames) and its zero-crossing rate is at most VAD_MAX_ZCR, since
+    hiss and broadband noise cross zero far more often than voice.
+    Regions shorter than VAD_MIN_SPEECH are dropped, the rest padded by
+    VAD_PADDING and joined across gaps shorter than VAD_MIN_SILENCE.
+
+    The speech regions are written back to back, VAD_GAP_SECONDS of
+    silence apart, as a compact MP3 with a TimeMap to the original
+    timeline. Audio that would shrink by less than VAD_MIN_SAVED_RATIO is
+    sent as it is.
+
+    Settings (env): VAD_ENABLED (true), VAD_FRAME_MS (30),
+    VAD_THRESHOLD_DB (12), VAD_MAX_ZCR (0.35), VAD_MIN_SPEECH (0.2),
+    VAD_PADDING (0.3), VAD_MIN_SILENCE (1.0), VAD_GAP_SECONDS (0.3),
+    VAD_MIN_SAVED_RATIO (0.1).
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("VAD_ENABLED", "true").lower() == "true"
+        self.frame_samples = int(SAMPLE_RATE * float(os.getenv("VAD_FRAME_MS", "30")) / 1000)
+        self.threshold_db = float(os.getenv("VAD_THRESHOLD_DB", "12"))
+        self.max_zcr = float(os.getenv("VAD_MAX_ZCR", "0.35"))
+        self.min_speech = float(os.getenv("VAD_MIN_SPEECH", "0.2"))
+        self.padding = float(os.getenv("VAD_PADDING", "0.3"))
+        self.min_silence = float(os.getenv("VAD_MIN_SILENCE", "1.0"))
+        self.gap_seconds = float(os.getenv("VAD_GAP_SECONDS", "0.3"))
+        self.min_saved_ratio = float(os.getenv("VAD_MIN_SAVED_RATIO", "0.1"))
+        self.audio_bitrate = os.getenv("ASR_AUDIO_BITRATE", "32k")
+
+    def _decode(self, audio_path: Path) -> subprocess.Popen:
+        try:
+            return subprocess.Popen(
+                [
+                    'ffmpeg', '-nostdin',
+                    '-i', str(audio_path),
+                    '-f', 's16le',
+                    '-ac', '1',
+                    '-ar', str(SAMPLE_RATE),
+                    '-loglevel', 'error',
+                    '-'
+                ],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+
+    def _blocks(self, audio_path: Path):
+        """int16 sample blocks of the decoded audio"""
+        process = self._decode(audio_path)
+        block_bytes = BLOCK_FRAMES * self.frame_samples * 2
+        try:
+            while data := process.stdout.read(block_bytes):
+                yield np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+        finally:
+            process.stdout.close()
+            stderr = process.stderr.read().decode("utf-8", "replace")
+            if process.wait() != 0:
+                raise Exception(f"ไม่สามารถอ่านไฟล์เสียงได้: {stderr.strip()}")
+
+    def frame_features(self, audio_path: Path) -> Tuple[np.ndarray, np.ndarray, int]:
+        """(energy in dBFS, zero-crossing rate) per frame, and the number of samples"""
+        energies = []
+        crossings = []
+        samples = 0
+        carry = np.zeros(0, dtype=np.int16)
+        for block in self._blocks(audio_path):
+            samples += len(block)
+            block = np.concatenate((carry, block)) if len(carry) else block
+            usable = len(block) - len(block) % self.frame_samples
+            carry = block[usable:]
+            if usable:
+                energy, zcr = self._features(block[:usable])
+                energies.append(energy)
+                crossings.append(zcr)
+        if len(carry):
+            # Last partial frame, padded with silence
+            energy, zcr = self._features(np.concatenate((carry, np.zeros(self.frame_samples - len(carry), np.int16))))
+            energies.append(energy)
+            crossings.append(zcr)
+        if not energies:
+            return np.zeros(0), np.zeros(0), 0
+        return np.concatenate(energies), np.concatenate(crossings), samples
+
+    def _features(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        frames = samples.reshape(-1, self.frame_samples).astype(np.float32) / 32768.0
+        energy = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_samples - 1)
+        return energy, zcr
+
+    def speech_regions(self, energy: np.ndarray, zcr: np.ndarray, duration: float) -> List[Tuple[float, float]]:
+        """(start, end) seconds of speech"""
+        if not len(energy):
+            return []
+        noise_floor = np.percentile(energy, 10)
+        speech = (energy >= noise_floor + self.threshold_db) & (zcr <= self.max_zcr)
+
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], speech, [False])).astype(np.int8)))
+        frame_seconds = self.frame_samples / SAMPLE_RATE
+        starts = edges[0::2] * frame_seconds
+        ends = edges[1::2] * frame_seconds
+        keep = ends - starts >= self.min_speech
+        starts = np.maximum(starts[keep] - self.padding, 0.0)
+        ends = np.minimum(ends[keep] + self.padding, duration)
+
+        regions: List[Tuple[float, float]] = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if regions and start - regions[-1][1] < self.min_silence:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+        return regions
+
+    def trim(self, audio_path: Path, output_dir: Path) -> Optional[SpeechTrim]:
+        """Speech-only copy of audio_path in output_dir, or None if VAD is disabled"""
+        if not self.enabled:
+            return None
+
+        energy, zcr, samples = self.frame_features(audio_path)
+        duration = samples / SAMPLE_RATE
+        regions = self.speech_regions(energy, zcr, duration)
+        original_bytes = audio_path.stat().st_size
+        speech_seconds = sum(end - start for start, end in regions)
+        trimmed_seconds = speech_seconds + self.gap_seconds * max(len(regions) - 1, 0)
+
+        if not regions or duration - trimmed_seconds < self.min_saved_ratio * duration:
+            # Nothing worth cutting (or no speech found at all): send the audio as it is
+            return SpeechTrim(audio_path, None, self._stats(duration, duration, original_bytes, original_bytes,
+                                                            len(regions), False))
+
+        output_path = output_dir / f"speech{audio_path.suffix or '.mp3'}"
+        time_map = self._write_speech(audio_path, regions, output_path)
+        return SpeechTrim(output_path, time_map, self._stats(
+            duration, trimmed_seconds, original_bytes, output_path.stat().st_size, len(regions), True
+        ))
+
+    def _write_speech(self, audio_path: Path, regions: List[Tuple[float, float]], output_path: Path) -> TimeMap:
+        """Decode again and pipe only the speech regions to an encoder"""
+        sample_regions = [(int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)) for start, end in regions]
+        gap = np.zeros(int(self.gap_seconds * SAMPLE_RATE), dtype=np.int16).tobytes()
+        try:
+            encoder = subprocess.Popen(
+                [
+                    'ffmpeg', '-nostdin',
+                    '-f', 's16le',
+                    '-ar', str(SAMPLE_RATE),
+                    '-ac', '1',
+                    '-i', '-',
+                    '-c:a', 'libmp3lame',
+                    '-b:a', self.audio_bitrate,
+                    '-loglevel', 'error',
+                    '-y',
+                    str(output_path)
+                ],
+                stdin=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise Exception("ไม่พบ ffmpeg กรุณาติดตั้ง ffmpeg ก่อน")
+
+        region = 0
+        position = 0
+        try:
+            for block in self._blocks(audio_path):
+                block_end = position + len(block)
+                while region < len(sample_regions) and sample_regions[region][0] < block_end:
+                    start, end = sample_regions[region]
+                    low, high = max(start, position), min(end, block_end)
+                    if high > low:
+                        encoder.stdin.write(block[low - position:high - position].tobytes())
+                    if end > block_end:
+                        break   # Region continues in the next block
+                    if region + 1 < len(sample_regions):
+                        encoder.stdin.write(gap)
+                    region += 1
+                position = block_end
+        finally:
+            encoder.stdin.close()
+            stderr = encoder.stderr.read().decode("utf-8", "replace")
+            if encoder.wait() != 0:
+                raise Exception(f"ไม่สามารถสร้างไฟล์เสียงที่ตัดช่วงเงียบได้: {stderr.strip()}")
+
+        trimmed_starts, original_starts, lengths = [], [], []
+        trimmed = 0.0
+        for start, end in sample_regions:
+            length = (end - start) / SAMPLE_RATE
+            trimmed_starts.append(trimmed)
+            original_starts.append(start / SAMPLE_RATE)
+            lengths.append(length)
+            trimmed += length + len(gap) / 2 / SAMPLE_RATE
+        return TimeMap(trimmed_starts, original_starts, lengths)
+
+    def _stats(self, original_seconds: float, uploaded_seconds: float, original_bytes: int, uploaded_bytes: int,
+               regions: int, trimmed: bool) -> dict:
+        return {
+            "trimmed": trimmed,
+            "speech_regions": regions,
+            "original_seconds": round(original_seconds, 3),
+            "uploaded_seconds": round(uploaded_seconds, 3),
+            "saved_seconds": round(original_seconds - uploaded_seconds, 3),
+            "original_bytes": original_bytes,
+            "uploaded_bytes": uploaded_bytes,
+            "saved_bytes": original_bytes - uploaded_bytes
+        }
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend imports its modules as top-level packages (services, models)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,31 @@
+import json
+
+from services.ai_backends import ChatBackend, ChatResult
+
+
+class ScriptedBackend(ChatBackend):
+    """Answers each request with the next scripted reply: an exception, or a function of the ids"""
+
+    model = "test-model"
+    fallback_model = "test-fallback"
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.texts = []
+        self.prompts = []
+
+    async def complete(self, system_prompt, user_content, max_tokens, model=None,
+                       temperature=0.3, json_mode=False):
+        segments = json.loads(user_content)["segments"]
+        self.requests.append([segment["id"] for segment in segments])
+        self.texts.extend(segment["text"] for segment in segments)
+        self.prompts.append(system_prompt)
+        reply = self.replies.pop(0) if self.replies else translate_all
+        if isinstance(reply, Exception):
+            raise reply
+        return ChatResult(json.dumps({"translations": reply(segments)}), 10, 10)
+
+
+def translate_all(segments):
+    return [{"id": segment["id"], "text": f"T:{segment['text']}"} for segment in segments]
@@ -0,0 +1,20 @@
+import hashlib
+
+from services.content_store import ContentStore
+
+
+def add_copy(store, tmp_path, file_id, data):
+    source = tmp_path / f"{file_id}.mp4.part"
+    source.write_bytes(data)
+    return store.add(file_id, source, hashlib.sha256(data).hexdigest(), ".mp4", "clip.mp4")
+
+
+def test_deduplicated_uploads_share_artifacts_but_not_partial_transcripts(tmp_path):
+    store = ContentStore(tmp_path)
+    add_copy(store, tmp_path, "first", b"same video")
+    add_copy(store, tmp_path, "second", b"same video")
+
+    first, second = store.paths("first"), store.paths("second")
+    assert first.video == second.video
+    assert first.srt("original") == second.srt("original")
+    assert first.partial_transcript("first") != second.partial_transcript("second")
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from fakes import ScriptedBackend
+from services import subtitle_io
+from services.pipeline import Pipeline
+from services.subtitle_io import CueList
+from services.transcript_editor import TranscriptVersionConflict
+
+TRANSCRIPT = CueList([(0.0, 1.0, "หนึ่ง"), (1.0, 2.0, "สอง"), (2.0, 3.0, "สาม")])
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.setenv("ASR_BACKEND", "local")
+    monkeypatch.setenv("TRANSLATION_BACKEND", "local")
+    pipeline = Pipeline(tmp_path)
+    pipeline.translation_service.backend = ScriptedBackend([])
+    return pipeline
+
+
+@pytest.fixture
+def file_id(pipeline, tmp_path):
+    source = tmp_path / "upload.part"
+    source.write_bytes(b"video")
+    pipeline.content_store.add("clip", source, hashlib.sha256(b"video").hexdigest(), ".mp4", "clip.mp4")
+    subtitle_io.write(pipeline.paths("clip").srt("original"), TRANSCRIPT, "srt")
+    return "clip"
+
+
+def test_edit_saves_a_new_version(pipeline, file_id):
+    result = pipeline.edit_transcript(file_id, [
+        {"op": "update", "index": 1, "text": "สองใหม่"},
+        {"op": "delete", "index": 2},
+        {"op": "insert", "index": 0, "start": 0.0, "end": 0.5, "text": "ศูนย์"},
+    ])
+    assert (result["previous_version"], result["version"]) == (1, 2)
+    assert result["changed_segments"] == [0, 2]
+    paths = pipeline.paths(file_id)
+    assert subtitle_io.read(paths.srt("original")).texts == ["ศูนย์", "หนึ่ง", "สองใหม่"]
+    assert subtitle_io.read(paths.transcript(1)).texts == TRANSCRIPT.texts
+    assert subtitle_io.read(paths.transcript(2)).texts == ["ศูนย์", "หนึ่ง", "สองใหม่"]
+
+
+def test_edit_that_changes_nothing_keeps_the_version(pipeline, file_id):
+    result = pipeline.edit_transcript(file_id, [{"index": 0, "text": "หนึ่ง"}])
+    assert result["version"] == result["previous_version"] == 1
+
+
+def test_edit_against_a_stale_version_conflicts(pipeline, file_id):
+    pipeline.edit_transcript(file_id, [{"index": 0, "text": "แก้"}], base_version=1)
+    with pytest.raises(TranscriptVersionConflict) as conflict:
+        pipeline.edit_transcript(file_id, [{"index": 1, "text": "แก้อีก"}], base_version=1)
+    assert conflict.value.latest_version == 2
+    assert subtitle_io.read(pipeline.paths(file_id).srt("original")).texts == ["แก้", "สอง", "สาม"]
+
+
+def test_edit_conflicts_when_another_process_saves_first(pipeline, file_id, monkeypatch):
+    store = pipeline.content_store
+    add_version = store.add_transcript_version
+
+    def racing_add(file_id, srt_hash, segments, changed, base_version=None):
+        add_version(file_id, "from another process", segments, changed)
+        return add_version(file_id, srt_hash, segments, changed, base_version)
+
+    pipeline.transcript_version(file_id)
+    monkeypatch.setattr(store, "add_transcript_version", racing_add)
+    with pytest.raises(TranscriptVersionConflict):
+        pipeline.edit_transcript(file_id, [{"index": 0, "text": "แก้"}])
+    paths = pipeline.paths(file_id)
+    assert subtitle_io.read(paths.srt("original")).texts == TRANSCRIPT.texts
+    assert not paths.srt("original").with_name(paths.srt("original").name + ".tmp").exists()
+
+
+def test_invalid_edit_leaves_the_transcript_alone(pipeline, file_id):
+    with pytest.raises(ValueError):
+        pipeline.edit_transcript(file_id, [{"index": 0, "text": "แก้"}, {"index": 5, "text": "x"}])
+    assert pipeline.content_store.transcript_version(file_id)["version"] == 1
+
+
+def test_retranslate_sends_only_changed_segments(pipeline, file_id):
+    backend = pipeline.translation_service.backend
+    # Without the cache, only the splice can keep unchanged lines from the API
+    pipeline.translation_service.cache = None
+    asyncio.run(pipeline.translate(file_id, "english", "formal"))
+    assert backend.texts == TRANSCRIPT.texts
+
+    pipeline.edit_transcript(file_id, [
+        {"op": "update", "index": 1, "text": "สองใหม่"},
+        {"op": "insert", "index": 3, "start": 3.0, "end": 4.0, "text": "สี่"},
+        {"op": "delete", "index": 0},
+    ])
+    backend.texts.clear()
+    backend.prompts.clear()
+    result = asyncio.run(pipeline.retranslate_changes(file_id))
+
+    assert backend.texts == ["สองใหม่", "สี่"]
+    # The translation keeps the style it was made with
+    assert all("formal" in prompt for prompt in backend.prompts)
+    assert result["results"][0]["retranslated"] == 2
+    assert result["results"][0]["reused"] == 1
+    translated = subtitle_io.read(pipeline.paths(file_id).srt("english"))
+    assert list(translated) == [(1.0, 2.0, "T:สองใหม่"), (2.0, 3.0, "T:สาม"), (3.0, 4.0, "T:สี่")]
+
+    # Up to date now: nothing is sent
+    backend.texts.clear()
+    asyncio.run(pipeline.retranslate_changes(file_id))
+    assert backend.texts == []
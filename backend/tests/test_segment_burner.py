@@ -0,0 +1,122 @@
+import asyncio
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from services import subtitle_io
+from services.ai_backends import TranscriptionBackend
+from services.encode_scheduler import EncodeScheduler
+from services.media_probe import probe_keyframes
+from services.segment_burner import SegmentBurner, nearest_boundaries, plan_ranges
+from services.subtitle_io import CueList
+from services.transcription_service import TranscriptionService
+from services.video_processor import HARD_SUBTITLE_STYLE
+
+
+def test_plan_cuts_at_the_first_keyframe_after_each_target():
+    keyframes = [0.0, 50.0, 100.0, 130.0, 200.0, 250.0, 290.0]
+    assert plan_ranges(300.0, keyframes, 120.0) == [(0.0, 130.0), (130.0, 250.0), (250.0, 300.0)]
+
+
+def test_plan_without_keyframes_is_one_range():
+    assert plan_ranges(300.0, [], 120.0) == [(0.0, 300.0)]
+
+
+def test_plan_ignores_keyframes_at_or_past_the_end():
+    assert plan_ranges(130.0, [0.0, 125.0, 130.0, 400.0], 120.0) == [(0.0, 130.0)]
+
+
+def test_plan_keeps_a_short_tail_in_the_last_range():
+    # 250 is a keyframe, but cutting there would leave a 10 s range
+    assert plan_ranges(260.0, [0.0, 120.0, 250.0], 120.0) == [(0.0, 120.0), (120.0, 260.0)]
+
+
+@pytest.mark.parametrize("duration", [0.0, None])
+def test_plan_with_no_duration_has_no_ranges(duration):
+    assert plan_ranges(duration, [0.0, 120.0], 120.0) == []
+
+
+def test_boundaries_are_the_nearest_output_keyframes():
+    assert nearest_boundaries([0.0, 120.0], [0.0, 60.04, 120.04, 180.0], 200.0) == [0.0, 120.04, 200.0]
+
+
+def test_boundaries_without_keyframes_or_out_of_tolerance():
+    assert nearest_boundaries([0.0, 120.0], [], 200.0) is None
+    assert nearest_boundaries([0.0, 120.0], [0.0, 119.0], 200.0) is None
+
+
+ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+class RecordingBurner(SegmentBurner):
+    """Records the start of every range it encodes"""
+
+    def __init__(self):
+        super().__init__(EncodeScheduler(2), TranscriptionService(TranscriptionBackend()))
+        self.segment_seconds = 2.0
+        self.retries = 0
+        self.encoded = []
+
+    def _encode_piece(self, video_path, start, *args, **kwargs):
+        self.encoded.append(start)
+        return super()._encode_piece(video_path, start, *args, **kwargs)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=duration=6:size=160x120:rate=25',
+         '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '25', '-pix_fmt', 'yuv420p', '-y', str(path)],
+        check=True
+    )
+    return path
+
+
+def burn(burner, video, cues, output, style=HARD_SUBTITLE_STYLE):
+    srt_path = output.with_name("subs.srt")
+    subtitle_io.write(srt_path, cues, "srt")
+    duration, ranges = asyncio.run(burner.plan(video))
+    burner.encoded.clear()
+    return ranges, asyncio.run(burner.burn(video, srt_path, output, style, ranges))
+
+
+@ffmpeg
+def test_burn_reencodes_only_the_range_whose_cue_changed(video, tmp_path):
+    burner = RecordingBurner()
+    output = tmp_path / "burned.mp4"
+    cues = CueList([(0.5, 1.5, "one"), (2.5, 3.5, "two"), (4.5, 5.5, "three")])
+
+    ranges, stats = burn(burner, video, cues, output)
+    assert ranges == [(0.0, 2.0), (2.0, 4.0), (4.0, 6.0)]
+    assert stats["encoded_ranges"] == 3
+    manifest = json.loads(output.with_name("burned.mp4.ranges.json").read_text())
+    assert manifest["boundaries"] == pytest.approx([0.0, 2.0, 4.0, 6.0], abs=0.05)
+
+    _, stats = burn(burner, video, cues.with_texts(["one", "TWO", "three"]), output)
+    assert stats["encoded_ranges"] == 1
+    assert burner.encoded == [2.0]
+    duration, keyframes = probe_keyframes(output)
+    assert duration == pytest.approx(6.0, abs=0.1)
+
+    # Nothing changed: every range is copied
+    _, stats = burn(burner, video, cues.with_texts(["one", "TWO", "three"]), output)
+    assert stats["encoded_ranges"] == 0
+
+
+@ffmpeg
+def test_burn_does_not_reuse_across_styles_or_edited_outputs(video, tmp_path):
+    burner = RecordingBurner()
+    output = tmp_path / "burned.mp4"
+    cues = CueList([(0.5, 1.5, "one"), (2.5, 3.5, "two"), (4.5, 5.5, "three")])
+    burn(burner, video, cues, output)
+
+    _, stats = burn(burner, video, cues, output, style="FontSize=30")
+    assert stats["encoded_ranges"] == 3
+
+    # An output replaced behind the manifest's back is not trusted
+    shutil.copyfile(video, output)
+    _, stats = burn(burner, video, cues, output, style="FontSize=30")
+    assert stats["encoded_ranges"] == 3
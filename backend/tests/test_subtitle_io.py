@@ -0,0 +1,138 @@
+import pytest
+
+from services import subtitle_io
+from services.subtitle_io import CueList
+
+CUES = CueList([
+    (0.0, 1.5, "สวัสดี"),
+    (1.5, 3.25, "บรรทัดแรก\nบรรทัดที่สอง"),
+    (3661.007, 3662.0, "hour mark"),
+])
+
+
+@pytest.mark.parametrize("subtitle_format", ["srt", "vtt", "ass"])
+def test_round_trip(subtitle_format):
+    parsed = subtitle_io.parse(subtitle_io.dumps(CUES, subtitle_format), subtitle_format)
+    assert parsed.texts == CUES.texts
+    # ASS keeps centiseconds
+    precision = 0.01 if subtitle_format == "ass" else 0.001
+    for (start, end, _), (expected_start, expected_end, _) in zip(parsed, CUES):
+        assert start == pytest.approx(expected_start, abs=precision)
+        assert end == pytest.approx(expected_end, abs=precision)
+
+
+@pytest.mark.parametrize("subtitle_format", ["srt", "vtt", "ass"])
+def test_write_and_read_file(tmp_path, subtitle_format):
+    path = tmp_path / f"cues.{subtitle_format}"
+    subtitle_io.write(path, CUES)
+    assert subtitle_io.read(path).texts == CUES.texts
+
+
+def test_srt_without_indices_or_blank_lines():
+    content = (
+        "00:00:01,000 --> 00:00:02,000\n"
+        "first\n"
+        "2\n"
+        "00:00:02.500 --> 00:00:03.000\n"
+        "second\n"
+    )
+    assert list(subtitle_io.parse(content)) == [(1.0, 2.0, "first"), (2.5, 3.0, "second")]
+
+
+def test_srt_with_crlf_and_bom(tmp_path):
+    path = tmp_path / "windows.srt"
+    path.write_bytes(
+        "﻿1\r\n00:00:00,000 --> 00:00:01,000\r\nline one\r\nline two\r\n\r\n"
+        "2\r\n00:00:01,000 --> 00:00:02,000\r\nnext\r\n".encode("utf-8")
+    )
+    assert list(subtitle_io.read(path)) == [(0.0, 1.0, "line one\nline two"), (1.0, 2.0, "next")]
+    assert subtitle_io.parse(path.read_text(encoding="utf-8-sig")).texts == ["line one\nline two", "next"]
+
+
+def test_srt_extra_blank_lines_and_text_before_first_cue():
+    content = "garbage\n\n\n1\n00:00:00,000 --> 00:00:01,000\nonly\n\n\n\n"
+    assert list(subtitle_io.parse(content)) == [(0.0, 1.0, "only")]
+
+
+def test_vtt_skips_header_notes_and_cue_settings():
+    content = (
+        "WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000\n\n"
+        "NOTE a comment\nthat spans lines\n\n"
+        "STYLE\n::cue { color: red }\n\n"
+        "intro\n00:01.000 --> 00:02.000 align:start position:10%\n<i>hello</i>\n\n"
+    )
+    assert list(subtitle_io.parse(content, "vtt")) == [(1.0, 2.0, "<i>hello</i>")]
+
+
+def test_ass_override_tags_and_line_breaks():
+    content = (
+        "[Script Info]\nTitle: test\n\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        "Comment: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,not a cue\n"
+        "Dialogue: 0,0:00:01.50,0:00:03.00,Default,,0,0,0,,{\\i1}hello{\\i0}, world\\Nsecond\\hline\n"
+        "Dialogue: 0,bad,0:00:04.00,Default,,0,0,0,,skipped\n"
+    )
+    assert list(subtitle_io.parse(content, "ass")) == [(1.5, 3.0, "hello, world\nsecond line")]
+
+
+def test_ass_writer_escapes_line_breaks():
+    content = subtitle_io.dumps(CueList([(0.0, 1.0, "a\nb")]), "ass")
+    assert "Dialogue: 0,0:00:00.00,0:00:01.00,Default,,0,0,0,,a\\Nb\n" in content
+
+
+def test_vtt_header_override():
+    content = subtitle_io.dumps(CUES[:1], "vtt", header="WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000")
+    assert content.startswith("WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000\n\n00:00:00.000 --> ")
+
+
+def test_invalid_timestamp_and_format():
+    with pytest.raises(ValueError):
+        subtitle_io.parse_timestamp("00:00:01 000")
+    with pytest.raises(ValueError):
+        subtitle_io.detect_format("clip.txt")
+    assert subtitle_io.parse_timestamp("01:02.5") == pytest.approx(62.5)
+
+
+def test_append_and_read_from_offset(tmp_path):
+    path = tmp_path / "partial.srt"
+    path.write_text("", encoding="utf-8")
+
+    subtitle_io.append_srt(path, CUES[:2], 1)
+    cues, offset = subtitle_io.read_appended_srt(path, 0)
+    assert cues.texts == CUES.texts[:2]
+    assert offset == path.stat().st_size
+
+    cues, unchanged = subtitle_io.read_appended_srt(path, offset)
+    assert len(cues) == 0 and unchanged == offset
+
+    subtitle_io.append_srt(path, CUES[2:], 3)
+    cues, next_offset = subtitle_io.read_appended_srt(path, offset)
+    assert cues.texts == ["hour mark"]
+    assert next_offset == path.stat().st_size
+    # Numbering continues where the first append stopped
+    assert subtitle_io.read(path).texts == CUES.texts
+    assert "\n3\n01:01:01,007 --> " in path.read_text(encoding="utf-8")
+
+
+def test_read_appended_leaves_a_block_still_being_written(tmp_path):
+    path = tmp_path / "partial.srt"
+    subtitle_io.append_srt(path, CUES[:1], 1)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("2\n00:00:01,500 --> 00:00:03,250\nhalf writ")
+    cues, offset = subtitle_io.read_appended_srt(path, 0)
+    assert cues.texts == ["สวัสดี"]
+    assert offset < path.stat().st_size
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("ten\n\n")
+    cues, _ = subtitle_io.read_appended_srt(path, offset)
+    assert cues.texts == ["half written"]
+
+
+def test_cue_list_slices_and_window():
+    assert CUES[1:].texts == CUES.texts[1:]
+    with pytest.raises(ValueError):
+        CUES.with_texts(["one"])
+    window = CUES.window(1.0, 2.0)
+    assert list(window) == [(0.0, 0.5, "สวัสดี"), (0.5, 1.0, "บรรทัดแรก\nบรรทัดที่สอง")]
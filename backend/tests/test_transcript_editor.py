@@ -0,0 +1,72 @@
+import pytest
+
+from services.subtitle_io import CueList
+from services.transcript_editor import apply_edits, changed_segments, splice_translation
+
+CUES = CueList([(0.0, 1.0, "a"), (1.0, 2.0, "b"), (2.0, 3.0, "c")])
+
+
+def test_indices_refer_to_the_version_being_edited():
+    edited = apply_edits(CUES, [
+        {"op": "delete", "index": 0},
+        {"op": "update", "index": 1, "text": " B "},
+        {"op": "insert", "index": 2, "start": 1.5, "end": 2.0, "text": "new"},
+        {"op": "insert", "index": 3, "start": 3.0, "end": 4.0, "text": "last"},
+    ])
+    assert list(edited) == [(1.0, 2.0, "B"), (1.5, 2.0, "new"), (2.0, 3.0, "c"), (3.0, 4.0, "last")]
+    # The input is left alone
+    assert CUES.texts == ["a", "b", "c"]
+
+
+def test_update_defaults_to_op_update_and_keeps_unset_fields():
+    edited = apply_edits(CUES, [{"index": 2, "end": 3.5}])
+    assert edited[2] == (2.0, 3.5, "c")
+
+
+def test_inserts_at_one_index_keep_their_order():
+    edited = apply_edits(CUES, [
+        {"op": "insert", "index": 0, "start": 0.0, "end": 0.5, "text": "x"},
+        {"op": "insert", "index": 0, "start": 0.5, "end": 1.0, "text": "y"},
+    ])
+    assert edited.texts == ["x", "y", "a", "b", "c"]
+
+
+@pytest.mark.parametrize("edit", [
+    {"op": "update", "index": 3, "text": "x"},
+    {"op": "delete", "index": -1},
+    {"op": "insert", "index": 4, "start": 0.0, "end": 1.0, "text": "x"},
+    {"op": "update", "text": "x"},
+    {"op": "move", "index": 0},
+    {"op": "insert", "index": 0, "text": "no timing"},
+    {"op": "update", "index": 0, "text": "   "},
+    {"op": "update", "index": 0, "start": 2.0},
+])
+def test_invalid_edits(edit):
+    with pytest.raises(ValueError):
+        apply_edits(CUES, [edit])
+
+
+def test_duplicate_updates_are_rejected():
+    with pytest.raises(ValueError):
+        apply_edits(CUES, [{"index": 1, "text": "x"}, {"index": 1, "text": "y"}])
+
+
+def test_duplicate_deletes_delete_once():
+    assert apply_edits(CUES, [{"op": "delete", "index": 1}, {"op": "delete", "index": 1}]).texts == ["a", "c"]
+
+
+def test_changed_segments_are_new_or_reworded():
+    current = CueList([(0.0, 1.0, "a"), (1.0, 1.5, "new"), (1.5, 2.5, "b"), (2.5, 3.0, "C")])
+    assert changed_segments(CUES, current) == [1, 3]
+
+
+def test_splice_keeps_translations_of_unchanged_segments():
+    translation = CueList([(0.0, 1.0, "A"), (1.0, 2.0, "B"), (2.0, 3.0, "C")])
+    # "a" deleted, "b" retimed, "x" inserted, "c" reworded
+    current = CueList([(0.5, 2.5, "b"), (2.5, 2.8, "x"), (2.8, 3.0, "c!")])
+    assert splice_translation(CUES, current, translation) == ["B", None, None]
+
+
+def test_splice_with_a_translation_that_does_not_line_up():
+    translation = CueList([(0.0, 1.0, "A")])
+    assert splice_translation(CUES, CUES, translation) == [None, None, None]
@@ -0,0 +1,73 @@
+import pytest
+
+from services.translation_batcher import PER_SEGMENT_OVERHEAD_TOKENS, TranslationBatcher
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    monkeypatch.setenv("TRANSLATION_BATCH_INPUT_TOKENS", "200")
+    monkeypatch.setenv("TRANSLATION_BATCH_OUTPUT_TOKENS", "100000")
+    monkeypatch.setenv("TRANSLATION_BATCH_MAX_SEGMENTS", "60")
+    monkeypatch.setenv("TRANSLATION_MAX_OUTPUT_TOKENS", "16000")
+    return TranslationBatcher()
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("hello world!", 3),     # Latin, 4 characters a token
+    ("สวัสดีครับ", 7),        # Thai, 1.6
+    ("ສະບາຍດີ", 7),           # Lao, 1.0
+    ("မင်္ဂလာပါ", 18),        # Myanmar, 0.5
+    ("សួស្តី", 10),           # Khmer, 0.6
+    ("日本語", 3),            # Anything else, 1.0
+    ("", 0),
+])
+def test_estimates_per_script(batcher, text, tokens):
+    assert batcher.estimate_tokens(text) == tokens
+
+
+def test_output_estimate_depends_on_the_target_language(batcher):
+    assert batcher.estimate_output_tokens(100, "english") == 80
+    assert batcher.estimate_output_tokens(100, "myanmar") == 300
+    assert batcher.estimate_output_tokens(100, "klingon") == 150
+
+
+def test_batches_are_contiguous_and_within_budget(batcher):
+    texts = ["สวัสดีครับ" * 3] * 25
+    batches = batcher.plan(texts, "english")
+    assert [(batch.start, batch.end) for batch in batches] == [(0, 6), (6, 12), (12, 18), (18, 24), (24, 25)]
+    for batch in batches:
+        assert batch.input_tokens <= 200
+        assert batch.max_tokens >= batch.output_tokens
+
+
+def test_the_prompt_comes_out_of_the_input_budget(batcher):
+    # 31 tokens a line with its JSON framing
+    texts = ["สวัสดีครับ" * 3] * 6
+    assert len(batcher.plan(texts, "english")) == 1
+    assert [(b.start, b.end) for b in batcher.plan(texts, "english", prompt_tokens=100)] == [(0, 3), (3, 6)]
+
+
+def test_an_oversized_line_gets_a_batch_of_its_own(batcher):
+    texts = ["short", "ยาว" * 500, "short", "short"]
+    batches = batcher.plan(texts, "myanmar")
+    assert [(batch.start, batch.end) for batch in batches] == [(0, 1), (1, 2), (2, 4)]
+    oversized = batches[1]
+    assert oversized.input_tokens == batcher.estimate_tokens(texts[1]) + PER_SEGMENT_OVERHEAD_TOKENS
+    assert oversized.input_tokens > 200
+    # The completion limit is capped
+    assert oversized.max_tokens == min(16000, int(oversized.output_tokens * 1.5) + 200)
+
+
+def test_output_budget_and_segment_limit_also_split(monkeypatch):
+    monkeypatch.setenv("TRANSLATION_BATCH_INPUT_TOKENS", "100000")
+    monkeypatch.setenv("TRANSLATION_BATCH_OUTPUT_TOKENS", "100")
+    monkeypatch.setenv("TRANSLATION_BATCH_MAX_SEGMENTS", "3")
+    batcher = TranslationBatcher()
+    # 15 input tokens, 45 output tokens into Myanmar: two lines fill the output budget
+    assert [(b.start, b.end) for b in batcher.plan(["hello world!"] * 4, "myanmar")] == [(0, 2), (2, 4)]
+    # Into English the segment limit splits first
+    assert [(b.start, b.end) for b in batcher.plan(["hello world!"] * 4, "english")] == [(0, 3), (3, 4)]
+
+
+def test_no_texts_no_batches(batcher):
+    assert batcher.plan([], "english") == []
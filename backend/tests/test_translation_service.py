@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from fakes import ScriptedBackend, translate_all
+from services.ai_backends import TranscriptionBackend
+from services.transcription_service import TranscriptionService
+from services.translation_service import TranslationService
+
+
+def skip_first(segments):
+    return translate_all(segments)[1:]
+
+
+def make_service(backend, repair_rounds=2):
+    service = TranslationService(backend, transcription_service=TranscriptionService(TranscriptionBackend()))
+    service.repair_rounds = repair_rounds
+    return service
+
+
+def translate(service, texts):
+    return asyncio.run(service.translate_lines(texts, "english"))
+
+
+def test_translates_every_line():
+    backend = ScriptedBackend([])
+    assert translate(make_service(backend), ["หนึ่ง", "สอง"]) == ["T:หนึ่ง", "T:สอง"]
+    assert backend.requests == [[0, 1]]
+
+
+def test_repairs_only_missing_ids():
+    backend = ScriptedBackend([skip_first])
+    assert translate(make_service(backend), ["หนึ่ง", "สอง"]) == ["T:หนึ่ง", "T:สอง"]
+    assert backend.requests == [[0, 1], [0]]
+
+
+def test_malformed_ids_keep_source_text():
+    backend = ScriptedBackend([skip_first, skip_first, skip_first])
+    assert translate(make_service(backend), ["หนึ่ง", "สอง"]) == ["หนึ่ง", "T:สอง"]
+
+
+def test_request_error_is_repaired_by_a_later_round():
+    backend = ScriptedBackend([TimeoutError("timed out")])
+    assert translate(make_service(backend), ["หนึ่ง"]) == ["T:หนึ่ง"]
+
+
+def test_outage_raises_instead_of_returning_source_text():
+    service = make_service(ScriptedBackend([TimeoutError("timed out")] * 3))
+    with pytest.raises(TimeoutError):
+        translate(service, ["หนึ่ง", "สอง"])
+    # What the failed run planned is still counted
+    assert service.usage.to_dict()["segments"] == 2
+
+
+class DownForBackend(ScriptedBackend):
+    """Fails every request whose prompt asks for one of the given languages"""
+
+    def __init__(self, down):
+        super().__init__([])
+        self.down = down
+
+    async def complete(self, system_prompt, user_content, max_tokens, model=None,
+                       temperature=0.3, json_mode=False):
+        if any(language in system_prompt for language in self.down):
+            raise RuntimeError("down")
+        return await super().complete(system_prompt, user_content, max_tokens, model, temperature, json_mode)
+
+
+def test_multi_raises_only_when_no_language_succeeded(tmp_path):
+    srt_path = tmp_path / "original.srt"
+    srt_path.write_text("1\n00:00:00,000 --> 00:00:01,000\nหนึ่ง\n", encoding="utf-8")
+    targets = [("english", None), ("lao", None)]
+    saved = {}
+
+    async def on_translated(language, content):
+        saved[language] = content
+
+    service = make_service(DownForBackend(["ลาว"]))
+    outcomes = asyncio.run(service.translate_srt_multi(srt_path, targets, on_translated))
+    assert outcomes["english"]["error"] is None
+    assert outcomes["lao"]["error"]
+    assert list(saved) == ["english"]
+
+    service = make_service(DownForBackend(["ลาว", "อังกฤษ"]))
+    with pytest.raises(Exception, match="การแปลล้มเหลว"):
+        asyncio.run(service.translate_srt_multi(srt_path, targets, on_translated))
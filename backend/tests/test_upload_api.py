@@ -0,0 +1,42 @@
+import sys
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setenv("ASR_BACKEND", "local")
+    monkeypatch.setenv("TRANSLATION_BACKEND", "local")
+    sys.modules.pop("main", None)
+    main = importlib.import_module("main")
+    yield main
+    sys.modules.pop("main", None)
+
+
+def leftover_parts(upload_dir):
+    return list(upload_dir.glob("*.part"))
+
+
+def test_rejected_upload_leaves_no_part_file(main, tmp_path):
+    client = TestClient(main.app)
+    response = client.post("/upload-video", files={"file": ("clip.mp4", b"not a video", "video/mp4")})
+    assert response.status_code == 400
+    assert leftover_parts(tmp_path) == []
+
+
+def test_failed_store_leaves_no_part_file(main, tmp_path, monkeypatch):
+    async def no_probe(part_path, content_hash):
+        return None
+
+    def broken_add(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main.upload_service, "probe_upload", no_probe)
+    monkeypatch.setattr(main.content_store, "add", broken_add)
+    client = TestClient(main.app)
+    response = client.post("/upload-video", files={"file": ("clip.mp4", b"video bytes", "video/mp4")})
+    assert response.status_code == 500
+    assert leftover_parts(tmp_path) == []
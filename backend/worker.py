@@ -0,0 +1,201 @@
+"""Background job worker.
+
+Claims transcribe / translate / embed jobs from the SQLite queue in
+UPLOAD_DIR/jobs.sqlite3 and runs them through the same pipeline the API
+used to run inline. Several workers (on this machine or on others sharing
+UPLOAD_DIR) can run at once; a job whose worker dies is picked up again
+once its lease expires. Only transient failures (API connection errors,
+rate limits and 5xx responses, timeouts, ffmpeg killed by a signal) are
+retried; anything else - a missing SRT or upload, invalid options, a file
+ffmpeg rejects - fails the job straight away.
+
+    python worker.py                           # all job types, WORKER_PROCESSES processes
+    python worker.py --types embed --processes 1
+
+Settings (env): JOB_LEASE_SECONDS (60), JOB_POLL_INTERVAL (1.0),
+JOB_MAX_ATTEMPTS (3), JOB_RETRY_BACKOFF (10), WORKER_PROCESSES (2),
+JOB_PROGRESS_INTERVAL (1.0), FFMPEG_SLOW_SPEED (0.5). Unless
+ENCODE_CPU_COUNT is set, the cores are divided evenly between the
+processes so their encode budgets (see EncodeScheduler) do not overlap.
+"""
+import os
+import uuid
+import signal
+import socket
+import asyncio
+import time
+import argparse
+import traceback
+import subprocess
+import multiprocessing
+from pathlib import Path
+from typing import List
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+
+from services.job_queue import JOB_TYPES, create_job_queue
+from services.pipeline import Pipeline
+from services.ai_backends import close_http_client
+
+
+def _retryable(error: BaseException) -> bool:
+    """True if any error in the chain is transient.
+
+    The services re-raise as ``Exception`` with a Thai message, so the
+    original error is found on ``__cause__`` / ``__context__``.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (openai.APIConnectionError, httpx.TransportError, ConnectionError,
+                              TimeoutError, asyncio.TimeoutError, subprocess.TimeoutExpired)):
+            return True
+        if isinstance(error, openai.APIStatusError) and (
+                error.status_code in (408, 409, 429) or error.status_code >= 500):
+            return True
+        # A negative return code means ffmpeg was killed by a signal, not that it rejected the input
+        if isinstance(error, subprocess.CalledProcessError) and error.returncode < 0:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+async def _keep_lease(queue, job_id: str, worker_id: str, lease_seconds: float):
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id, lease_seconds):
+            print(f"[{worker_id}] lost lease on job {job_id}")
+            return
+
+
+async def _report_stats(queue, pipeline, worker_id: str, interval: float = 5.0):
+    while True:
+        await asyncio.to_thread(queue.report_worker, worker_id, pipeline.video_processor.scheduler.stats())
+        await asyncio.sleep(interval)
+
+
+def _progress_reporter(queue, job: dict, worker_id: str):
+    """ffmpeg progress callback that stores at most one report per JOB_PROGRESS_INTERVAL"""
+    interval = float(os.getenv("JOB_PROGRESS_INTERVAL", "1.0"))
+    slow_speed = float(os.getenv("FFMPEG_SLOW_SPEED", "0.5"))
+    last_report = 0.0
+    warned = False
+
+    def report(progress):
+        nonlocal last_report, warned
+        now = time.monotonic()
+        if not progress.done and now - last_report < interval:
+            return
+        last_report = now
+        queue.set_progress(job["id"], worker_id, progress.to_dict())
+        # Ignore the first seconds while the encoder warms up
+        if not warned and progress.elapsed > 10 and 0 < progress.speed < slow_speed:
+            warned = True
+            print(f"[{worker_id}] slow encode for job {job['id']}: {progress.speed}x, {progress.fps} fps")
+
+    return report
+
+
+async def run_worker(job_types: List[str], stop: asyncio.Event):
+    upload_dir = Path(os.getenv("UPLOAD_DIR", "uploads"))
+    upload_dir.mkdir(exist_ok=True)
+    lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+    poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+    queue = create_job_queue(upload_dir)
+    pipeline = Pipeline(upload_dir)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    print(f"[{worker_id}] waiting for {', '.join(job_types)} jobs")
+    reporter = asyncio.create_task(_report_stats(queue, pipeline, worker_id))
+
+    try:
+        while not stop.is_set():
+            job = await asyncio.to_thread(queue.claim, worker_id, job_types, lease_seconds)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            print(f"[{worker_id}] running {job['type']} job {job['id']} (attempt {job['attempts']})")
+            lease = asyncio.create_task(_keep_lease(queue, job["id"], worker_id, lease_seconds))
+            try:
+                result = await pipeline.run_job(
+                    job["type"],
+                    job["payload"],
+                    on_progress=_progress_reporter(queue, job, worker_id)
+                )
+            except Exception as e:
+                traceback.print_exc()
+                await asyncio.to_thread(
+                    queue.fail, job["id"], worker_id, str(e) or type(e).__name__, _retryable(e)
+                )
+            else:
+                await asyncio.to_thread(queue.complete, job["id"], worker_id, jsonable_encoder(result))
+            finally:
+                lease.cancel()
+    finally:
+        reporter.cancel()
+        await close_http_client()
+
+
+def _worker_main(job_types: List[str]):
+    load_dotenv()
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # Finish the current job, then exit
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await run_worker(job_types, stop)
+
+    asyncio.run(main())
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run background subtitle jobs")
+    parser.add_argument("--types", default=",".join(JOB_TYPES),
+                        help="comma-separated job types to run (default: all)")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "2")),
+                        help="number of worker processes")
+    args = parser.parse_args()
+
+    job_types = [job_type.strip() for job_type in args.types.split(",") if job_type.strip()]
+    unknown = set(job_types) - set(JOB_TYPES)
+    if unknown:
+        parser.error(f"unknown job types: {', '.join(sorted(unknown))}")
+
+    if not os.getenv("ENCODE_CPU_COUNT"):
+        os.environ["ENCODE_CPU_COUNT"] = str(max(1, (os.cpu_count() or 2) // max(1, args.processes)))
+
+    if args.processes <= 1:
+        _worker_main(job_types)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(job_types,), daemon=False)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    # Children get Ctrl+C from the terminal themselves
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
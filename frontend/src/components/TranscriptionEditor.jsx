@@ -1,12 +1,17 @@
 import React, { useState, useEffect } from 'react'
 import { Download, Play, Edit3, Save, AlertCircle } from 'lucide-react'
 import axios from 'axios'
+import { waitForJob, streamTranscription } from '../jobs'
 
 const TranscriptionEditor = ({ fileData, onTranscriptionComplete }) => {
   const [transcribing, setTranscribing] = useState(false)
   const [transcription, setTranscription] = useState(null)
   const [editableText, setEditableText] = useState('')
+  const [segmentTexts, setSegmentTexts] = useState([])
+  const [version, setVersion] = useState(null)
   const [isEditing, setIsEditing] = useState(false)
+  const [saving, setSaving] = useState(false)
+  const [saveStatus, setSaveStatus] = useState(null)
   const [error, setError] = useState(null)
 
   useEffect(() => {
@@ -16,14 +21,36 @@ const TranscriptionEditor = ({ fileData, onTranscriptionComplete }) => {
   const startTranscription = async () => {
     setTranscribing(true)
     setError(null)
+    setTranscription(null)
+    setSegmentTexts([])
 
     try {
-      const response = await axios.post(`/api/transcribe/${fileData.file_id}`)
-      setTranscription(response.data)
-      setEditableText(response.data.transcription.text)
-      onTranscriptionComplete(response.data)
+      const { data: job } = await axios.post(`/api/transcribe/${fileData.file_id}`)
+      // Segments show up (and can be edited) as each audio chunk finishes
+      await streamTranscription(fileData.file_id, job.job_id, {
+        onSegments: (startIndex, segments) => {
+          setTranscription(prev => {
+            const merged = [...(prev?.transcription.segments || []).slice(0, startIndex), ...segments]
+            return { transcription: { segments: merged, text: merged.map(segment => segment.text).join(' ') } }
+          })
+          setSegmentTexts(prev => [...prev.slice(0, startIndex), ...segments.map(segment => segment.text)])
+        },
+        onReset: () => {
+          setTranscription(null)
+          setSegmentTexts([])
+        }
+      })
+      const result = await waitForJob(job.job_id)
+      setTranscription(result)
+      setEditableText(result.transcription.text)
+      // Keep edits made while later segments were still arriving
+      setSegmentTexts(prev => result.transcription.segments.map((segment, index) => prev[index] ?? segment.text))
+      onTranscriptionComplete(result)
+      // Version the edits are made against
+      const { data: transcript } = await axios.get(`/api/transcript/${fileData.file_id}`)
+      setVersion(transcript.version)
     } catch (err) {
-      setError(err.response?.data?.detail || 'เกิดข้อผิดพลาดในการแกะเสียง')
+      setError(err.response?.data?.detail || err.detail || 'เกิดข้อผิดพลาดในการแกะเสียง')
     } finally {
       setTranscribing(false)
     }
@@ -37,21 +64,49 @@ const TranscriptionEditor = ({ fileData, onTranscriptionComplete }) => {
     window.open(`/api/download-srt/${fileData.file_id}/original`, '_blank')
   }
 
-  const handleSaveEdit = () => {
-    // Here you could implement saving the edited transcription
-    setIsEditing(false)
-    // Update the transcription data with edited text
-    const updatedTranscription = {
-      ...transcription,
-      transcription: {
-        ...transcription.transcription,
-        text: editableText
+  const handleSaveEdit = async () => {
+    const segments = transcription.transcription.segments
+    // Only the segments that changed are sent; translations are updated for those alone
+    const edits = segments
+      .map((segment, index) => ({ op: 'update', index, text: segmentTexts[index].trim() }))
+      .filter(edit => edit.text && edit.text !== segments[edit.index].text)
+    if (edits.length === 0) {
+      setIsEditing(false)
+      return
+    }
+
+    setSaving(true)
+    setSaveStatus(null)
+    try {
+      const { data } = await axios.patch(`/api/transcript/${fileData.file_id}`, {
+        base_version: version,
+        edits
+      })
+      const updatedSegments = segments.map((segment, index) => ({ ...segment, text: segmentTexts[index].trim() || segment.text }))
+      const text = updatedSegments.map(segment => segment.text).join(' ')
+      setTranscription({
+        ...transcription,
+        transcription: { ...transcription.transcription, segments: updatedSegments, text }
+      })
+      setEditableText(text)
+      setVersion(data.version)
+      setIsEditing(false)
+      setSaveStatus(`บันทึกเวอร์ชัน ${data.version} แล้ว (แก้ไข ${data.changed_segments.length} segment)`)
+
+      if (data.job_id) {
+        setSaveStatus(`บันทึกเวอร์ชัน ${data.version} แล้ว กำลังแปลใหม่เฉพาะ segment ที่แก้ไข...`)
+        const result = await waitForJob(data.job_id)
+        setSaveStatus(`บันทึกเวอร์ชัน ${data.version} แล้ว · ${result.message}`)
       }
+    } catch (err) {
+      const detail = err.response?.data?.detail || err.detail
+      setSaveStatus(detail?.message || detail || 'บันทึกการแก้ไขไม่สำเร็จ')
+    } finally {
+      setSaving(false)
     }
-    setTranscription(updatedTranscription)
   }
 
-  if (transcribing) {
+  if (transcribing && !transcription) {
     return (
       <div className="card text-center">
         <div className="animate-spin rounded-full h-12 w-12 border-b-2 border-primary-600 mx-auto mb-4"></div>
@@ -94,13 +149,15 @@ const TranscriptionEditor = ({ fileData, onTranscriptionComplete }) => {
             <Download className="h-4 w-4" />
             <span>ดาวน์โหลด MP3</span>
           </button>
-          <button
-            onClick={downloadSrt}
-            className="btn-secondary flex items-center space-x-2"
-          >
-            <Download className="h-4 w-4" />
-            <span>ดาวน์โหลด SRT (ต้นฉบับ)</span>
-          </button>
+          {!transcribing && (
+            <button
+              onClick={downloadSrt}
+              className="btn-secondary flex items-center space-x-2"
+            >
+              <Download className="h-4 w-4" />
+              <span>ดาวน์โหลด SRT (ต้นฉบับ)</span>
+            </button>
+          )}
         </div>
       </div>
 
@@ -112,14 +169,18 @@ const TranscriptionEditor = ({ fileData, onTranscriptionComplete }) => {
             {isEditing ? (
               <button
                 onClick={handleSaveEdit}
-                className="btn-primary flex items-center space-x-2"
+                disabled={saving || transcribing}
+                className={`btn-primary flex items-center space-x-2 ${(saving || transcribing) ? 'opacity-50 cursor-not-allowed' : ''}`}
               >
                 <Save className="h-4 w-4" />
-                <span>บันทึก</span>
+                <span>{saving ? 'กำลังบันทึก...' : 'บันทึก'}</span>
               </button>
             ) : (
               <button
-                onClick={() => setIsEditing(true)}
+                onClick={() => {
+                  setSegmentTexts(prev => transcription.transcription.segments.map((segment, index) => prev[index] ?? segment.text))
+                  setIsEditing(true)
+                }}
                 className="btn-secondary flex items-center space-x-2"
               >
                 <Edit3 className="h-4 w-4" />
@@ -129,17 +190,41 @@ const TranscriptionEditor = ({ fileData, onTranscriptionComplete }) => {
           </div>
         </div>
 
+        {transcribing && (
+          <div className="flex items-center space-x-2 text-sm text-primary-700 mb-3">
+            <div className="animate-spin rounded-full h-4 w-4 border-b-2 border-primary-600"></div>
+            <span>
+              กำลังแกะเสียง... ได้แล้ว {transcription.transcription.segments.length} segments
+              (แก้ไขได้เลย บันทึกได้เมื่อแกะเสียงเสร็จ)
+            </span>
+          </div>
+        )}
+
+        {saveStatus && (
+          <p className="text-sm text-gray-600 mb-3">{saveStatus}</p>
+        )}
+
         {isEditing ? (
-          <textarea
-            value={editableText}
-            onChange={(e) => setEditableText(e.target.value)}
-            className="w-full h-64 p-4 border border-gray-300 rounded-lg resize-none focus:ring-2 focus:ring-primary-500 focus:border-transparent"
-            placeholder="แก้ไขข้อความที่นี่..."
-          />
+          <div className="max-h-96 overflow-y-auto space-y-2">
+            {transcription.transcription.segments.map((segment, index) => (
+              <div key={index} className="text-sm">
+                <div className="text-gray-500 text-xs mb-1">
+                  #{index + 1} · {Math.floor(segment.start / 60)}:{String(Math.floor(segment.start % 60)).padStart(2, '0')} - {Math.floor(segment.end / 60)}:{String(Math.floor(segment.end % 60)).padStart(2, '0')}
+                </div>
+                <textarea
+                  value={segmentTexts[index] ?? ''}
+                  onChange={(e) => setSegmentTexts(prev => prev.map((text, i) => i === index ? e.target.value : text))}
+                  rows={2}
+                  className="w-full p-2 border border-gray-300 rounded-lg resize-none focus:ring-2 focus:ring-primary-500 focus:border-transparent"
+                  placeholder="แก้ไขข้อความที่นี่..."
+                />
+              </div>
+            ))}
+          </div>
         ) : (
           <div className="bg-gray-50 p-4 rounded-lg">
             <p className="whitespace-pre-wrap text-gray-800 leading-relaxed">
-              {editableText}
+              {transcribing ? transcription.transcription.text : editableText}
             </p>
           </div>
         )}
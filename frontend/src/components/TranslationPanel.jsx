@@ -1,6 +1,7 @@
 import { useState } from 'react'
 import { Download, Languages, AlertCircle, Loader, CheckCircle2 } from 'lucide-react'
 import axios from 'axios'
+import { waitForJob } from '../jobs'
 import VideoEmbedder from './VideoEmbedder'
 
 const TranslationPanel = ({ fileData }) => {
@@ -33,23 +34,61 @@ const TranslationPanel = ({ fileData }) => {
     setError(null)
 
     try {
-      const response = await axios.post('/api/translate', {
+      const { data: job } = await axios.post('/api/translate', {
         file_id: fileData.file_id,
         target_language: languageCode,
         style_prompt: stylePrompts[languageCode] || null
       })
+      const result = await waitForJob(job.job_id)
 
       setTranslations(prev => ({
         ...prev,
-        [languageCode]: response.data
+        [languageCode]: result
       }))
     } catch (err) {
-      setError(err.response?.data?.detail || `เกิดข้อผิดพลาดในการแปลเป็น${languageCode}`)
+      setError(err.response?.data?.detail || err.detail || `เกิดข้อผิดพลาดในการแปลเป็น${languageCode}`)
     } finally {
       setTranslating(prev => ({ ...prev, [languageCode]: false }))
     }
   }
 
+  const translateSelectedLanguages = async () => {
+    const pending = selectedLanguages.filter(code => !translations[code] && !translating[code])
+    if (pending.length === 0) return
+
+    setTranslating(prev => ({ ...prev, ...Object.fromEntries(pending.map(code => [code, true])) }))
+    setError(null)
+
+    try {
+      const { data: job } = await axios.post('/api/translate-multi', {
+        file_id: fileData.file_id,
+        targets: pending.map(code => ({
+          target_language: code,
+          style_prompt: stylePrompts[code] || null
+        }))
+      })
+      const { results } = await waitForJob(job.job_id)
+
+      const succeeded = results.filter(result => !result.error)
+      const failed = results.filter(result => result.error)
+
+      setTranslations(prev => ({
+        ...prev,
+        ...Object.fromEntries(succeeded.map(result => [result.target_language, result]))
+      }))
+      if (failed.length > 0) {
+        setError(failed.map(result => `${result.target_language}: ${result.error}`).join(', '))
+      }
+    } catch (err) {
+      setError(err.response?.data?.detail || err.detail || 'เกิดข้อผิดพลาดในการแปล')
+    } finally {
+      setTranslating(prev => ({ ...prev, ...Object.fromEntries(pending.map(code => [code, false])) }))
+    }
+  }
+
+  const pendingLanguages = selectedLanguages.filter(code => !translations[code])
+  const isTranslatingAny = Object.values(translating).some(Boolean)
+
   const downloadTranslatedSrt = (languageCode) => {
     window.open(`/api/download-srt/${fileData.file_id}/${languageCode}`, '_blank')
   }
@@ -120,6 +159,28 @@ const TranslationPanel = ({ fileData }) => {
             )
           })}
         </div>
+
+        {pendingLanguages.length > 1 && (
+          <button
+            onClick={translateSelectedLanguages}
+            disabled={isTranslatingAny}
+            className={`btn-primary flex items-center space-x-2 mt-4 ${
+              isTranslatingAny ? 'opacity-50 cursor-not-allowed' : ''
+            }`}
+          >
+            {isTranslatingAny ? (
+              <>
+                <Loader className="h-4 w-4 animate-spin" />
+                <span>กำลังแปล...</span>
+              </>
+            ) : (
+              <>
+                <Languages className="h-4 w-4" />
+                <span>แปลทุกภาษาที่เลือก ({pendingLanguages.length} ภาษา)</span>
+              </>
+            )}
+          </button>
+        )}
       </div>
 
       {/* Selected Languages Detail */}
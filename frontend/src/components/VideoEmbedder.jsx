@@ -1,51 +1,52 @@
 import React, { useState } from 'react'
 import { Download, Video, Loader, AlertCircle, CheckCircle } from 'lucide-react'
 import axios from 'axios'
+import { watchJob } from '../jobs'
 
 const VideoEmbedder = ({ fileData, availableLanguages }) => {
   const [embedding, setEmbedding] = useState({})
   const [embedded, setEmbedded] = useState({})
   const [error, setError] = useState(null)
   const [progress, setProgress] = useState({})
+  const [encodeStats, setEncodeStats] = useState({})
 
-  const embedSubtitles = async (language, type = 'hard') => {
-    const key = `${language}_${type}`
+  const embedSubtitles = async (language, type = 'hard', container = 'mp4') => {
+    const key = container === 'mp4' ? `${language}_${type}` : `${language}_${type}_${container}`
     setEmbedding(prev => ({ ...prev, [key]: true }))
     setError(null)
     setProgress(prev => ({ ...prev, [key]: 0 }))
 
     try {
-      // Simulate progress for user feedback
-      const progressInterval = setInterval(() => {
-        setProgress(prev => ({
-          ...prev,
-          [key]: Math.min((prev[key] || 0) + Math.random() * 15, 90)
-        }))
-      }, 1000)
-
-      const response = await axios.post('/api/embed-subtitles', {
+      const { data: job } = await axios.post('/api/embed-subtitles', {
         file_id: fileData.file_id,
         language: language,
-        type: type
-      }, {
-        timeout: 600000 // 10 minute timeout
+        type: type,
+        container: container
       })
 
-      clearInterval(progressInterval)
+      // Real ffmpeg progress streamed from the worker
+      const result = await watchJob(fileData.file_id, job.job_id, {
+        onUpdate: ({ progress: report }) => {
+          if (!report) return
+          setProgress(prev => ({ ...prev, [key]: report.percent ?? prev[key] ?? 0 }))
+          setEncodeStats(prev => ({ ...prev, [key]: report }))
+        }
+      })
       setProgress(prev => ({ ...prev, [key]: 100 }))
-      setEmbedded(prev => ({ ...prev, [key]: response.data }))
+      setEmbedded(prev => ({ ...prev, [key]: result }))
     } catch (err) {
-      setError(err.response?.data?.detail || `เกิดข้อผิดพลาดในการฝัง ${type} subtitle ${language}`)
+      setError(err.response?.data?.detail || err.detail || `เกิดข้อผิดพลาดในการฝัง ${type} subtitle ${language}`)
     } finally {
       setEmbedding(prev => ({ ...prev, [key]: false }))
       setTimeout(() => {
         setProgress(prev => ({ ...prev, [key]: 0 }))
+        setEncodeStats(prev => ({ ...prev, [key]: null }))
       }, 2000)
     }
   }
 
-  const downloadEmbeddedVideo = (language, type = 'hard') => {
-    window.open(`/api/download-video/${fileData.file_id}/${language}/${type}`, '_blank')
+  const downloadEmbeddedVideo = (language, type = 'hard', container = 'mp4') => {
+    window.open(`/api/download-video/${fileData.file_id}/${language}/${type}?container=${container}`, '_blank')
   }
 
   const languages = [
@@ -140,6 +141,11 @@ const VideoEmbedder = ({ fileData, availableLanguages }) => {
                       ></div>
                     </div>
                   )}
+                  {isEmbeddingHard && encodeStats[hardKey] && (
+                    <p className="text-xs text-gray-500 text-center">
+                      {encodeStats[hardKey].frame} frames · {encodeStats[hardKey].fps} fps · {encodeStats[hardKey].speed}x
+                    </p>
+                  )}
 
                   {hasEmbeddedHard && (
                     <button
@@ -167,7 +173,7 @@ const VideoEmbedder = ({ fileData, availableLanguages }) => {
                     {isEmbeddingSoft ? (
                       <>
                         <Loader className="h-4 w-4 animate-spin" />
-                        <span>กำลังฝัง...</span>
+                        <span>กำลังฝัง... {Math.round(progress[softKey] || 0)}%</span>
                       </>
                     ) : hasEmbeddedSoft ? (
                       <>
@@ -212,12 +218,70 @@ const VideoEmbedder = ({ fileData, availableLanguages }) => {
         })}
       </div>
 
+      {/* All languages as soft subtitle tracks in one file */}
+      <div className="card">
+        <div className="flex items-center space-x-3 mb-2">
+          <span className="text-2xl">🌐</span>
+          <h4 className="text-lg font-semibold">Soft Subtitle ทุกภาษาในไฟล์เดียว</h4>
+        </div>
+        <p className="text-sm text-gray-600 mb-4">
+          {availableLangs.map(lang => lang.name).join(', ')} · เลือกภาษาได้ใน player
+        </p>
+        <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
+          {['mp4', 'mkv'].map((container) => {
+            const key = container === 'mp4' ? 'all_soft' : `all_soft_${container}`
+            const isEmbedding = embedding[key]
+            const hasEmbedded = embedded[key]
+
+            return (
+              <div key={container} className="flex flex-col space-y-2">
+                <button
+                  onClick={() => embedSubtitles('all', 'soft', container)}
+                  disabled={isEmbedding || hasEmbedded}
+                  className={`btn-secondary flex items-center justify-center space-x-2 text-sm ${
+                    (isEmbedding || hasEmbedded) ? 'opacity-50 cursor-not-allowed' : ''
+                  }`}
+                >
+                  {isEmbedding ? (
+                    <>
+                      <Loader className="h-4 w-4 animate-spin" />
+                      <span>กำลังฝัง... {Math.round(progress[key] || 0)}%</span>
+                    </>
+                  ) : hasEmbedded ? (
+                    <>
+                      <CheckCircle className="h-4 w-4" />
+                      <span>ฝังแล้ว ({container.toUpperCase()})</span>
+                    </>
+                  ) : (
+                    <>
+                      <Video className="h-4 w-4" />
+                      <span>ฝังทุกภาษา ({container.toUpperCase()})</span>
+                    </>
+                  )}
+                </button>
+
+                {hasEmbedded && (
+                  <button
+                    onClick={() => downloadEmbeddedVideo('all', 'soft', container)}
+                    className="btn-secondary flex items-center justify-center space-x-2 text-sm"
+                  >
+                    <Download className="h-4 w-4" />
+                    <span>ดาวน์โหลด {container.toUpperCase()}</span>
+                  </button>
+                )}
+              </div>
+            )
+          })}
+        </div>
+      </div>
+
       {/* Info */}
       <div className="card bg-blue-50 border-blue-200">
         <h4 className="font-semibold text-blue-900 mb-2">ข้อมูล</h4>
         <div className="text-blue-800 text-sm space-y-1">
           <p>• <strong>Hard Subtitle:</strong> เผา subtitle ลงในวิดีโอ ไม่สามารถปิดได้</p>
           <p>• <strong>Soft Subtitle:</strong> ฝัง subtitle เป็นไฟล์แยก สามารถเปิด/ปิดได้</p>
+          <p>• <strong>ทุกภาษา:</strong> ทุกภาษาเป็นคนละ track ในไฟล์เดียว (MP4 หรือ MKV) ไม่ต้อง encode ใหม่</p>
           <p>• การฝัง subtitle ใช้เวลา 1-5 นาที ขึ้นอยู่กับความยาววิดีโอ</p>
           <p>• ใช้ ffmpeg preset ultrafast เพื่อความเร็วสูงสุด</p>
           <p>• Hard subtitle ได้รับการปรับแต่งสำหรับภาษาไทย</p>
@@ -3,6 +3,9 @@ import { useDropzone } from 'react-dropzone'
 import { FileVideo, AlertCircle } from 'lucide-react'
 import axios from 'axios'
 
+const CHUNK_SIZE = 8 * 1024 * 1024 // 8 MB per request
+const MAX_CHUNK_RETRIES = 5
+
 const VideoUploader = ({ onVideoUploaded }) => {
   const [uploading, setUploading] = useState(false)
   const [error, setError] = useState(null)
@@ -15,23 +18,38 @@ const VideoUploader = ({ onVideoUploaded }) => {
     setError(null)
 
     try {
-      const formData = new FormData()
-      formData.append('file', file)
+      // Start a resumable upload session
+      const { data: session } = await axios.post('/api/upload-video/init', {
+        filename: file.name,
+        total_size: file.size
+      })
+      const uploadId = session.upload_id
 
-      // Upload video
-      const response = await axios.post('/api/upload-video', formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
-        onUploadProgress: (progressEvent) => {
-          const percentCompleted = Math.round(
-            (progressEvent.loaded * 100) / progressEvent.total
+      let offset = session.offset
+      let retries = 0
+      while (offset < file.size) {
+        const chunk = file.slice(offset, offset + CHUNK_SIZE)
+        try {
+          const response = await axios.put(
+            `/api/upload-video/${uploadId}/chunk?offset=${offset}`,
+            chunk,
+            { headers: { 'Content-Type': 'application/octet-stream' } }
           )
-          console.log(`Upload Progress: ${percentCompleted}%`)
-        },
-      })
+          offset = response.data.offset
+          retries = 0
+        } catch (chunkErr) {
+          if (retries >= MAX_CHUNK_RETRIES) throw chunkErr
+          retries += 1
+          // Ask the server how far it got and resume from there
+          const { data: status } = await axios.get(`/api/upload-video/${uploadId}`)
+          offset = status.offset
+        }
+        const percentCompleted = Math.round((offset * 100) / file.size)
+        console.log(`Upload Progress: ${percentCompleted}%`)
+      }
 
-      // MP3 conversion is already complete when we get the response
+      // MP3 conversion is complete when finalize returns
+      const response = await axios.post(`/api/upload-video/${uploadId}/finalize`)
       onVideoUploaded(response.data)
 
     } catch (err) {
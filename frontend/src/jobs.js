@@ -0,0 +1,76 @@
+import axios from 'axios'
+
+const POLL_INTERVAL = 1500
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms))
+
+// Poll a background job until it finishes; resolves with its result
+export const waitForJob = async (jobId, { interval = POLL_INTERVAL, onUpdate } = {}) => {
+  while (true) {
+    const { data: job } = await axios.get(`/api/jobs/${jobId}`)
+    onUpdate?.(job)
+
+    if (job.status === 'succeeded') return job.result
+    if (job.status === 'failed') {
+      const error = new Error(job.error || 'งานล้มเหลว')
+      error.detail = job.error
+      throw error
+    }
+    await sleep(interval)
+  }
+}
+
+// Follow a job through the per-file progress stream (Server-Sent Events);
+// onUpdate receives the job, including ffmpeg progress while it runs
+export const watchJob = (fileId, jobId, { onUpdate } = {}) => new Promise((resolve, reject) => {
+  const source = new EventSource(`/api/progress/${fileId}`)
+
+  source.addEventListener('job', (event) => {
+    const job = JSON.parse(event.data)
+    if (job.id !== jobId) return
+    onUpdate?.(job)
+
+    if (job.status === 'succeeded') {
+      source.close()
+      resolve(job.result)
+    } else if (job.status === 'failed') {
+      source.close()
+      const error = new Error(job.error || 'งานล้มเหลว')
+      error.detail = job.error
+      reject(error)
+    }
+  })
+})
+
+// Follow a transcription as it runs: onSegments(startIndex, segments) gets
+// each batch of finished segments (absolute timestamps). Resolves when the
+// SRT is complete; if the stream drops, resolves early and the caller falls
+// back to waitForJob.
+export const streamTranscription = (fileId, jobId, { onSegments, onReset } = {}) => new Promise((resolve, reject) => {
+  const source = new EventSource(`/api/transcribe/${fileId}/stream?job_id=${jobId}`)
+
+  // The job was retried: segments of the failed attempt are stale
+  source.addEventListener('reset', () => {
+    onReset?.()
+  })
+
+  source.addEventListener('segments', (event) => {
+    const { start_index: startIndex, segments } = JSON.parse(event.data)
+    onSegments?.(startIndex, segments)
+  })
+  source.addEventListener('done', () => {
+    source.close()
+    resolve()
+  })
+  source.addEventListener('error', (event) => {
+    source.close()
+    if (event.data) {
+      const { message } = JSON.parse(event.data)
+      const error = new Error(message || 'งานล้มเหลว')
+      error.detail = message
+      reject(error)
+    } else {
+      resolve()
+    }
+  })
+})
@@ -19,6 +19,12 @@ if [ ! -f "../.env" ]; then
     exit 1
 fi
 
+# Start the background job workers, stopped together with the server
+echo "⚙️  Starting background job workers"
+python worker.py &
+WORKER_PID=$!
+trap 'kill $WORKER_PID 2>/dev/null' EXIT
+
 # Start the server
 echo "🔧 Starting FastAPI server on http://localhost:8000"
 python main.py
\ No newline at end of file
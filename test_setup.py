@@ -5,6 +5,7 @@ Simple test script to verify the setup
 
 import sys
 import os
+import shutil
 from pathlib import Path
 
 def test_python_imports():
@@ -25,13 +26,23 @@ def test_python_imports():
         print("❌ OpenAI not found")
         return False
     
-    try:
-        import moviepy
-        print("✅ MoviePy imported successfully")
-    except ImportError:
-        print("❌ MoviePy not found")
+    return True
+
+def test_ffmpeg():
+    """Test if ffmpeg (and optionally ffprobe) is on PATH"""
+    print("\n🎬 Testing ffmpeg...")
+    
+    if shutil.which("ffmpeg"):
+        print("✅ ffmpeg found")
+    else:
+        print("❌ ffmpeg not found")
         return False
     
+    if shutil.which("ffprobe"):
+        print("✅ ffprobe found")
+    else:
+        print("⚠️  ffprobe not found (media info is read from ffmpeg instead)")
+    
     return True
 
 def test_env_file():
@@ -86,6 +97,7 @@ def main():
     tests = [
         ("Directory Structure", test_directory_structure),
         ("Python Imports", test_python_imports),
+        ("ffmpeg", test_ffmpeg),
         ("Environment File", test_env_file)
     ]
     